@@ -0,0 +1,117 @@
+import hashlib
+import threading
+from itertools import chain
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+# Tables whose rows feed the public activity listing.
+TRACKED_TABLES = {"activities", "activity_groups", "registrations"}
+_DIRTY_KEY = "activity_data_changed"
+
+
+class DataVersion:
+    """Process-wide counter bumped after every commit that touches ``TRACKED_TABLES``."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def bump(self, notify: bool = True) -> int:
+        """Advance the version; ``notify=False`` for changes relayed from another worker."""
+        with self._lock:
+            self._value += 1
+            value = self._value
+        if notify:
+            for listener in list(self._listeners):
+                listener()
+        return value
+
+    def add_listener(self, listener: Callable[[], None]):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+
+data_version = DataVersion()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if getattr(obj, "__tablename__", None) in TRACKED_TABLES:
+            session.info[_DIRTY_KEY] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_statements(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.local_table.name in TRACKED_TABLES:
+        orm_execute_state.session.info[_DIRTY_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    if session.info.pop(_DIRTY_KEY, False):
+        data_version.bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
+
+
+class SnapshotCache:
+    """Holds one pre-encoded response body per data version.
+
+    Repeat requests cost an attribute read; a new version is built by exactly
+    one thread while concurrent callers wait for it instead of querying too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Tuple[int, bytes, str]] = None
+
+    def get(self, build: Callable[[], bytes]) -> Tuple[bytes, str]:
+        snapshot = self._snapshot
+        if snapshot and snapshot[0] == data_version.value:
+            return snapshot[1], snapshot[2]
+
+        with self._lock:
+            # Read the version before building: a commit racing with the build
+            # leaves the snapshot stale-tagged, so the next request rebuilds.
+            version = data_version.value
+            snapshot = self._snapshot
+            if snapshot and snapshot[0] == version:
+                return snapshot[1], snapshot[2]
+
+            body = build()
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            self._snapshot = (version, body, etag)
+            return body, etag
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+activity_snapshots = SnapshotCache()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from .activity_cache import data_version
+from .student_index import roster_version
+
+# Which bus relays broadcasts between worker processes:
+#   local   single worker; events go straight to this process's sockets
+#   sqlite  several workers on one host; events are appended to a shared
+#           SQLite file that every worker polls
+BROADCAST_BACKEND = os.getenv("WS_BROADCAST_BACKEND", "local")
+BUS_PATH = os.getenv("WS_BUS_PATH", "./sicday-bus.db")
+BUS_POLL_SECONDS = int(os.getenv("WS_BUS_POLL_MS", "50")) / 1000
+BUS_RETENTION_SECONDS = 300
+PRUNE_EVERY_POLLS = 200
+
+# Bus-only topics: another worker committed a change to the activity tables,
+# or to the student roster
+DATA_CHANGED_TOPIC = "data"
+ROSTER_CHANGED_TOPIC = "roster"
+
+Handler = Callable[[str, Any], Awaitable[None]]
+
+
+class LocalBus:
+    """Delivers every event straight back to this process."""
+
+    name = "local"
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        self.relayed = 0
+
+    def attach(self, handler: Handler):
+        self._handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, topic: str, data: Any = None):
+        await self._handler(topic, data)
+
+
+class SQLiteBus:
+    """Relays events between worker processes through a shared SQLite file.
+
+    ``publish`` delivers to this worker at once and appends a row for the
+    others. Each worker polls for rows past its cursor and skips its own, so
+    every event reaches every worker exactly once. ``AUTOINCREMENT`` ids are
+    assigned under SQLite's single write lock, so they never go backwards and
+    a poll cannot skip a row that commits later.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = BUS_PATH, poll_interval: float = BUS_POLL_SECONDS):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex
+        self.relayed = 0
+        self._handler: Optional[Handler] = None
+        self._cursor = 0
+        self._polls = 0
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def attach(self, handler: Handler):
+        self._handler = handler
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broadcast_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "origin TEXT NOT NULL, "
+                "topic TEXT NOT NULL, "
+                "payload TEXT, "
+                "created_at REAL NOT NULL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    async def start(self):
+        def last_id():
+            with self._lock:
+                row = self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM broadcast_events").fetchone()
+                return row[0]
+
+        # Only events published from now on; a new worker has nothing to replay
+        self._cursor = await asyncio.to_thread(last_id)
+        data_version.add_listener(self._relay_data_change)
+        roster_version.add_listener(self._relay_roster_change)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        data_version.remove_listener(self._relay_data_change)
+        roster_version.remove_listener(self._relay_roster_change)
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    async def publish(self, topic: str, data: Any = None):
+        await self._handler(topic, data)
+        await asyncio.to_thread(self._append, topic, data)
+
+    def _relay_data_change(self):
+        # Runs in the committing thread; other workers drop their cached snapshots
+        try:
+            self._append(DATA_CHANGED_TOPIC, None)
+        except sqlite3.Error as e:
+            logging.error(f"Error relaying data change: {e}")
+
+    def _relay_roster_change(self):
+        # Other workers reload their student search index
+        try:
+            self._append(ROSTER_CHANGED_TOPIC, None)
+        except sqlite3.Error as e:
+            logging.error(f"Error relaying roster change: {e}")
+
+    def _append(self, topic: str, data: Any):
+        payload = None if data is None else json.dumps(data)
+        with self._lock:
+            self._connect().execute(
+                "INSERT INTO broadcast_events (origin, topic, payload, created_at) VALUES (?, ?, ?, ?)",
+                (self.origin, topic, payload, time.time()),
+            )
+
+    def _fetch(self) -> List[Tuple[int, str, str, Optional[str]]]:
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(
+                "SELECT id, origin, topic, payload FROM broadcast_events WHERE id > ? ORDER BY id",
+                (self._cursor,),
+            ).fetchall()
+            self._polls += 1
+            if self._polls % PRUNE_EVERY_POLLS == 0:
+                connection.execute(
+                    "DELETE FROM broadcast_events WHERE created_at < ?",
+                    (time.time() - BUS_RETENTION_SECONDS,),
+                )
+            return rows
+
+    async def _poll(self):
+        while True:
+            try:
+                for event_id, origin, topic, payload in await asyncio.to_thread(self._fetch):
+                    self._cursor = event_id
+                    if origin == self.origin:
+                        continue
+                    self.relayed += 1
+                    if topic == DATA_CHANGED_TOPIC:
+                        data_version.bump(notify=False)
+                    elif topic == ROSTER_CHANGED_TOPIC:
+                        roster_version.bump(notify=False)
+                    else:
+                        await self._handler(topic, None if payload is None else json.loads(payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error polling broadcast bus: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+
+def create_bus():
+    if BROADCAST_BACKEND == "sqlite":
+        return SQLiteBus()
+    if BROADCAST_BACKEND != "local":
+        raise ValueError(f"Unknown WS_BROADCAST_BACKEND: {BROADCAST_BACKEND}")
+    return LocalBus()
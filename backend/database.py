@@ -1,14 +1,81 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import functools
+import logging
+import os
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+
+from . import metrics
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./sicday.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Applied to every new SQLite connection, in this order. WAL lets readers
+# keep reading while the single writer commits; NORMAL sync is durable
+# against application crashes and only risks the last commits on power loss.
+SQLITE_PRAGMAS: Dict[str, object] = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")),  # negative: KiB, not pages
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE_MB", "256")) * 1024 * 1024,
+    "foreign_keys": "ON" if os.getenv("SQLITE_FOREIGN_KEYS", "1") == "1" else "OFF",
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+# Retries for writes that still hit SQLITE_BUSY after busy_timeout
+SQLITE_BUSY_RETRIES = int(os.getenv("SQLITE_BUSY_RETRIES", "5"))
+SQLITE_BUSY_BACKOFF_SECONDS = int(os.getenv("SQLITE_BUSY_BACKOFF_MS", "25")) / 1000
+SQLITE_BUSY_BACKOFF_MAX_SECONDS = 1.0
+
+
+def create_sqlite_engine(url: str, pragmas: Optional[Dict[str, object]] = None, **kwargs) -> Engine:
+    """Create an engine for a SQLite ``url`` that sets ``pragmas`` (default
+    ``SQLITE_PRAGMAS``) on each connection it opens."""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    new_engine = create_engine(url, connect_args={"check_same_thread": False}, **kwargs)
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        for name, value in pragmas.items():
+            dbapi_connection.execute(f"PRAGMA {name}={value}")
+
+    return new_engine
+
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Request logs, rollups and system metrics live in their own database so that
+# logging never waits on (or holds) the write lock registrations need.
+TELEMETRY_DATABASE_URL = os.getenv("TELEMETRY_DATABASE_URL", "sqlite:///./telemetry.db")
+
+# auto_vacuum only takes effect for a new file; retention.py converts older ones
+telemetry_engine = create_sqlite_engine(
+    TELEMETRY_DATABASE_URL, {"auto_vacuum": "INCREMENTAL", **SQLITE_PRAGMAS}
+)
+TelemetrySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=telemetry_engine)
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        metrics.DB_CONNECTION_CHECKOUT.observe(time.perf_counter() - checked_out_at)
+
 Base = declarative_base()
+TelemetryBase = declarative_base()
 
 
 def get_db():
@@ -19,3 +86,71 @@ def get_db():
         db.close()
 
 
+def get_telemetry_db():
+    db = TelemetrySessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    orig = getattr(exc, "orig", exc)
+    if not isinstance(orig, sqlite3.OperationalError):
+        return False
+    code = getattr(orig, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF == sqlite3.SQLITE_BUSY
+    return "database is locked" in str(orig)
+
+
+def retry_on_busy(
+    retries: int = SQLITE_BUSY_RETRIES,
+    backoff: float = SQLITE_BUSY_BACKOFF_SECONDS,
+    max_backoff: float = SQLITE_BUSY_BACKOFF_MAX_SECONDS,
+):
+    """Re-run a write when SQLite reports the database as busy.
+
+    Waits a random time up to ``backoff * 2**attempt`` (capped at
+    ``max_backoff``) between attempts, so writers that collided do not retry
+    in lockstep. The decorated function must do all its writes inside
+    ``immediate_transaction``, which rolls the session back before the retry.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if attempt == retries or not is_busy_error(e):
+                        raise
+                    metrics.DB_BUSY_RETRIES.inc()
+                    delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+                    logging.warning(f"Database busy in {func.__name__}, retrying in {delay * 1000:.0f} ms")
+                    time.sleep(delay)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def immediate_transaction(db: Session):
+    """Run the block in a ``BEGIN IMMEDIATE`` transaction and commit it.
+
+    SQLite only takes the write lock on the first write of a deferred
+    transaction, so a count followed by an insert can interleave with other
+    writers. Taking the lock up front makes read-check-write sequences atomic
+    across threadpool workers; other writers wait on the busy timeout.
+    """
+    connection = db.connection()
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
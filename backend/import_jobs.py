@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import BinaryIO, Callable, Optional, Tuple
+
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, immediate_transaction, retry_on_busy
+from .roster_import import ROSTER_IMPORT_CHUNK, ImportCancelled, ImportResult, import_roster, read_roster_rows
+from .websocket_manager import manager
+
+# Uploaded rosters wait here until their job finishes, so a restart can resume them
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR", "./import_spool")
+IMPORT_POLL_SECONDS = int(os.getenv("IMPORT_POLL_MS", "2000")) / 1000
+# A running job whose progress has not moved for this long lost its worker
+IMPORT_STALE_SECONDS = int(os.getenv("IMPORT_STALE_SECONDS", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+# Rows and students from the uploaded file, and failures that may quote them.
+# The import:<id> WebSocket topic needs no login, so these are only returned
+# by the admin status endpoint.
+PRIVATE_FIELDS = ("errors", "samples", "error")
+
+
+class _Interrupted(Exception):
+    """The worker is shutting down; the job goes back to the queue where it stopped."""
+
+
+def job_state(job: models.ImportJob) -> dict:
+    """What the status endpoint returns and progress messages carry."""
+    return {
+        "id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "cancel_requested": job.cancel_requested,
+        "dry_run": job.dry_run,
+        "rows_processed": job.rows_processed,
+        "inserted": job.inserted,
+        "updated": job.updated,
+        "unchanged": job.unchanged,
+        "rejected": job.rejected,
+        "missing": job.missing,
+        "errors": json.loads(job.errors),
+        "samples": json.loads(job.samples),
+        "error": job.error,
+        "created_by": job.created_by,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class ImportWorker:
+    """Runs roster imports in the background, one job at a time per worker process.
+
+    ``submit`` spools the upload to disk and queues an ``import_jobs`` row.
+    The worker claims the oldest queued job and imports it in chunks; each
+    chunk's students and the job's progress commit in the same transaction,
+    so a job taken over after a restart continues from its last chunk. A
+    running job whose progress has not moved for ``stale_after`` seconds is
+    claimed again by whichever worker polls first. Cancelling is checked at
+    every chunk; students from chunks already committed stay imported.
+
+    A ``dry_run`` job only works out the diff. Its file is kept until the
+    admin applies it, which queues the same job again as a real import.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        spool_dir: str = IMPORT_SPOOL_DIR,
+        chunk_size: int = ROSTER_IMPORT_CHUNK,
+        poll_interval: float = IMPORT_POLL_SECONDS,
+        stale_after: float = IMPORT_STALE_SECONDS,
+        publish: Optional[Callable[[dict], None]] = None,
+    ):
+        self.session_factory = session_factory
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._publish = publish
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = threading.Event()
+        self.completed = 0
+        self.failed = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            # The running chunk finishes; the job is requeued from there
+            self._stopping.set()
+            self.wake()
+            await self._task
+            self._task = None
+        self._loop = None
+
+    def wake(self):
+        """Look for queued jobs now rather than at the next poll; safe from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if await asyncio.to_thread(self.run_next):
+                    continue
+            except Exception as e:
+                logging.error(f"Error running roster import: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def spool_path(self, job_id: str) -> str:
+        # Workbook or CSV; the job's filename says which
+        return os.path.join(self.spool_dir, f"{job_id}.upload")
+
+    def submit(
+        self, db: Session, file: BinaryIO, filename: str, username: str, dry_run: bool = False
+    ) -> models.ImportJob:
+        job_id = uuid.uuid4().hex
+        path = self.spool_path(job_id)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Complete on disk before the job exists, so a worker never reads half a file
+        with open(path + ".part", "wb") as spooled:
+            shutil.copyfileobj(file, spooled)
+        os.replace(path + ".part", path)
+        try:
+            job = self._create(db, job_id, filename, username, dry_run)
+        except Exception:
+            os.remove(path)
+            raise
+        self.wake()
+        return job
+
+    @retry_on_busy()
+    def _create(self, db: Session, job_id: str, filename: str, username: str, dry_run: bool) -> models.ImportJob:
+        with immediate_transaction(db):
+            job = models.ImportJob(id=job_id, filename=filename, status=QUEUED, created_by=username, dry_run=dry_run)
+            db.add(job)
+        db.refresh(job)
+        return job
+
+    @retry_on_busy()
+    def cancel(self, db: Session, job_id: str) -> Optional[models.ImportJob]:
+        """Cancel a queued job or an unapplied dry run at once, or ask a running job to stop at its next chunk."""
+        with immediate_transaction(db):
+            job = db.get(models.ImportJob, job_id, populate_existing=True)
+            if job is None or (job.status in FINISHED and not self._previewed(job)):
+                return job
+            if job.status in (QUEUED, COMPLETED):
+                job.status = CANCELLED
+                job.finished_at = datetime.now()
+            else:
+                job.cancel_requested = True
+            job.updated_at = datetime.now()
+        db.refresh(job)
+        if job.status == CANCELLED:
+            self._discard(job.id)
+        self._notify(job_state(job))
+        return job
+
+    @staticmethod
+    def _previewed(job: models.ImportJob) -> bool:
+        return job.dry_run and job.status == COMPLETED
+
+    @retry_on_busy()
+    def apply(self, db: Session, job_id: str) -> Optional[models.ImportJob]:
+        """Queue a finished dry run as the real import of the same file.
+
+        Raises ``ValueError`` unless the job is a completed dry run.
+        """
+        with immediate_transaction(db):
+            job = db.get(models.ImportJob, job_id, populate_existing=True)
+            if job is None:
+                return None
+            if not self._previewed(job):
+                raise ValueError(f"Import job {job_id} is not a completed dry run")
+            job.dry_run = False
+            job.status = QUEUED
+            job.rows_processed = job.inserted = job.updated = job.unchanged = job.rejected = job.missing = 0
+            job.errors = "[]"
+            job.samples = "{}"
+            job.finished_at = None
+            job.updated_at = datetime.now()
+        db.refresh(job)
+        self.wake()
+        self._notify(job_state(job))
+        return job
+
+    def run_next(self) -> Optional[str]:
+        """Run the oldest queued or abandoned job to the end. Returns its id, or None if there was none."""
+        claimed = self._claim()
+        if claimed is None:
+            return None
+        job_id, filename, dry_run, result = claimed
+
+        committed = []
+
+        def checkpoint(db: Session, progress: ImportResult):
+            job = db.get(models.ImportJob, job_id, populate_existing=True)
+            if job.cancel_requested:
+                raise ImportCancelled()
+            if self._stopping.is_set():
+                raise _Interrupted()
+            job.rows_processed = progress.rows_read
+            job.inserted = progress.inserted
+            job.updated = progress.updated
+            job.unchanged = progress.unchanged
+            job.rejected = progress.rejected
+            job.missing = progress.missing
+            job.errors = json.dumps(progress.errors, ensure_ascii=False)
+            job.samples = json.dumps(progress.samples, ensure_ascii=False)
+            job.updated_at = datetime.now()
+            committed.append(job_state(job))
+
+        def publish_progress(session: Session):
+            # Once the chunk is committed and the write lock released
+            if committed:
+                self._notify(committed[-1])
+                committed.clear()
+
+        status, error = COMPLETED, None
+        try:
+            with self.session_factory() as db, open(self.spool_path(job_id), "rb") as file:
+                event.listen(db, "after_commit", publish_progress)
+                import_roster(db, read_roster_rows(file, filename), self.chunk_size, result, checkpoint, dry_run)
+        except ImportCancelled:
+            status = CANCELLED
+        except _Interrupted:
+            status = QUEUED
+        except Exception as e:
+            logging.error(f"Roster import {job_id} failed: {e}")
+            status, error = FAILED, str(e)
+        self._finish(job_id, status, error)
+        return job_id
+
+    def _claimable(self, db: Session, now: datetime):
+        table = models.ImportJob
+        return db.query(table).filter(
+            or_(
+                table.status == QUEUED,
+                and_(table.status == RUNNING, table.updated_at < now - timedelta(seconds=self.stale_after)),
+            )
+        ).order_by(table.created_at)
+
+    @retry_on_busy()
+    def _claim(self) -> Optional[Tuple[str, str, bool, ImportResult]]:
+        now = datetime.now()
+        with self.session_factory() as db:
+            # A plain read first, so polling an empty queue never takes the write lock
+            if db.query(self._claimable(db, now).exists()).scalar() is not True:
+                return None
+            db.rollback()
+            with immediate_transaction(db):
+                # Again under the lock: another worker may have claimed it meanwhile
+                job = self._claimable(db, now).first()
+                if job is None:
+                    return None
+                if job.status == RUNNING:
+                    logging.info(f"Resuming roster import {job.id} after row {job.rows_processed + 1}")
+                job.status = RUNNING
+                job.updated_at = now
+                # Where the last committed chunk left off
+                result = ImportResult()
+                result.rows_read = job.rows_processed
+                result.inserted = job.inserted
+                result.updated = job.updated
+                result.unchanged = job.unchanged
+                result.rejected = job.rejected
+                result.errors = json.loads(job.errors)
+                result.samples.update(json.loads(job.samples))
+                return job.id, job.filename, job.dry_run, result
+
+    @retry_on_busy()
+    def _finish(self, job_id: str, status: str, error: Optional[str]):
+        with self.session_factory() as db:
+            with immediate_transaction(db):
+                job = db.get(models.ImportJob, job_id)
+                job.status = status
+                job.error = error
+                job.updated_at = datetime.now()
+                if status in FINISHED:
+                    job.finished_at = job.updated_at
+                if status == COMPLETED and not job.dry_run:
+                    db.add(models.AdminLog(
+                        admin_username=job.created_by or "system",
+                        action="IMPORT_STUDENTS",
+                        details=(
+                            f"{job.filename}: inserted {job.inserted}, updated {job.updated}, "
+                            f"unchanged {job.unchanged}, rejected {job.rejected}, missing {job.missing}"
+                        ),
+                    ))
+            db.refresh(job)
+            self._notify(job_state(job))
+            keep_file = self._previewed(job)
+        if status == COMPLETED:
+            self.completed += 1
+        elif status == FAILED:
+            self.failed += 1
+        if status in FINISHED and not keep_file:
+            self._discard(job_id)
+
+    def _discard(self, job_id: str):
+        try:
+            os.remove(self.spool_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _notify(self, state: dict):
+        state = {key: value for key, value in state.items() if key not in PRIVATE_FIELDS}
+        if self._publish is not None:
+            self._publish(state)
+        elif self._loop is not None:
+            asyncio.run_coroutine_threadsafe(manager.broadcast_import(state), self._loop)
+
+
+import_worker = ImportWorker()
@@ -1,7 +1,10 @@
+import functools
 import logging
 
+from fastapi import BackgroundTasks
 from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
 
+from . import metrics
 from .env_settings import get_mail_settings, mail_settings_complete
 
 
@@ -12,6 +15,20 @@ def waitlist_mail_ready() -> bool:
     return mail_settings_complete(get_mail_settings())
 
 
+def queue_mail(background_tasks: BackgroundTasks, send, *args):
+    """Schedule ``send(*args)`` after the response, counting it in ``mail_queue_depth``."""
+
+    @functools.wraps(send)
+    async def send_and_count():
+        try:
+            return await send(*args)
+        finally:
+            metrics.MAIL_QUEUE_DEPTH.dec()
+
+    metrics.MAIL_QUEUE_DEPTH.inc()
+    background_tasks.add_task(send_and_count)
+
+
 def build_mail_config() -> ConnectionConfig | None:
     settings = get_mail_settings()
     if not mail_settings_complete(settings):
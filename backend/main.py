@@ -5,39 +5,22 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from sqlalchemy import inspect, text
 
-from .database import Base, engine, SessionLocal
-from .websocket_manager import manager
-from .routers import public, admin, export
+from .database import SessionLocal, TelemetrySessionLocal
+from .import_jobs import import_worker
+from .migrations import upgrade_all
+from .request_log import request_log
+from .retention import retention_job
+from .telemetry import route_latencies, route_template
+from .websocket_manager import manager, parse_topics
+from .routers import public, admin, export, metrics as metrics_router
 from .auth import get_password_hash
-from . import models
+from . import metrics, models
 
 
 templates = Jinja2Templates(directory="frontend/templates")
 
 
-def ensure_runtime_schema() -> None:
-    inspector = inspect(engine)
-    runtime_columns = {
-        "registrations": {
-            "contact_email": "ALTER TABLE registrations ADD COLUMN contact_email VARCHAR",
-        },
-        "announcements": {
-            "is_urgent": "ALTER TABLE announcements ADD COLUMN is_urgent BOOLEAN DEFAULT 0",
-        },
-    }
-
-    with engine.begin() as connection:
-        for table_name, columns in runtime_columns.items():
-            if not inspector.has_table(table_name):
-                continue
-            existing_columns = {column["name"] for column in inspector.get_columns(table_name)}
-            for column_name, ddl in columns.items():
-                if column_name not in existing_columns:
-                    connection.execute(text(ddl))
-
-
 def create_app() -> FastAPI:
     app = FastAPI(title="DSNPRU_REG Activity Registration API", version="1.0.0")
 
@@ -50,9 +33,8 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
-    # Create DB tables
-    Base.metadata.create_all(bind=engine)
-    ensure_runtime_schema()
+    # Create or upgrade both schemas; only reads the stored versions once current
+    upgrade_all()
 
     # Seed default admin if none exists
     with SessionLocal() as db:
@@ -69,6 +51,7 @@ def create_app() -> FastAPI:
     app.include_router(public.router, prefix="/api", tags=["public"])
     app.include_router(admin.router, prefix="/admin", tags=["admin"])
     app.include_router(export.router, prefix="/export", tags=["export"])
+    app.include_router(metrics_router.router, tags=["metrics"])
 
     # Static files
     app.mount(
@@ -138,11 +121,14 @@ def create_app() -> FastAPI:
 
     @app.websocket("/ws/activities")
     async def websocket_activities(websocket: WebSocket):
-        await manager.connect(websocket)
+        await manager.connect(websocket, parse_topics(websocket.query_params.get("topics")))
         try:
             while True:
                 data = await websocket.receive_text()
+                manager.handle_client_message(websocket, data)
         except WebSocketDisconnect:
+            pass
+        finally:
             manager.disconnect(websocket)
 
     return app
@@ -170,21 +156,25 @@ async def startup_event():
     logger = logging.getLogger("uvicorn")
     logger.info("Application startup: DSNPRU_REG Activity Registration API started")
     asyncio.create_task(log_system_metrics())
+    await manager.start()
+    await request_log.start()
+    await retention_job.start()
+    await import_worker.start()
 
 async def log_system_metrics():
     while True:
         try:
-            with SessionLocal() as db:
+            with SessionLocal() as db, TelemetrySessionLocal() as telemetry_db:
                 # DB Size
                 db_path = "sicday.db"
                 if os.path.exists(db_path):
                     size = os.path.getsize(db_path)
-                    db.add(models.SystemMetric(metric_type="db_size", value=size))
+                    telemetry_db.add(models.SystemMetric(metric_type="db_size", value=size))
                 
                 # DB Health (Simple check)
                 db.execute(models.Base.metadata.tables['students'].select().limit(1))
-                db.add(models.SystemMetric(metric_type="db_health", status="healthy"))
-                db.commit()
+                telemetry_db.add(models.SystemMetric(metric_type="db_health", status="healthy"))
+                telemetry_db.commit()
         except Exception as e:
             logging.error(f"Error logging metrics: {e}")
         await asyncio.sleep(300) # Every 5 minutes
@@ -193,6 +183,10 @@ async def log_system_metrics():
 async def shutdown_event():
     logger = logging.getLogger("uvicorn")
     logger.info("Application shutdown")
+    await manager.stop()
+    await request_log.stop()
+    await retention_job.stop()
+    await import_worker.stop()
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -202,18 +196,14 @@ async def log_requests(request: Request, call_next):
     
     # Don't log static files or heartbeats to keep DB clean if many
     if not request.url.path.startswith("/static"):
-        try:
-            with SessionLocal() as db:
-                log = models.RequestLog(
-                    method=request.method,
-                    path=request.url.path,
-                    status_code=response.status_code,
-                    response_time_ms=process_time
-                )
-                db.add(log)
-                db.commit()
-        except Exception as e:
-            logging.error(f"Error logging request to DB: {e}")
+        # Buffered; written in batches by the request log writer
+        route = route_template(request)
+        route_latencies.observe(request.method, route, response.status_code, process_time)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route, status=str(response.status_code))
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start_time, method=request.method, route=route
+        )
+        request_log.record(request.method, request.url.path, response.status_code, process_time, route)
 
     return response
 
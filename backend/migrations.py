@@ -0,0 +1,459 @@
+"""Versioned schema migrations for the main and telemetry databases.
+
+Each database records the last migration it ran in ``schema_versions``. On
+startup ``upgrade()`` reads that row and returns straight away when it is
+current, so a normal boot does no schema introspection at all. A database
+with no recorded version is either new, in which case the tables are
+created and stamped with the latest version, or predates versioning, in
+which case every migration runs from the start (they are written to cope
+with whatever an older release left behind).
+
+Run ``python -m backend.migrations`` to upgrade by hand ahead of a deploy,
+or ``python -m backend.migrations --status`` to print the versions.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateTable
+
+from .database import Base, TelemetryBase, engine, immediate_transaction, retry_on_busy, telemetry_engine
+from .models import ImportJob, RequestLog, RequestRollup, SeatVersion
+from .student_search import rebuild_search_index
+from .telemetry import fold_request_logs, move_telemetry_tables
+
+# Rows per backfill transaction, and the pause between them that lets other
+# writers in. Each batch holds the write lock only while it runs.
+MIGRATION_BATCH = int(os.getenv("MIGRATION_BATCH", "2000"))
+MIGRATION_BATCH_PAUSE_SECONDS = int(os.getenv("MIGRATION_BATCH_PAUSE_MS", "20")) / 1000
+# A worker running a run() migration refreshes its claim this often; one not
+# refreshed for MIGRATION_CLAIM_SECONDS is taken to have died and is taken over
+MIGRATION_CLAIM_SECONDS = int(os.getenv("MIGRATION_CLAIM_SECONDS", "60"))
+
+# Kept outside Base/TelemetryBase so create_all() never sees it; one row per
+# database name, so both schemas can share a file.
+_version_metadata = MetaData()
+schema_versions = Table(
+    "schema_versions",
+    _version_metadata,
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("backfill_cursor", Integer, nullable=True),  # last id done by the running backfill
+)
+# Held by the worker running a run() migration, so workers starting together
+# never run one at the same time; the others wait for it to be recorded
+migration_claims = Table(
+    "migration_claims",
+    _version_metadata,
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("owner", String, nullable=False),
+    Column("claimed_at", DateTime, nullable=False),
+)
+
+
+class Backfill:
+    """Rows of ``table`` passed to ``apply(db, rows)`` in id order.
+
+    Each batch of ``columns`` (plus ``id``) is applied in its own short
+    write transaction that also saves the last id done, so an interrupted
+    backfill picks up after the last committed batch. ``skip(db)``, if
+    given, is asked before the first batch whether there is nothing to fill.
+    """
+
+    def __init__(
+        self,
+        table: Table,
+        columns: Sequence[str],
+        apply: Callable[[Session, list], None],
+        skip: Optional[Callable[[Session], bool]] = None,
+    ):
+        self.table = table
+        self.columns = columns
+        self.apply = apply
+        self.skip = skip
+
+
+class Migration:
+    """One step from ``version - 1`` to ``version``. Set exactly one of:
+
+    - ``upgrade(connection)``: DDL and small data fixes, run in one
+      ``BEGIN IMMEDIATE`` transaction together with the version bump
+    - ``backfill``: a ``Backfill`` over a table of any size
+    - ``run(engine)``: work that manages its own transactions (e.g. copying
+      to another database), run by one worker at a time under a claim in
+      ``migration_claims``; it must be safe to run again, because a crash
+      before the version is recorded repeats it
+    """
+
+    def __init__(
+        self,
+        version: int,
+        description: str,
+        upgrade: Optional[Callable[[Connection], None]] = None,
+        backfill: Optional[Backfill] = None,
+        run: Optional[Callable[[Engine], None]] = None,
+    ):
+        if sum(step is not None for step in (upgrade, backfill, run)) != 1:
+            raise ValueError(f"Migration {version} needs exactly one of upgrade, backfill or run")
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.backfill = backfill
+        self.run = run
+
+
+class SchemaMigrator:
+    """Brings the database behind ``engine`` up to the last of ``migrations``."""
+
+    def __init__(
+        self,
+        name: str,
+        engine: Engine,
+        metadata: MetaData,
+        migrations: List[Migration],
+        batch_size: int = MIGRATION_BATCH,
+        pause: float = MIGRATION_BATCH_PAUSE_SECONDS,
+        claim_timeout: float = MIGRATION_CLAIM_SECONDS,
+    ):
+        versions = [migration.version for migration in migrations]
+        if versions != list(range(1, len(migrations) + 1)):
+            raise ValueError(f"{name} migrations must be numbered 1..n in order, got {versions}")
+        self.name = name
+        self.engine = engine
+        self.metadata = metadata
+        self.migrations = migrations
+        self.batch_size = batch_size
+        self.pause = pause
+        self.claim_timeout = claim_timeout
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    @property
+    def latest(self) -> int:
+        return len(self.migrations)
+
+    def version(self) -> Optional[int]:
+        """The recorded version, or None for a database that has none yet."""
+        with self.engine.connect() as connection:
+            return self._read(connection)[0]
+
+    def upgrade(self) -> List[int]:
+        """Run the migrations the database has not had yet. Returns their versions."""
+        current = self.version()
+        if current == self.latest:
+            return []
+        if current is None:
+            current = self._initialize()
+            if current == self.latest:
+                logging.info(f"Created the {self.name} schema at version {current}")
+                return []
+
+        applied = []
+        for migration in self.migrations[current:]:
+            logging.info(f"Migrating {self.name} database to version {migration.version}: {migration.description}")
+            started = time.perf_counter()
+            if migration.upgrade is not None:
+                self._upgrade(migration)
+            elif migration.backfill is not None:
+                while self._backfill_batch(migration) == self.batch_size:
+                    time.sleep(self.pause)
+                self._record(migration.version)
+            else:
+                self._run(migration)
+            logging.info(f"{self.name} version {migration.version} done in {time.perf_counter() - started:.1f} s")
+            applied.append(migration.version)
+        return applied
+
+    def _read(self, connection: Connection) -> Tuple[Optional[int], Optional[int]]:
+        connection.execute(CreateTable(schema_versions, if_not_exists=True))
+        row = connection.execute(
+            select(schema_versions.c.version, schema_versions.c.backfill_cursor).where(
+                schema_versions.c.name == self.name
+            )
+        ).first()
+        return (row.version, row.backfill_cursor) if row else (None, None)
+
+    def _write(self, connection: Connection, version: int, cursor: Optional[int] = None):
+        statement = insert(schema_versions).values(name=self.name, version=version, backfill_cursor=cursor)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[schema_versions.c.name],
+                set_={"version": statement.excluded.version, "backfill_cursor": statement.excluded.backfill_cursor},
+            )
+        )
+
+    @retry_on_busy()
+    def _initialize(self) -> int:
+        """Create a new database at the latest version; return 0 for one that predates versioning."""
+        with self.SessionLocal() as db, immediate_transaction(db):
+            connection = db.connection()
+            # Another worker may have got here first
+            version, _ = self._read(connection)
+            if version is not None:
+                return version
+            existing = set(inspect(connection).get_table_names())
+            if existing.isdisjoint(self.metadata.tables):
+                self.metadata.create_all(bind=connection)
+                version = self.latest
+            else:
+                version = 0
+            self._write(connection, version)
+        return version
+
+    @retry_on_busy()
+    def _upgrade(self, migration: Migration):
+        with self.SessionLocal() as db, immediate_transaction(db):
+            connection = db.connection()
+            if self._read(connection)[0] >= migration.version:
+                return
+            migration.upgrade(connection)
+            self._write(connection, migration.version)
+
+    @retry_on_busy()
+    def _record(self, version: int, owner: Optional[str] = None):
+        with self.SessionLocal() as db, immediate_transaction(db):
+            connection = db.connection()
+            if self._read(connection)[0] < version:
+                self._write(connection, version)
+            if owner is not None:
+                self._release(connection, owner)
+
+    def _run(self, migration: Migration):
+        """Run ``migration.run`` under the claim, or wait for the worker holding it to finish."""
+        owner = uuid.uuid4().hex
+        while True:
+            claimed = self._claim(migration.version, owner)
+            if claimed is None:
+                return
+            if claimed:
+                break
+            time.sleep(min(self.claim_timeout / 3, 1))
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(owner, stop), daemon=True)
+        heartbeat.start()
+        try:
+            migration.run(self.engine)
+        except BaseException:
+            stop.set()
+            heartbeat.join()
+            with self.engine.begin() as connection:
+                self._release(connection, owner)
+            raise
+        stop.set()
+        heartbeat.join()
+        self._record(migration.version, owner)
+
+    @retry_on_busy()
+    def _claim(self, version: int, owner: str) -> Optional[bool]:
+        """Claim running ``version``: True once held, False while another
+        worker holds it, None when it has been recorded meanwhile."""
+        with self.SessionLocal() as db, immediate_transaction(db):
+            connection = db.connection()
+            connection.execute(CreateTable(migration_claims, if_not_exists=True))
+            # Checked under the write lock: the last holder may have just finished
+            if self._read(connection)[0] >= version:
+                return None
+            claim = connection.execute(
+                select(migration_claims).where(migration_claims.c.name == self.name)
+            ).first()
+            now = datetime.now()
+            if claim is not None and claim.claimed_at > now - timedelta(seconds=self.claim_timeout):
+                return False
+            if claim is not None:
+                logging.warning(f"Taking over {self.name} version {claim.version} from a worker that stopped")
+            statement = insert(migration_claims).values(name=self.name, version=version, owner=owner, claimed_at=now)
+            connection.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[migration_claims.c.name],
+                    set_={"version": version, "owner": owner, "claimed_at": now},
+                )
+            )
+        return True
+
+    def _heartbeat(self, owner: str, stop: threading.Event):
+        while not stop.wait(self.claim_timeout / 3):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        migration_claims.update()
+                        .where(migration_claims.c.name == self.name, migration_claims.c.owner == owner)
+                        .values(claimed_at=datetime.now())
+                    )
+            except Exception as e:
+                logging.warning(f"Could not refresh the {self.name} migration claim: {e}")
+
+    def _release(self, connection: Connection, owner: str):
+        connection.execute(
+            migration_claims.delete().where(migration_claims.c.name == self.name, migration_claims.c.owner == owner)
+        )
+
+    @retry_on_busy()
+    def _backfill_batch(self, migration: Migration) -> int:
+        backfill = migration.backfill
+        table = backfill.table
+        with self.SessionLocal() as db, immediate_transaction(db):
+            version, cursor = self._read(db.connection())
+            if version >= migration.version:
+                return 0
+            if cursor is None and backfill.skip is not None and backfill.skip(db):
+                return 0
+            rows = db.execute(
+                select(table.c.id, *(table.c[column] for column in backfill.columns))
+                .where(table.c.id > (cursor or 0))
+                .order_by(table.c.id)
+                .limit(self.batch_size)
+            ).all()
+            if rows:
+                backfill.apply(db, rows)
+                self._write(db.connection(), version, rows[-1].id)
+        return len(rows)
+
+
+def add_missing_columns(connection: Connection, columns: Dict[str, Dict[str, str]]):
+    """Add each ``{table: {column: type and default}}`` the table lacks. Tables that do not exist are skipped."""
+    inspector = inspect(connection)
+    for table_name, table_columns in columns.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        for column_name, ddl in table_columns.items():
+            if column_name not in existing:
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}"))
+
+
+def create_indexes(metadata: MetaData, *names: str):
+    """An ``upgrade`` that creates the named indexes of ``metadata`` where they are missing.
+
+    Each migration lists the indexes it added, so a later index declared in
+    the models is left to the migration that introduced it.
+    """
+    indexes = {index.name: index for table in metadata.tables.values() for index in table.indexes}
+    unknown = set(names) - set(indexes)
+    if unknown:
+        raise ValueError(f"No such indexes in the models: {sorted(unknown)}")
+
+    def upgrade(connection: Connection):
+        # By name: reflection (and so checkfirst) skips indexes on expressions
+        existing = set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        for name in names:
+            if name not in existing:
+                indexes[name].create(bind=connection)
+
+    return upgrade
+
+
+def _legacy_columns(connection: Connection):
+    # Columns added by releases that shipped hand-run migration scripts
+    # (migrate_db.py, migrate_sequence.py, migrate_v3.py, add_col.py) or
+    # patched them at startup
+    add_missing_columns(connection, {
+        "students": {"sequence": "INTEGER"},
+        "activity_groups": {
+            "allowed_classrooms": "TEXT",
+            "is_visible": "BOOLEAN DEFAULT 1",
+        },
+        "activities": {
+            "allowed_classrooms": "TEXT",
+            "start_time": "DATETIME",
+            "end_time": "DATETIME",
+            "color": "TEXT DEFAULT '#e11d48'",
+            "type": "TEXT DEFAULT 'individual'",
+            "max_team_size": "INTEGER DEFAULT 1",
+        },
+        "registrations": {
+            "status": "VARCHAR DEFAULT 'registered'",
+            "team_name": "TEXT",
+            "contact_email": "VARCHAR",
+        },
+        "announcements": {"is_urgent": "BOOLEAN DEFAULT 0"},
+    })
+    # Tables added since the database was created
+    Base.metadata.create_all(bind=connection)
+
+
+def _move_telemetry(main_engine: Engine):
+    moved = move_telemetry_tables(main_engine, telemetry_engine)
+    if moved:
+        logging.info(f"Moved telemetry rows to the telemetry database: {moved}")
+
+
+MAIN_MIGRATIONS = [
+    Migration(1, "Columns and tables added by earlier releases", upgrade=_legacy_columns),
+    Migration(2, "Indexes for the registration hot queries", upgrade=create_indexes(
+        Base.metadata,
+        "ix_students_name",
+        "ix_activities_status",
+        "ix_activities_group_id",
+        "ix_registrations_activity_status_timestamp",
+        "ix_announcements_active_timestamp",
+    )),
+    Migration(3, "Move telemetry tables to the telemetry database", run=_move_telemetry),
+    # One statement: a school roster indexes in well under a second
+    Migration(4, "Full-text search index over students", upgrade=rebuild_search_index),
+    Migration(5, "Background roster import jobs", upgrade=lambda connection: ImportJob.__table__.create(connection, checkfirst=True)),
+    Migration(6, "Roster import diff reports", upgrade=lambda connection: add_missing_columns(connection, {
+        "import_jobs": {
+            "dry_run": "BOOLEAN NOT NULL DEFAULT 0",
+            "missing": "INTEGER NOT NULL DEFAULT 0",
+            "samples": "VARCHAR NOT NULL DEFAULT '{}'",
+        },
+    })),
+    # The name sort uses ix_students_name from migration 2; listed so the step is complete on its own
+    Migration(7, "Indexes for the admin student list", upgrade=create_indexes(
+        Base.metadata, "ix_students_classroom_sequence", "ix_students_sequence", "ix_students_name",
+    )),
+    Migration(8, "Seat version counter", upgrade=lambda connection: SeatVersion.__table__.create(connection, checkfirst=True)),
+]
+
+TELEMETRY_MIGRATIONS = [
+    Migration(1, "Telemetry tables", upgrade=lambda connection: TelemetryBase.metadata.create_all(bind=connection)),
+    # Skipped where rollups exist: request logging has been folding rows in since they did
+    Migration(2, "Request rollups from existing request logs", backfill=Backfill(
+        RequestLog.__table__,
+        ["timestamp", "method", "path", "status_code", "response_time_ms"],
+        fold_request_logs,
+        skip=lambda db: db.query(RequestRollup.id).first() is not None,
+    )),
+]
+
+# The main database first: main migration 3 moves the telemetry rows that
+# telemetry migration 2 then rolls up
+main_schema = SchemaMigrator("main", engine, Base.metadata, MAIN_MIGRATIONS)
+telemetry_schema = SchemaMigrator("telemetry", telemetry_engine, TelemetryBase.metadata, TELEMETRY_MIGRATIONS)
+
+
+def upgrade_all() -> Dict[str, List[int]]:
+    return {migrator.name: migrator.upgrade() for migrator in (main_schema, telemetry_schema)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the main and telemetry database schemas.")
+    parser.add_argument("--status", action="store_true", help="print the versions and exit")
+    parser.add_argument(
+        "--rebuild-search-index", action="store_true",
+        help="build students_fts again, e.g. after moving to SQLite 3.34 or newer",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not args.status:
+        upgrade_all()
+    if args.rebuild_search_index:
+        with engine.begin() as connection:
+            rebuild_search_index(connection)
+    for migrator in (main_schema, telemetry_schema):
+        print(f"{migrator.name}: version {migrator.version()} of {migrator.latest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, Boolean
+import sqlite3
+
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, Boolean, Index, DDL, event, func, literal_column
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
-from .database import Base
+from .database import Base, TelemetryBase
 
 
 class Student(Base):
@@ -10,13 +12,49 @@ class Student(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String, unique=True, index=True, nullable=False)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True) # registration looks students up by number or name
     classroom = Column(String, nullable=True) # e.g. "ม.1/1"
     sequence = Column(Integer, nullable=True) # e.g. 1, 2, 3 (เลขที่)
     
     registrations = relationship("Registration", back_populates="student", cascade="all, delete-orphan")
 
 
+# Sort keys of the admin student list (student_listing.py). NULL is folded
+# into a value so a keyset row comparison on them can seek the index; the
+# literals must stay literals for SQLite to match queries to the index.
+STUDENT_CLASSROOM_KEY = func.coalesce(Student.classroom, literal_column("''"))
+STUDENT_SEQUENCE_KEY = func.coalesce(Student.sequence, literal_column("0"))
+Index("ix_students_classroom_sequence", STUDENT_CLASSROOM_KEY, STUDENT_SEQUENCE_KEY)
+Index("ix_students_sequence", STUDENT_SEQUENCE_KEY)
+
+
+# Trigram full-text index over students for substring search (see
+# student_search.py). It stores only the index; rows are read from
+# students, and the triggers keep it in step with every write. The trigram
+# tokenizer needs SQLite 3.34; older builds search with LIKE instead.
+STUDENT_SEARCH_FTS = sqlite3.sqlite_version_info >= (3, 34, 0)
+STUDENT_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5("
+    "number, name, classroom, content='students', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN "
+    "INSERT INTO students_fts (rowid, number, name, classroom) VALUES (new.id, new.number, new.name, new.classroom); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN "
+    "INSERT INTO students_fts (students_fts, rowid, number, name, classroom) "
+    "VALUES ('delete', old.id, old.number, old.name, old.classroom); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF number, name, classroom ON students BEGIN "
+    "INSERT INTO students_fts (students_fts, rowid, number, name, classroom) "
+    "VALUES ('delete', old.id, old.number, old.name, old.classroom); "
+    "INSERT INTO students_fts (rowid, number, name, classroom) VALUES (new.id, new.number, new.name, new.classroom); "
+    "END",
+)
+
+if STUDENT_SEARCH_FTS:
+    for _statement in STUDENT_SEARCH_DDL:
+        event.listen(Student.__table__, "after_create", DDL(_statement))
+
+
 class ActivityGroup(Base):
     __tablename__ = "activity_groups"
 
@@ -36,7 +74,7 @@ class Activity(Base):
     title = Column(String, nullable=False)
     description = Column(String, nullable=True)
     max_people = Column(Integer, nullable=False)
-    status = Column(String, default="open")  # open / close
+    status = Column(String, default="open", index=True)  # open / close
     allowed_classrooms = Column(String, nullable=True)  # Comma separated classrooms
     start_time = Column(DateTime, nullable=True)
     end_time = Column(DateTime, nullable=True)
@@ -46,7 +84,7 @@ class Activity(Base):
     type = Column(String, default="individual") # individual / team
     max_team_size = Column(Integer, default=1)
     
-    group_id = Column(Integer, ForeignKey("activity_groups.id"), nullable=True)
+    group_id = Column(Integer, ForeignKey("activity_groups.id"), nullable=True, index=True)
 
     group = relationship("ActivityGroup", back_populates="activities")
     registrations = relationship("Registration", back_populates="activity", cascade="all, delete-orphan")
@@ -55,7 +93,10 @@ class Activity(Base):
 class Registration(Base):
     __tablename__ = "registrations"
     __table_args__ = (
+        # Also serves lookups by student_id alone
         UniqueConstraint("student_id", "activity_id", name="uq_student_activity"),
+        # Seat counts per (activity_id, status), and waitlist order by timestamp
+        Index("ix_registrations_activity_status_timestamp", "activity_id", "status", "timestamp"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -70,6 +111,18 @@ class Registration(Base):
     activity = relationship("Activity", back_populates="registrations")
 
 
+class SeatVersion(Base):
+    """A single row counting commits that changed activities or registrations.
+
+    Bumped inside each such write transaction (reservations.py), so seat
+    counts read together with it order the same way in every worker.
+    """
+    __tablename__ = "seat_version"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
 class Admin(Base):
     __tablename__ = "admins"
 
@@ -92,6 +145,10 @@ class AdminLog(Base):
 
 class Announcement(Base):
     __tablename__ = "announcements"
+    __table_args__ = (
+        # Active banners, newest first, on every public page load
+        Index("ix_announcements_active_timestamp", "is_active", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     message = Column(String, nullable=False)
@@ -100,7 +157,32 @@ class Announcement(Base):
     color = Column(String, default="indigo")
     timestamp = Column(DateTime, default=datetime.now)
 
-class RequestLog(Base):
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True)  # random hex; also names the spooled file and the WebSocket topic
+    filename = Column(String, nullable=False)
+    status = Column(String, default="queued", nullable=False, index=True)  # queued / running / completed / failed / cancelled
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    dry_run = Column(Boolean, default=False, nullable=False)  # a diff report only; applied later by clearing it
+    # Progress, committed with each chunk of students; a resumed job starts after rows_processed
+    rows_processed = Column(Integer, default=0, nullable=False)
+    inserted = Column(Integer, default=0, nullable=False)
+    updated = Column(Integer, default=0, nullable=False)
+    unchanged = Column(Integer, default=0, nullable=False)
+    rejected = Column(Integer, default=0, nullable=False)
+    missing = Column(Integer, default=0, nullable=False)  # stored students the file does not list
+    errors = Column(String, default="[]", nullable=False)  # JSON list of rejected rows
+    samples = Column(String, default="{}", nullable=False)  # JSON: first added, changed and missing students
+    error = Column(String, nullable=True)  # why a failed job stopped
+    created_by = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now)  # heartbeat while running
+    finished_at = Column(DateTime, nullable=True)
+
+# --- Telemetry database (see database.telemetry_engine) ---
+
+class RequestLog(TelemetryBase):
     __tablename__ = "request_logs"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -110,7 +192,25 @@ class RequestLog(Base):
     status_code = Column(Integer, nullable=False)
     response_time_ms = Column(Integer, nullable=False)
 
-class SystemMetric(Base):
+class RequestRollup(TelemetryBase):
+    """Request counts per method and route template, per minute, hour or day bucket."""
+    __tablename__ = "request_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket", "method", "route", name="uq_rollup_bucket_route"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False) # minute / hour / day
+    bucket = Column(DateTime, nullable=False) # start of the minute, hour or day
+    method = Column(String, nullable=False)
+    route = Column(String, nullable=False) # e.g. "/api/activities/{activity_id}"
+    count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    latency_sum_ms = Column(Integer, nullable=False, default=0)
+    latency_max_ms = Column(Integer, nullable=False, default=0)
+    histogram = Column(String, nullable=False) # JSON counts per telemetry.LATENCY_BOUNDS_MS bucket
+
+class SystemMetric(TelemetryBase):
     __tablename__ = "system_metrics"
     
     id = Column(Integer, primary_key=True, index=True)
@@ -118,3 +218,21 @@ class SystemMetric(Base):
     metric_type = Column(String, index=True) # e.g. "db_size", "db_health", "api_health"
     value = Column(Integer, nullable=True) # numeric value (e.g. size in bytes)
     status = Column(String, nullable=True) # text status (e.g. "up", "down")
+
+class SystemMetricRollup(TelemetryBase):
+    """System metrics downsampled per hour or day once raw rows age out."""
+    __tablename__ = "system_metric_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket", "metric_type", name="uq_metric_rollup_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String, nullable=False) # hour / day
+    bucket = Column(DateTime, nullable=False)
+    metric_type = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    value_count = Column(Integer, nullable=False, default=0) # samples that carried a value
+    value_sum = Column(Integer, nullable=False, default=0)
+    value_min = Column(Integer, nullable=True)
+    value_max = Column(Integer, nullable=True)
+    status_counts = Column(String, nullable=False) # JSON, e.g. {"healthy": 12}
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import models, telemetry
+from .database import TelemetrySessionLocal, immediate_transaction, retry_on_busy
+
+REQUEST_LOG_BUFFER = int(os.getenv("REQUEST_LOG_BUFFER", "10000"))
+REQUEST_LOG_BATCH = int(os.getenv("REQUEST_LOG_BATCH", "500"))
+REQUEST_LOG_FLUSH_SECONDS = int(os.getenv("REQUEST_LOG_FLUSH_MS", "1000")) / 1000
+
+RAW_COLUMNS = ("timestamp", "method", "path", "status_code", "response_time_ms")
+
+
+class RequestLogWriter:
+    """Buffers request log rows in memory and inserts them in batches.
+
+    ``record`` only appends to a bounded buffer, so logging never touches the
+    database on the request path. A background task writes a batch whenever
+    ``batch_size`` rows are waiting or ``flush_interval`` seconds have passed.
+    When the buffer is full, new rows are dropped and counted.
+
+    Each batch also updates the per-minute and per-hour rollups the status
+    pages read, in the same transaction as the raw rows.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = TelemetrySessionLocal,
+        capacity: int = REQUEST_LOG_BUFFER,
+        batch_size: int = REQUEST_LOG_BATCH,
+        flush_interval: float = REQUEST_LOG_FLUSH_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: Deque[dict] = deque()
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def record(self, method: str, path: str, status_code: int, response_time_ms: int, route: Optional[str] = None):
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self._buffer.append(
+            {
+                "timestamp": datetime.now(),
+                "method": method,
+                "path": path,
+                "route": route or path,
+                "status_code": status_code,
+                "response_time_ms": response_time_ms,
+            }
+        )
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def start(self):
+        self._batch_ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write everything still buffered."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._buffer:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while self._buffer:
+                await self.flush()
+                if len(self._buffer) < self.batch_size:
+                    break
+
+    async def flush(self):
+        """Write up to one batch of buffered rows."""
+        rows = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows: List[dict]):
+        try:
+            self._insert(rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            logging.error(f"Error writing request logs to DB: {e}")
+            return
+        self.written += len(rows)
+        self.batches += 1
+
+    @retry_on_busy()
+    def _insert(self, rows: List[dict]):
+        with self.session_factory() as db, immediate_transaction(db):
+            db.execute(insert(models.RequestLog), [{key: row[key] for key in RAW_COLUMNS} for row in rows])
+            telemetry.apply_rollups(db, telemetry.aggregate(rows))
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
+
+
+request_log = RequestLogWriter()
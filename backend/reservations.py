@@ -0,0 +1,195 @@
+from itertools import chain
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import case, event, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import immediate_transaction, retry_on_busy
+
+
+# Writes to these bump models.SeatVersion in the same transaction
+SEAT_TABLES = {"activities", "registrations"}
+_SEAT_BUMPED_KEY = "seat_version_bumped"
+
+
+def _bump_seat_version(session: Session):
+    if session.info.get(_SEAT_BUMPED_KEY):
+        return
+    session.info[_SEAT_BUMPED_KEY] = True
+    table = models.SeatVersion.__table__
+    statement = insert(table).values(id=1, value=1)
+    session.connection().execute(
+        statement.on_conflict_do_update(index_elements=[table.c.id], set_={"value": table.c.value + 1})
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _seat_rows_flushed(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if getattr(obj, "__tablename__", None) in SEAT_TABLES:
+            _bump_seat_version(session)
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _seat_rows_bulk_changed(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.local_table.name in SEAT_TABLES:
+        _bump_seat_version(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _seat_transaction_ended(session, transaction):
+    # Also after a savepoint: its rollback may have undone the bump
+    session.info.pop(_SEAT_BUMPED_KEY, None)
+
+
+class SeatReservationError(Exception):
+    """Raised when seats cannot be reserved; the message is shown to the student."""
+
+
+class SeatReservation(NamedTuple):
+    status: str  # registered / waitlisted
+    registered_count: int
+    waitlist_position: Optional[int] = None
+
+
+def count_registrations(db: Session, activity_id: int, status: str) -> int:
+    return (
+        db.query(models.Registration)
+        .filter(
+            models.Registration.activity_id == activity_id,
+            models.Registration.status == status,
+        )
+        .count()
+    )
+
+
+def seat_counts_subquery(db: Session, activity_ids: Optional[List[int]] = None):
+    """Per-activity ``registered``/``waitlisted`` counts as one grouped subquery."""
+    query = db.query(
+        models.Registration.activity_id.label("activity_id"),
+        func.sum(case((models.Registration.status == "registered", 1), else_=0)).label("registered"),
+        func.sum(case((models.Registration.status == "waitlisted", 1), else_=0)).label("waitlisted"),
+    )
+    if activity_ids is not None:
+        query = query.filter(models.Registration.activity_id.in_(activity_ids))
+    return query.group_by(models.Registration.activity_id).subquery()
+
+
+def seat_update(db: Session, activity_ids: List[int]) -> Tuple[List[dict], int]:
+    """Current seat counts for ``activity_ids`` and the seat version they reflect.
+
+    Call after commit; the result feeds ``manager.broadcast_seats``. ``as_of``
+    is read from ``seat_version`` in the same statement as the counts, so it
+    names the commit they come from and orders counts from any worker.
+    """
+    counts = seat_counts_subquery(db, activity_ids)
+    version = select(models.SeatVersion.value).where(models.SeatVersion.id == 1).scalar_subquery()
+    rows = (
+        db.query(
+            models.Activity.id,
+            models.Activity.max_people,
+            models.Activity.status,
+            func.coalesce(counts.c.registered, 0),
+            func.coalesce(version, 0),
+        )
+        .outerjoin(counts, counts.c.activity_id == models.Activity.id)
+        .filter(models.Activity.id.in_(activity_ids))
+        .all()
+    )
+    seats = [
+        {
+            "id": activity_id,
+            "registered_count": registered,
+            "remaining_seats": max(max_people - registered, 0),
+            "status": status,
+        }
+        for activity_id, max_people, status, registered, _ in rows
+    ]
+    return seats, rows[0][-1] if rows else 0
+
+
+@retry_on_busy()
+def reserve_seats(
+    db: Session,
+    activity: models.Activity,
+    members: List[models.Student],
+    team_name: Optional[str] = None,
+    contact_email: Optional[str] = None,
+) -> SeatReservation:
+    """Register every member of a team together, or waitlist them together.
+
+    The seat count and the inserts share one write transaction, so concurrent
+    requests can never push ``registered`` past ``activity.max_people``.
+    """
+    try:
+        with immediate_transaction(db):
+            registered_count = count_registrations(db, activity.id, "registered")
+            is_waitlisted = registered_count + len(members) > activity.max_people
+            if is_waitlisted and not contact_email:
+                raise SeatReservationError(
+                    "กิจกรรมเต็มแล้ว กรุณากรอกอีเมลเพื่อรับการยืนยันการเข้าคิวสำรอง"
+                )
+
+            status = "waitlisted" if is_waitlisted else "registered"
+            for member in members:
+                db.add(
+                    models.Registration(
+                        student_id=member.id,
+                        activity_id=activity.id,
+                        team_name=team_name,
+                        contact_email=contact_email if is_waitlisted else None,
+                        status=status,
+                    )
+                )
+            db.flush()
+
+            if is_waitlisted:
+                reservation = SeatReservation(
+                    status, registered_count, count_registrations(db, activity.id, "waitlisted")
+                )
+            else:
+                reservation = SeatReservation(status, registered_count + len(members))
+    except IntegrityError:
+        # uq_student_activity: a concurrent request registered one of the members first
+        raise SeatReservationError("นักเรียนในทีมนี้ลงทะเบียนกิจกรรมนี้ไปแล้ว")
+    metrics.REGISTRATIONS.inc(len(members), status=status)
+    return reservation
+
+
+@retry_on_busy()
+def release_seat(db: Session, reg: models.Registration) -> Optional[models.Registration]:
+    """Delete a registration and promote the oldest waitlisted entry into a free seat.
+
+    Returns the promoted registration, if any.
+    """
+    activity = reg.activity
+    next_in_line = None
+    with immediate_transaction(db):
+        db.delete(reg)
+        db.flush()
+
+        registered_count = count_registrations(db, activity.id, "registered")
+        if registered_count < activity.max_people:
+            next_in_line = (
+                db.query(models.Registration)
+                .filter(
+                    models.Registration.activity_id == activity.id,
+                    models.Registration.status == "waitlisted",
+                )
+                .order_by(models.Registration.timestamp.asc(), models.Registration.id.asc())
+                .first()
+            )
+            if next_in_line:
+                next_in_line.status = "registered"
+
+    metrics.REGISTRATION_CANCELLATIONS.inc()
+    if next_in_line:
+        metrics.WAITLIST_PROMOTIONS.inc()
+    return next_in_line
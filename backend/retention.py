@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from . import models, telemetry
+from .database import TelemetrySessionLocal, immediate_transaction, retry_on_busy
+
+# Raw request logs and system metrics are kept RETENTION_RAW_DAYS, hour
+# buckets RETENTION_HOURLY_DAYS and day buckets RETENTION_DAILY_DAYS.
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "7"))
+RETENTION_HOURLY_DAYS = int(os.getenv("RETENTION_HOURLY_DAYS", "90"))
+RETENTION_DAILY_DAYS = int(os.getenv("RETENTION_DAILY_DAYS", "730"))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_MINUTES", "60")) * 60
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "1000"))
+RETENTION_BATCH_PAUSE_SECONDS = int(os.getenv("RETENTION_BATCH_PAUSE_MS", "50")) / 1000
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "5000"))
+# A full VACUUM rewrites the whole file under the write lock, so converting an
+# older telemetry database to incremental auto-vacuum is a maintenance opt-in
+RETENTION_FULL_VACUUM = os.getenv("RETENTION_FULL_VACUUM", "0") == "1"
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+MetricKey = Tuple[str, datetime, str]
+
+
+class _MetricRollup:
+    __slots__ = ("count", "value_count", "value_sum", "value_min", "value_max", "status_counts")
+
+    def __init__(self):
+        self.count = 0
+        self.value_count = 0
+        self.value_sum = 0
+        self.value_min: Optional[int] = None
+        self.value_max: Optional[int] = None
+        self.status_counts: Dict[str, int] = {}
+
+    def _add_values(self, count: int, total: int, low: Optional[int], high: Optional[int]):
+        if not count:
+            return
+        self.value_count += count
+        self.value_sum += total
+        self.value_min = low if self.value_min is None else min(self.value_min, low)
+        self.value_max = high if self.value_max is None else max(self.value_max, high)
+
+    def _add_statuses(self, status_counts: Dict[str, int]):
+        for status, count in status_counts.items():
+            self.status_counts[status] = self.status_counts.get(status, 0) + count
+
+    def add_sample(self, value: Optional[int], status: Optional[str]):
+        self.count += 1
+        if value is not None:
+            self._add_values(1, value, value, value)
+        if status is not None:
+            self._add_statuses({status: 1})
+
+    def merge(self, row: models.SystemMetricRollup):
+        self.count += row.count
+        self._add_values(row.value_count, row.value_sum, row.value_min, row.value_max)
+        self._add_statuses(json.loads(row.status_counts))
+
+
+def downsample_metrics(rows: Iterable, granularity: str) -> Dict[MetricKey, _MetricRollup]:
+    """Fold raw ``SystemMetric`` rows, or finer ``SystemMetricRollup`` rows, into ``granularity`` buckets."""
+    rollups: Dict[MetricKey, _MetricRollup] = {}
+    for row in rows:
+        raw = isinstance(row, models.SystemMetric)
+        key = (granularity, telemetry.bucket_start(row.timestamp if raw else row.bucket, granularity), row.metric_type)
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = _MetricRollup()
+        if raw:
+            rollup.add_sample(row.value, row.status)
+        else:
+            rollup.merge(row)
+    return rollups
+
+
+def apply_metric_rollups(db: Session, rollups: Dict[MetricKey, _MetricRollup]):
+    """Merge ``rollups`` into ``system_metric_rollups``; run inside ``immediate_transaction``."""
+    table = models.SystemMetricRollup
+    keys = list(rollups)
+    existing = {}
+    for start in range(0, len(keys), 500):
+        for row in db.query(table).filter(
+            tuple_(table.granularity, table.bucket, table.metric_type).in_(keys[start:start + 500])
+        ):
+            existing[(row.granularity, row.bucket, row.metric_type)] = row
+    for key, rollup in rollups.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, bucket, metric_type = key
+            row = table(granularity=granularity, bucket=bucket, metric_type=metric_type)
+            db.add(row)
+        else:
+            rollup.merge(row)
+        row.count = rollup.count
+        row.value_count = rollup.value_count
+        row.value_sum = rollup.value_sum
+        row.value_min = rollup.value_min
+        row.value_max = rollup.value_max
+        row.status_counts = json.dumps(rollup.status_counts, sort_keys=True)
+
+
+def _downsample_request_rollups(db: Session, rows: List[models.RequestRollup]):
+    telemetry.apply_rollups(db, telemetry.coarsen(rows, "day"))
+
+
+def _downsample_raw_metrics(db: Session, rows: List[models.SystemMetric]):
+    apply_metric_rollups(db, downsample_metrics(rows, "hour"))
+
+
+def _downsample_hourly_metrics(db: Session, rows: List[models.SystemMetricRollup]):
+    apply_metric_rollups(db, downsample_metrics(rows, "day"))
+
+
+class RetentionJob:
+    """Deletes and downsamples old telemetry, then returns the space to the OS.
+
+    Each batch of at most ``batch_size`` rows is folded into its coarser
+    bucket and deleted in its own short write transaction, with a pause in
+    between, so request log flushes never wait long on the write lock.
+
+    - raw ``request_logs`` are deleted after ``raw_days`` (the rollups already hold their counts)
+    - minute request rollups are deleted after two days
+    - hour request rollups become day rollups after ``hourly_days``
+    - raw ``system_metrics`` become hour rollups after ``raw_days``
+    - hour metric rollups become day rollups after ``hourly_days``
+    - day buckets of both are deleted after ``daily_days``
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = TelemetrySessionLocal,
+        raw_days: int = RETENTION_RAW_DAYS,
+        hourly_days: int = RETENTION_HOURLY_DAYS,
+        daily_days: int = RETENTION_DAILY_DAYS,
+        interval: float = RETENTION_INTERVAL_SECONDS,
+        batch_size: int = RETENTION_BATCH,
+        pause: float = RETENTION_BATCH_PAUSE_SECONDS,
+        vacuum_pages: int = RETENTION_VACUUM_PAGES,
+        full_vacuum: bool = RETENTION_FULL_VACUUM,
+    ):
+        self.session_factory = session_factory
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.daily_days = daily_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.full_vacuum = full_vacuum
+        self._warned_full_vacuum = False
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.running = False
+        self.last_run_at: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.deleted_rows: Dict[str, int] = {}
+        self.downsampled_rows: Dict[str, int] = {}
+        self.freed_pages = 0
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.to_thread(self.run_once)
+            await asyncio.sleep(self.interval)
+
+    def run_once(self, now: Optional[datetime] = None):
+        now = now or datetime.now()
+        raw_cutoff = now - timedelta(days=self.raw_days)
+        hourly_cutoff = now - timedelta(days=self.hourly_days)
+        daily_cutoff = now - timedelta(days=self.daily_days)
+        logs = models.RequestLog
+        rollups = models.RequestRollup
+        metrics = models.SystemMetric
+        metric_rollups = models.SystemMetricRollup
+
+        started = time.perf_counter()
+        self.running = True
+        deleted: Dict[str, int] = {}
+        downsampled: Dict[str, int] = {}
+        try:
+            deleted["request_logs"] = self._in_batches(logs, logs.timestamp < raw_cutoff)
+            deleted["request_rollups"] = self._in_batches(
+                rollups, rollups.granularity == "minute", rollups.bucket < now - telemetry.MINUTE_ROLLUP_RETENTION
+            ) + self._in_batches(rollups, rollups.granularity == "day", rollups.bucket < daily_cutoff)
+            downsampled["request_rollups"] = self._in_batches(
+                rollups, rollups.granularity == "hour", rollups.bucket < hourly_cutoff,
+                downsample=_downsample_request_rollups,
+            )
+            downsampled["system_metrics"] = self._in_batches(
+                metrics, metrics.timestamp < raw_cutoff, downsample=_downsample_raw_metrics
+            )
+            downsampled["system_metric_rollups"] = self._in_batches(
+                metric_rollups, metric_rollups.granularity == "hour", metric_rollups.bucket < hourly_cutoff,
+                downsample=_downsample_hourly_metrics,
+            )
+            deleted["system_metric_rollups"] = self._in_batches(
+                metric_rollups, metric_rollups.granularity == "day", metric_rollups.bucket < daily_cutoff
+            )
+            self.freed_pages = self._vacuum()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"Telemetry retention failed: {e}")
+        finally:
+            self.running = False
+        self.runs += 1
+        self.last_run_at = now
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.deleted_rows = deleted
+        self.downsampled_rows = downsampled
+
+    def _in_batches(self, model, *criteria, downsample=None) -> int:
+        """Delete matching rows ``batch_size`` at a time, first passing each
+        batch to ``downsample`` in the same transaction. Returns rows removed."""
+        removed = 0
+        while True:
+            batch = self._batch(model, criteria, downsample)
+            removed += batch
+            if batch < self.batch_size:
+                return removed
+            time.sleep(self.pause)
+
+    @retry_on_busy()
+    def _batch(self, model, criteria, downsample) -> int:
+        with self.session_factory() as db, immediate_transaction(db):
+            if downsample is None:
+                ids = [row_id for (row_id,) in db.query(model.id).filter(*criteria).limit(self.batch_size)]
+            else:
+                rows = db.query(model).filter(*criteria).limit(self.batch_size).all()
+                downsample(db, rows)
+                ids = [row.id for row in rows]
+            if ids:
+                db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        return len(ids)
+
+    def _vacuum(self) -> int:
+        """Return free pages to the OS with ``PRAGMA incremental_vacuum``. Returns pages freed."""
+        with self.session_factory() as db:
+            engine = db.get_bind()
+        with engine.connect() as connection:
+            before = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != AUTO_VACUUM_INCREMENTAL:
+                # Files created before incremental mode need one full VACUUM to switch
+                if not self.full_vacuum:
+                    if not self._warned_full_vacuum:
+                        logging.warning(
+                            "The telemetry database is not in incremental auto-vacuum mode, so freed pages "
+                            "stay in the file. Set RETENTION_FULL_VACUUM=1 for one run to convert it."
+                        )
+                        self._warned_full_vacuum = True
+                    return 0
+                logging.info("Switching the telemetry database to incremental auto-vacuum")
+                connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                connection.exec_driver_sql("VACUUM")
+            # 0 frees the whole freelist. The pragma frees one page per step and
+            # sqlite3's execute() steps only once, so run it as a script.
+            connection.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({max(self.vacuum_pages, 0)});"
+            )
+            after = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return before - after
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "running": self.running,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "deleted_rows": self.deleted_rows,
+            "downsampled_rows": self.downsampled_rows,
+            "freed_pages": self.freed_pages,
+            "last_error": self.last_error,
+        }
+
+
+retention_job = RetentionJob()
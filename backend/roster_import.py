@@ -0,0 +1,287 @@
+import codecs
+import csv
+import hashlib
+import io
+import os
+import time
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import openpyxl
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import immediate_transaction, retry_on_busy
+from .student_index import TRACKED_OPTION, track_changes
+
+# Students written per transaction; the write lock is held for one chunk at a time
+ROSTER_IMPORT_CHUNK = int(os.getenv("ROSTER_IMPORT_CHUNK", "1000"))
+
+# Rejected rows, and students of each kind in the diff, described in the
+# result; the rest are only counted
+MAX_REPORTED_ROWS = 20
+
+# Sheet layout, header in row 1:
+# รหัส(0), คำนำหน้า(1), ชื่อ(2), นามสกุล(3), ห้อง(4), เลขที่(5)
+COLUMNS = 6
+
+# Excel workbooks, or the same columns as delimited text
+WORKBOOK_EXTENSIONS = (".xlsx", ".xls")
+TEXT_EXTENSIONS = (".csv", ".tsv", ".txt")
+
+# Bytes read to tell UTF-8 from TIS-620
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+Checkpoint = Callable[[Session, "ImportResult"], None]
+
+
+class ImportCancelled(Exception):
+    """Raised by a ``checkpoint`` to stop an import; that chunk is rolled back."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows_read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rejected = 0
+        self.missing = 0
+        self.errors: List[str] = []
+        # The first few students of each kind, for the diff report
+        self.samples: Dict[str, List[dict]] = {"added": [], "changed": [], "missing": []}
+        self.chunks = 0
+        self.longest_chunk_ms = 0.0
+
+    def reject(self, row_number: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ROWS:
+            self.errors.append(f"แถว {row_number}: {reason}")
+
+    def sample(self, kind: str, student: dict):
+        if len(self.samples[kind]) < MAX_REPORTED_ROWS:
+            self.samples[kind].append(student)
+
+
+def content_hash(name: Optional[str], classroom: Optional[str], sequence: Optional[int]) -> bytes:
+    """Fingerprint of the fields an import writes, so stored students are compared without keeping their values."""
+    text = "\x1f".join((name or "", classroom or "", "" if sequence is None else str(sequence)))
+    return hashlib.blake2b(text.encode(), digest_size=8).digest()
+
+
+def read_workbook_rows(file: BinaryIO) -> Iterator[tuple]:
+    """Data rows of the first sheet, parsed as they are read rather than loaded whole."""
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(min_row=2, values_only=True)
+    finally:
+        workbook.close()
+
+
+def detect_encoding(sample: bytes) -> str:
+    """UTF-8, with or without a BOM, else Thai Windows' TIS-620."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Not final: the sample may end partway through a character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        # cp874 is TIS-620 plus the punctuation Windows adds in 0x80-0x9F
+        return "cp874"
+
+
+def read_text_rows(file: BinaryIO, delimiter: Optional[str] = None) -> Iterator[tuple]:
+    """Data rows of a CSV or TSV file, decoded and split as they are read.
+
+    Without a ``delimiter``, a header with more tabs than commas is read as TSV.
+    """
+    sample = file.read(ENCODING_SAMPLE_BYTES)
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding=detect_encoding(sample), newline="")
+    try:
+        header = text.readline()
+        if delimiter is None:
+            delimiter = "\t" if header.count("\t") > header.count(",") else ","
+        for row in csv.reader(text, delimiter=delimiter):
+            yield tuple(row)
+    finally:
+        text.detach()  # the caller closes the file
+
+
+def read_roster_rows(file: BinaryIO, filename: str) -> Iterator[tuple]:
+    """Data rows of an uploaded roster, read according to its extension."""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension == ".tsv":
+        return read_text_rows(file, "\t")
+    if extension in TEXT_EXTENSIONS:
+        return read_text_rows(file)
+    return read_workbook_rows(file)
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    # Student numbers typed into a numeric cell come back as 65001.0
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_row(row: tuple) -> Tuple[Optional[dict], Optional[str]]:
+    """``(student, None)`` for a usable row, ``(None, reason)`` for a bad one, ``(None, None)`` for a blank one."""
+    if not any(_cell_text(value) for value in row or ()):
+        return None, None
+    code, prefix, first_name, last_name, classroom, sequence = (tuple(row) + (None,) * COLUMNS)[:COLUMNS]
+    number = _cell_text(code)
+    first_name = _cell_text(first_name)
+    if not number:
+        return None, "ไม่มีรหัสนักเรียน"
+    if not first_name:
+        return None, f"ไม่มีชื่อของรหัส {number}"
+
+    sequence_number = None
+    if _cell_text(sequence):
+        try:
+            sequence_number = int(float(_cell_text(sequence)))
+        except ValueError:
+            pass
+
+    return {
+        # Stored as [Prefix][First Name] [Last Name]
+        "number": number,
+        "name": f"{_cell_text(prefix)}{first_name} {_cell_text(last_name)}".strip(),
+        "classroom": _cell_text(classroom),
+        "sequence": sequence_number,
+    }, None
+
+
+@retry_on_busy()
+def _write_chunk(db: Session, students: List[dict], checkpoint: Optional[Checkpoint], result: ImportResult):
+    statement = insert(models.Student)
+    # An upsert, so a number added since the preload updates instead of failing
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.Student.number],
+        set_={
+            "name": statement.excluded.name,
+            "classroom": statement.excluded.classroom,
+            "sequence": statement.excluded.sequence,
+        },
+    ).returning(
+        models.Student.id, models.Student.number, models.Student.name, models.Student.classroom, models.Student.sequence
+    ).execution_options(**{TRACKED_OPTION: True})
+    with immediate_transaction(db):
+        if students:
+            # The search index takes just these rows instead of reloading the roster
+            track_changes(db, db.execute(statement, students).all())
+        if checkpoint is not None:
+            checkpoint(db, result)
+
+
+def _describe_samples(db: Session, result: ImportResult, dry_run: bool):
+    """Fill in stored values for the reported missing students and, before a write, the changed ones."""
+    wanted = {student["number"]: student for student in result.samples["missing"]}
+    if dry_run:
+        wanted.update((student["number"], student) for student in result.samples["changed"])
+    if not wanted:
+        return
+    for student in db.query(models.Student).filter(models.Student.number.in_(list(wanted))):
+        stored = {"name": student.name, "classroom": student.classroom, "sequence": student.sequence}
+        sample = wanted[student.number]
+        if "name" in sample:
+            sample["before"] = stored
+        else:
+            sample.update(stored)
+    db.rollback()
+
+
+def import_roster(
+    db: Session,
+    rows: Iterable[tuple],
+    chunk_size: int = ROSTER_IMPORT_CHUNK,
+    result: Optional[ImportResult] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    dry_run: bool = False,
+) -> ImportResult:
+    """Insert new students and update changed ones from roster ``rows``.
+
+    The diff is worked out in one pass over the file against a dict of
+    student number to ``content_hash`` of the stored row, loaded with a
+    single query. Only added and changed students are written, ``chunk_size``
+    rows of the file at a time, each chunk in one short transaction; with
+    ``dry_run`` nothing is written. Students missing from the file are
+    counted and reported, never deleted.
+
+    ``checkpoint(db, result)`` runs inside every chunk's transaction, so
+    progress it records commits together with the students it describes.
+    Passing a ``result`` from an interrupted import resumes it: the first
+    ``result.rows_read`` rows were already applied and are only read again
+    to recognise numbers repeated later in the file.
+    """
+    result = result or ImportResult()
+    existing: Dict[str, bytes] = {
+        number: content_hash(name, classroom, sequence)
+        for number, name, classroom, sequence in db.query(
+            models.Student.number, models.Student.name, models.Student.classroom, models.Student.sequence
+        )
+    }
+    db.rollback()  # end the read transaction; each chunk takes the write lock itself
+    applied = result.rows_read
+    result.rows_read = 0
+    seen = set()
+    pending: List[dict] = []
+
+    def flush():
+        if not pending and checkpoint is None:
+            return
+        started = time.perf_counter()
+        _write_chunk(db, pending, checkpoint, result)
+        if pending:
+            result.chunks += 1
+        result.longest_chunk_ms = max(result.longest_chunk_ms, round((time.perf_counter() - started) * 1000, 2))
+        pending.clear()
+
+    for row in rows:
+        if result.rows_read > applied and result.rows_read % chunk_size == 0:
+            flush()
+        result.rows_read += 1
+        row_number = result.rows_read + 1  # after the header row
+        student, reason = parse_row(row)
+        if result.rows_read <= applied:
+            if student is not None:
+                seen.add(student["number"])
+            continue
+        if student is None:
+            if reason:
+                result.reject(row_number, reason)
+            continue
+        number = student["number"]
+        if number in seen:
+            result.reject(row_number, f"รหัส {number} ซ้ำในไฟล์")
+            continue
+        seen.add(number)
+
+        stored = existing.get(number)
+        if stored == content_hash(student["name"], student["classroom"], student["sequence"]):
+            result.unchanged += 1
+            continue
+        if stored is None:
+            result.inserted += 1
+            result.sample("added", student)
+        else:
+            result.updated += 1
+            result.sample("changed", dict(student))
+        if not dry_run:
+            pending.append(student)
+
+    # Reported with the last chunk, so a finished job's progress includes it
+    result.missing = 0
+    result.samples["missing"] = []
+    for number in existing:
+        if number in seen:
+            continue
+        result.missing += 1
+        result.sample("missing", {"number": number})
+    _describe_samples(db, result, dry_run)
+    flush()
+    return result
@@ -1,22 +1,29 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, BackgroundTasks, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-import openpyxl
 import io
 import os  # Added for log file reading
 
-from .. import models, schemas
+from .. import metrics, models, schemas, telemetry
 from ..auth import authenticate_admin, create_access_token, get_current_admin, get_current_superuser, get_password_hash, verify_password
-from ..database import get_db
+from ..database import get_db, get_telemetry_db
 from ..env_settings import mail_settings_complete, serialize_mail_settings, write_mail_settings
-from ..mail_service import send_waitlist_promoted_email, waitlist_mail_ready
+from ..import_jobs import import_worker, job_state
+from ..mail_service import queue_mail, send_waitlist_promoted_email, waitlist_mail_ready
+from ..request_log import request_log
+from ..retention import retention_job
+from ..roster_import import TEXT_EXTENSIONS, WORKBOOK_EXTENSIONS
+from ..reservations import release_seat, seat_update
+from ..singleflight import single_flight
+from ..student_listing import DEFAULT_SORT, MAX_PAGE_SIZE, SORTS, count_students, list_students
+from ..student_search import search_students as find_students
 from ..utils import log_action
 from ..websocket_manager import manager
 import asyncio
 from datetime import datetime, timedelta
-from sqlalchemy import func, case
+from sqlalchemy import func
 import csv
 import io
 from fastapi.responses import StreamingResponse
@@ -260,7 +267,7 @@ def create_activity(
     db.commit()
     db.refresh(activity)
     log_action(db, admin.username, "CREATE_ACTIVITY", f"Created activity: {activity.title}", request)
-    background_tasks.add_task(manager.broadcast, "update_activities")
+    background_tasks.add_task(manager.broadcast_activities_changed)
 
     return schemas.Activity(
         id=activity.id,
@@ -331,7 +338,7 @@ def update_activity(
     db.commit()
     db.refresh(activity)
     log_action(db, admin.username, "UPDATE_ACTIVITY", f"Updated activity: {activity.title}", request)
-    background_tasks.add_task(manager.broadcast, "update_activities")
+    background_tasks.add_task(manager.broadcast_activities_changed)
 
     registered = len(activity.registrations)
     remaining = max(activity.max_people - registered, 0)
@@ -370,7 +377,7 @@ def toggle_activity_status(
     db.commit()
     db.refresh(activity)
     log_action(db, admin.username, "TOGGLE_ACTIVITY", f"Toggled status of '{activity.title}' to {activity.status}", request)
-    background_tasks.add_task(manager.broadcast, "update_activities")
+    background_tasks.add_task(manager.broadcast_activities_changed)
 
     registered = len(activity.registrations)
     remaining = max(activity.max_people - registered, 0)
@@ -409,7 +416,7 @@ def delete_activity(
     db.delete(activity)
     db.commit()
     log_action(db, admin.username, "DELETE_ACTIVITY", f"Deleted activity: {title}", request)
-    background_tasks.add_task(manager.broadcast, "update_activities")
+    background_tasks.add_task(manager.broadcast_activities_changed)
     return
 
 
@@ -439,42 +446,27 @@ def delete_registration(
     if not reg:
         raise HTTPException(status_code=404, detail="ไม่พบข้อมูลการลงทะเบียน")
     
-    was_registered = (reg.status == "registered")
     activity = reg.activity
 
     details = f"Removed Student {reg.student.number} ({reg.student.name}) from activity ID {reg.activity_id} ({reg.activity.title})"
-    db.delete(reg)
-    db.commit()
-
-    if was_registered:
-        # Promote next in line if any
-        next_in_line = (
-             db.query(models.Registration)
-             .filter(
-                 models.Registration.activity_id == activity.id,
-                 models.Registration.status == "waitlisted"
-             )
-             .order_by(models.Registration.timestamp.asc())
-             .first()
-        )
-        if next_in_line:
-            next_in_line.status = "registered"
-            db.commit()
-            if next_in_line.contact_email and waitlist_mail_ready():
-                background_tasks.add_task(
-                    send_waitlist_promoted_email,
-                    next_in_line.contact_email,
-                    next_in_line.student.name,
-                    activity.title,
-                    next_in_line.team_name,
-                )
-            try:
-                log_action(db, "SYSTEM", "PROMOTE", f"Promoted student.id={next_in_line.student_id} to registered for '{activity.title}' via ADMIN removal", request)
-            except:
-                pass
+    next_in_line = release_seat(db, reg)
+    if next_in_line:
+        if next_in_line.contact_email and waitlist_mail_ready():
+            queue_mail(
+                background_tasks,
+                send_waitlist_promoted_email,
+                next_in_line.contact_email,
+                next_in_line.student.name,
+                activity.title,
+                next_in_line.team_name,
+            )
+        try:
+            log_action(db, "SYSTEM", "PROMOTE", f"Promoted student.id={next_in_line.student_id} to registered for '{activity.title}' via ADMIN removal", request)
+        except:
+            pass
 
     log_action(db, admin.username, "DELETE_REGISTRATION", details, request)
-    background_tasks.add_task(manager.broadcast, "update_activities")
+    background_tasks.add_task(manager.broadcast_seats, *seat_update(db, [activity.id]))
     return
 
 
@@ -484,18 +476,11 @@ def search_students(
     db: Session = Depends(get_db),
     admin: models.Admin = Depends(get_current_admin),
 ):
-    students = (
-        db.query(models.Student)
-        .filter(
-            (models.Student.name.contains(q))
-            | (models.Student.classroom.contains(q))
-        )
-        .all()
-    )
-    return students
+    return find_students(db, q, ("name", "classroom"))
 
 
 @router.get("/api/dashboard", response_model=schemas.DashboardStats)
+@single_flight(ttl=2, versioned=True)
 def dashboard_stats(
     db: Session = Depends(get_db), admin: models.Admin = Depends(get_current_admin)
 ):
@@ -530,6 +515,7 @@ def dashboard_stats(
 
 
 @router.get("/api/analytics", response_model=schemas.AnalyticsData)
+@single_flight(ttl=2, versioned=True)
 def analytics_data(
     db: Session = Depends(get_db), admin: models.Admin = Depends(get_current_admin)
 ):
@@ -579,75 +565,73 @@ def analytics_data(
     return schemas.AnalyticsData(trend=trend, groups=groups, classrooms=classrooms)
 
 
-@router.post("/api/import_students", response_model=schemas.MessageResponse)
+@router.post("/api/import_students", response_model=schemas.ImportJob, status_code=status.HTTP_202_ACCEPTED)
 def import_students(
     request: Request,
     file: UploadFile = File(...),
+    dry_run: bool = False,
     db: Session = Depends(get_db),
     admin: models.Admin = Depends(get_current_admin),
 ):
-    if not file.filename.endswith((".xlsx", ".xls")):
-        raise HTTPException(status_code=400, detail="กรุณาอัปโหลดไฟล์ Excel (.xlsx หรือ .xls)")
+    if not file.filename.lower().endswith(WORKBOOK_EXTENSIONS + TEXT_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="กรุณาอัปโหลดไฟล์ Excel (.xlsx หรือ .xls) หรือ CSV (.csv, .tsv หรือ .txt)")
 
+    # Imported in the background (import_jobs.py); progress is published on
+    # the import:<id> WebSocket topic and at /api/import_jobs/<id>. A dry run
+    # only reports the diff, and /apply imports it afterwards.
     try:
-        contents = file.file.read()
-        wb = openpyxl.load_workbook(io.BytesIO(contents))
-        sheet = wb.active
-
-        # Assume header is in row 1: Code, Prefix, Name, Surname, Classroom, Sequence
-        # รหัส, คำนำหน้า, ชื่อ, สกุล, ห้อง, เลขที่
-        imported_count = 0
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            # Format: รหัส(0), คำนำหน้า(1), ชื่อ(2), นามสกุล(3), ห้อง(4), เลขที่(5)
-            if not row or len(row) < 1:
-                continue
-            
-            # Use safe padding to handle rows with fewer columns
-            data = (list(row) + [None] * 6)[:6]
-            code, prefix, first_name, last_name, classroom, sequence_val = data
-            
-            if not code or not first_name:
-                continue
-            
-            # Combine name for storage: [Prefix][First Name] [Last Name]
-            full_name = f"{prefix or ''}{first_name} {last_name or ''}".strip()
-            student_number = str(code).strip()
-            classroom_name = str(classroom).strip() if classroom else ""
-            
-            # Parse Sequence
-            sequence_num = None
-            if sequence_val:
-                try:
-                    sequence_num = int(float(str(sequence_val).strip()))
-                except ValueError:
-                    pass
-
-            # Check if student exists
-            existing = db.query(models.Student).filter(models.Student.number == student_number).first()
-            if existing:
-                existing.name = full_name
-                existing.classroom = classroom_name
-                existing.sequence = sequence_num
-            else:
-                new_student = models.Student(
-                    number=student_number,
-                    name=full_name,
-                    classroom=classroom_name,
-                    sequence=sequence_num
-                )
-                db.add(new_student)
-            
-            imported_count += 1
-
-        db.commit()
-        log_action(db, admin.username, "IMPORT_STUDENTS", f"Imported {imported_count} students", request)
-        return schemas.MessageResponse(
-            success=True, message=f"นำเข้าข้อมูลนักเรียนสำเร็จ {imported_count} คน"
-        )
+        job = import_worker.submit(db, file.file, file.filename, admin.username, dry_run)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"เกิดข้อผิดพลาดในการนำเข้าข้อมูล: {str(e)}")
 
+    action = "PREVIEW_IMPORT_STUDENTS" if dry_run else "QUEUE_IMPORT_STUDENTS"
+    log_action(db, admin.username, action, f"{file.filename} (job {job.id})", request)
+    return job_state(job)
+
+
+@router.get("/api/import_jobs/{job_id}", response_model=schemas.ImportJob)
+def get_import_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    admin: models.Admin = Depends(get_current_admin),
+):
+    job = db.get(models.ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนำเข้าข้อมูล")
+    return job_state(job)
+
+
+@router.post("/api/import_jobs/{job_id}/apply", response_model=schemas.ImportJob)
+def apply_import_job(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: models.Admin = Depends(get_current_admin),
+):
+    try:
+        job = import_worker.apply(db, job_id)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="นำเข้าได้เฉพาะงานตรวจสอบข้อมูลที่เสร็จแล้วเท่านั้น")
+    if not job:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนำเข้าข้อมูล")
+    log_action(db, admin.username, "QUEUE_IMPORT_STUDENTS", f"{job.filename} (job {job_id}, previewed)", request)
+    return job_state(job)
+
+
+@router.post("/api/import_jobs/{job_id}/cancel", response_model=schemas.ImportJob)
+def cancel_import_job(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin: models.Admin = Depends(get_current_admin),
+):
+    job = import_worker.cancel(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนำเข้าข้อมูล")
+    log_action(db, admin.username, "CANCEL_IMPORT_STUDENTS", f"Job {job_id}", request)
+    return job_state(job)
+
 
 @router.get("/api/students", response_model=List[schemas.Student])
 def admin_list_students(
@@ -657,6 +641,42 @@ def admin_list_students(
     return db.query(models.Student).all()
 
 
+@router.get("/api/students/table", response_model=schemas.StudentTable)
+def admin_student_table(
+    request: Request,
+    draw: int = 0,
+    start: int = Query(0, ge=0),
+    length: int = 25,
+    search: str = Query("", alias="search[value]"),
+    order_column: Optional[int] = Query(None, alias="order[0][column]"),
+    order_dir: str = Query("asc", alias="order[0][dir]"),
+    classroom: Optional[str] = None,
+    after: Optional[str] = None,
+    db: Session = Depends(get_db),
+    admin: models.Admin = Depends(get_current_admin),
+):
+    # DataTables server-side processing: the page sends its own parameters,
+    # plus ``after``, the ``next`` cursor of the page before when moving on
+    sort = request.query_params.get(f"columns[{order_column}][data]")
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    limit = MAX_PAGE_SIZE if length < 0 else min(max(length, 1), MAX_PAGE_SIZE)
+    search = search.strip()
+    try:
+        students, cursor = list_students(
+            db, sort, order_dir == "desc", classroom, search, after, start, limit
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ตำแหน่งหน้าไม่ถูกต้อง กรุณาโหลดหน้าใหม่")
+    return schemas.StudentTable(
+        draw=draw,
+        recordsTotal=count_students(db),
+        recordsFiltered=count_students(db, classroom, search),
+        data=students,
+        next=cursor,
+    )
+
+
 @router.put("/api/students/{student_id}", response_model=schemas.Student)
 def update_student(
     student_id: int,
@@ -719,9 +739,9 @@ def bulk_update_classroom(
     db: Session = Depends(get_db),
     admin: models.Admin = Depends(get_current_admin),
 ):
-    db.query(models.Student).filter(models.Student.id.in_(payload.ids)).update(
-        {models.Student.classroom: payload.classroom}, synchronize_session=False
-    )
+    # Through the ORM, so the student search index picks up each change
+    for student in db.query(models.Student).filter(models.Student.id.in_(payload.ids)):
+        student.classroom = payload.classroom
     db.commit()
     log_action(db, admin.username, "BULK_UPDATE_CLASS", f"Updated {len(payload.ids)} students to {payload.classroom}", request)
     return schemas.MessageResponse(success=True, message=f"อัปเดตห้องเรียนสำเร็จ {len(payload.ids)} รายการ")
@@ -761,7 +781,7 @@ def create_announcement(
     db.commit()
     db.refresh(ann)
     log_action(db, admin.username, "CREATE_ANNOUNCEMENT", f"Created announcement", request)
-    background_tasks.add_task(manager.broadcast, "update_announcements")
+    background_tasks.add_task(manager.broadcast_announcements)
     return ann
 
 
@@ -785,7 +805,7 @@ def update_announcement(
     db.commit()
     db.refresh(ann)
     log_action(db, admin.username, "UPDATE_ANNOUNCEMENT", f"Updated announcement ID {ann.id}", request)
-    background_tasks.add_task(manager.broadcast, "update_announcements")
+    background_tasks.add_task(manager.broadcast_announcements)
     return ann
 
 
@@ -804,14 +824,14 @@ def delete_announcement(
     db.delete(ann)
     db.commit()
     log_action(db, admin.username, "DELETE_ANNOUNCEMENT", f"Deleted announcement ID {ann_id}", request)
-    background_tasks.add_task(manager.broadcast, "update_announcements")
+    background_tasks.add_task(manager.broadcast_announcements)
     return
 
 # --- Platform Status Endpoints ---
 
 @router.get("/api/platform/status", response_model=schemas.PlatformStatus)
 def get_platform_status(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_telemetry_db),
     admin: models.Admin = Depends(get_current_admin)
 ):
     now = datetime.now()
@@ -822,13 +842,9 @@ def get_platform_status(
     if os.path.exists("sicday.db"):
         db_size = os.path.getsize("sicday.db")
         
-    # Stats for last 24h
-    logs_count = db.query(models.RequestLog).filter(models.RequestLog.timestamp >= day_ago).count()
-    avg_resp = db.query(func.avg(models.RequestLog.response_time_ms)).filter(models.RequestLog.timestamp >= day_ago).scalar() or 0.0
-    error_count = db.query(models.RequestLog).filter(
-        models.RequestLog.timestamp >= day_ago,
-        models.RequestLog.status_code >= 400
-    ).count()
+    # Stats for last 24h, from the per-minute rollups
+    logs_count, error_count, latency_sum = telemetry.totals_since(db, "minute", day_ago)
+    avg_resp = (latency_sum / logs_count) if logs_count > 0 else 0.0
     error_rate = (error_count / logs_count * 100) if logs_count > 0 else 0.0
     
     # Uptime % (Based on 5-min metrics in last 24h)
@@ -850,82 +866,99 @@ def get_platform_status(
         uptime_percent=min(round(uptime, 2), 100.0),
         total_requests_24h=logs_count,
         avg_response_time_24h=round(avg_resp, 2),
-        error_rate_24h=round(error_rate, 2)
+        error_rate_24h=round(error_rate, 2),
+        websocket=schemas.WebSocketStats(**manager.stats()),
+        request_log=schemas.RequestLogStats(**request_log.stats()),
+        latency=schemas.LatencySummary(**telemetry.route_latencies.overall()),
+        latency_since=telemetry.route_latencies.since,
+        retention=schemas.RetentionStats(**retention_job.stats()),
     )
 
 @router.get("/api/platform/metrics", response_model=schemas.DetailedMetrics)
+@single_flight(key=("days",), ttl=5)
 def get_platform_metrics(
     days: int = 7,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_telemetry_db),
     admin: models.Admin = Depends(get_current_admin)
 ):
     now = datetime.now()
     start_date = now - timedelta(days=days)
     
     # Determine grouping (by hour if <= 2 days, by day if more)
+    rollup = models.RequestRollup
+    metric_rollup = models.SystemMetricRollup
     if days <= 2:
-        group_func = func.strftime('%Y-%m-%d %H:00', models.RequestLog.timestamp)
+        group_func = func.strftime('%Y-%m-%d %H:00', rollup.bucket)
         metric_group_func = func.strftime('%Y-%m-%d %H:00', models.SystemMetric.timestamp)
+        metric_rollup_group_func = func.strftime('%Y-%m-%d %H:00', metric_rollup.bucket)
     else:
-        group_func = func.date(models.RequestLog.timestamp)
+        group_func = func.date(rollup.bucket)
         metric_group_func = func.date(models.SystemMetric.timestamp)
+        metric_rollup_group_func = func.date(metric_rollup.bucket)
 
-    # Request Trend
-    req_trend = (
-        db.query(group_func.label("label"), func.count(models.RequestLog.id).label("value"))
-        .filter(models.RequestLog.timestamp >= start_date)
-        .group_by("label")
-        .order_by("label")
-        .all()
-    )
-    
-    # Response Time Trend
-    resp_trend = (
-        db.query(group_func.label("label"), func.avg(models.RequestLog.response_time_ms).label("value"))
-        .filter(models.RequestLog.timestamp >= start_date)
-        .group_by("label")
-        .order_by("label")
-        .all()
+    # Request, response time and error rate trends, from the per-hour rollups
+    # (and the per-day ones retention leaves behind for older periods)
+    hourly_since_start = (
+        rollup.granularity.in_(("hour", "day")),
+        rollup.bucket >= telemetry.bucket_start(start_date, "hour"),
     )
-    
-    # Error Rate Trend
-    error_trend_raw = (
+    trend_rows = (
         db.query(
-            group_func.label("label"), 
-            func.count(models.RequestLog.id).label("total"),
-            func.sum(case((models.RequestLog.status_code >= 400, 1), else_=0)).label("errors")
+            group_func.label("label"),
+            func.sum(rollup.count).label("total"),
+            func.sum(rollup.error_count).label("errors"),
+            func.sum(rollup.latency_sum_ms).label("latency_sum"),
         )
-        .filter(models.RequestLog.timestamp >= start_date)
+        .filter(*hourly_since_start)
         .group_by("label")
         .order_by("label")
         .all()
     )
+    req_trend = []
+    resp_trend = []
     error_trend = []
-    for r in error_trend_raw:
+    for r in trend_rows:
+        req_trend.append(schemas.GenericTrendPoint(label=r.label, value=float(r.total)))
+        resp_trend.append(schemas.GenericTrendPoint(label=r.label, value=round(r.latency_sum / r.total, 2) if r.total > 0 else 0.0))
         rate = (r.errors / r.total * 100) if r.total > 0 else 0
         error_trend.append(schemas.GenericTrendPoint(label=r.label, value=round(rate, 2)))
 
-    # DB Size Trend
-    db_size_trend = (
-        db.query(metric_group_func.label("label"), func.avg(models.SystemMetric.value).label("value"))
+    # DB Size Trend: recent raw samples plus the rollups of older ones
+    db_size_samples = {}
+    raw_sizes = (
+        db.query(
+            metric_group_func.label("label"),
+            func.sum(models.SystemMetric.value).label("total"),
+            func.count(models.SystemMetric.value).label("samples"),
+        )
         .filter(models.SystemMetric.metric_type == "db_size", models.SystemMetric.timestamp >= start_date)
         .group_by("label")
-        .order_by("label")
-        .all()
     )
+    rolled_up_sizes = (
+        db.query(
+            metric_rollup_group_func.label("label"),
+            func.sum(metric_rollup.value_sum).label("total"),
+            func.sum(metric_rollup.value_count).label("samples"),
+        )
+        .filter(metric_rollup.metric_type == "db_size", metric_rollup.bucket >= telemetry.bucket_start(start_date, "hour"))
+        .group_by("label")
+    )
+    for r in list(raw_sizes) + list(rolled_up_sizes):
+        total, samples = db_size_samples.get(r.label, (0, 0))
+        db_size_samples[r.label] = (total + (r.total or 0), samples + (r.samples or 0))
 
-    # Endpoint Breakdown
+    # Endpoint Breakdown, by route template
     endpoint_stats = (
         db.query(
-            models.RequestLog.path,
-            models.RequestLog.method,
-            func.count(models.RequestLog.id).label("count"),
-            func.avg(models.RequestLog.response_time_ms).label("avg_resp"),
-            func.sum(case((models.RequestLog.status_code >= 400, 1), else_=0)).label("errors")
+            rollup.route,
+            rollup.method,
+            func.sum(rollup.count).label("count"),
+            func.sum(rollup.latency_sum_ms).label("latency_sum"),
+            func.sum(rollup.error_count).label("errors")
         )
-        .filter(models.RequestLog.timestamp >= start_date)
-        .group_by(models.RequestLog.path, models.RequestLog.method)
-        .order_by(func.count(models.RequestLog.id).desc())
+        .filter(*hourly_since_start)
+        .group_by(rollup.route, rollup.method)
+        .order_by(func.sum(rollup.count).desc())
         .limit(20)
         .all()
     )
@@ -934,25 +967,30 @@ def get_platform_metrics(
     for e in endpoint_stats:
         rate = (e.errors / e.count * 100) if e.count > 0 else 0
         breakdown.append(schemas.EndpointMetric(
-            path=e.path,
+            path=e.route,
             method=e.method,
             count=e.count,
-            avg_response_time=round(e.avg_resp, 2),
+            avg_response_time=round(e.latency_sum / e.count, 2) if e.count > 0 else 0.0,
             error_rate=round(rate, 2)
         ))
 
     return schemas.DetailedMetrics(
-        request_trend=[schemas.GenericTrendPoint(label=r.label, value=float(r.value)) for r in req_trend],
-        response_time_trend=[schemas.GenericTrendPoint(label=r.label, value=float(r.value)) for r in resp_trend],
+        request_trend=req_trend,
+        response_time_trend=resp_trend,
         error_rate_trend=error_trend,
-        db_size_trend=[schemas.GenericTrendPoint(label=r.label, value=float(r.value or 0)) for r in db_size_trend],
-        endpoint_breakdown=breakdown
+        db_size_trend=[
+            schemas.GenericTrendPoint(label=label, value=round(total / samples, 2) if samples else 0.0)
+            for label, (total, samples) in sorted(db_size_samples.items())
+        ],
+        endpoint_breakdown=breakdown,
+        route_latency=[schemas.RouteLatency(**r) for r in telemetry.route_latencies.routes(limit=50)],
     )
 
 @router.get("/api/platform/export")
+@metrics.EXPORT_DURATION.timed(export="platform_csv")
 def export_platform_status(
     days: int = 30,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_telemetry_db),
     admin: models.Admin = Depends(get_current_admin)
 ):
     start_date = datetime.now() - timedelta(days=days)
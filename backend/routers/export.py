@@ -16,7 +16,7 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
-from .. import models
+from .. import metrics, models
 from ..auth import get_current_admin
 from ..database import get_db
 
@@ -125,6 +125,7 @@ def _add_registration_sheet(wb, activity, regs, title=None):
 
 
 @router.get("/excel")
+@metrics.EXPORT_DURATION.timed(export="registrations_excel")
 def export_excel(
     activity_id: Optional[int] = None,
     db: Session = Depends(get_db),
@@ -187,6 +188,7 @@ def export_excel(
 
 
 @router.get("/pdf")
+@metrics.EXPORT_DURATION.timed(export="registrations_pdf")
 def export_pdf(
     activity_id: Optional[int] = None,
     db: Session = Depends(get_db),
@@ -370,6 +372,7 @@ def export_pdf(
         headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 @router.get("/students/excel")
+@metrics.EXPORT_DURATION.timed(export="students_excel")
 def export_students_excel(
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
@@ -413,6 +416,7 @@ def export_students_excel(
 
 
 @router.get("/students/pdf")
+@metrics.EXPORT_DURATION.timed(export="students_pdf")
 def export_students_pdf(
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
@@ -0,0 +1,28 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy.orm import Session
+
+from .. import metrics
+from ..auth import get_current_admin
+from ..database import get_db
+
+# Static bearer token for scrapers; an admin JWT is accepted as well.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+router = APIRouter()
+
+
+async def require_metrics_access(request: Request, db: Session = Depends(get_db)):
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if METRICS_TOKEN and scheme.lower() == "bearer" and hmac.compare_digest(token, METRICS_TOKEN):
+        return
+    # Raises 401 unless the token is a valid admin JWT
+    await get_current_admin(token, db)
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_access)])
+def prometheus_metrics():
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
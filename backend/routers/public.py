@@ -1,17 +1,31 @@
 from typing import List
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, BackgroundTasks
+from pydantic import TypeAdapter
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from .. import models, schemas
+from ..activity_cache import activity_snapshots, etag_matches
 from ..database import get_db
 from ..env_settings import is_valid_email, normalize_email
 from ..mail_service import (
+    queue_mail,
     send_waitlist_confirmation_email,
     send_waitlist_promoted_email,
     waitlist_mail_ready,
 )
+from ..reservations import (
+    SeatReservationError,
+    count_registrations,
+    release_seat,
+    reserve_seats,
+    seat_counts_subquery,
+    seat_update,
+)
+from ..student_index import STUDENT_SEARCH_INDEX, student_index
+from ..student_search import search_students as find_students
 from ..utils import log_action
 from ..websocket_manager import manager
 import asyncio
@@ -23,15 +37,10 @@ router = APIRouter()
 def search_students(q: str, db: Session = Depends(get_db)):
     if len(q) < 2:
         return []
-    students = (
-        db.query(models.Student)
-        .filter(
-            (models.Student.name.contains(q)) | 
-            (models.Student.number.contains(q))
-        )
-        .limit(10)
-        .all()
-    )
+    # Answered from memory once the index is loaded; SQLite until then
+    students = student_index.search(db, q, limit=10) if STUDENT_SEARCH_INDEX else None
+    if students is None:
+        students = find_students(db, q, ("name", "number"), limit=10)
     return students
 
 
@@ -45,12 +54,33 @@ def get_active_announcements(db: Session = Depends(get_db)):
     )
 
 
+_activity_list_adapter = TypeAdapter(List[schemas.Activity])
+
+
 @router.get("/activities", response_model=List[schemas.Activity])
-def list_activities(db: Session = Depends(get_db)):
-    # Only show activities where group is visible (or no group)
-    activities = (
-        db.query(models.Activity)
-        .outerjoin(models.ActivityGroup)
+def list_activities(request: Request, db: Session = Depends(get_db)):
+    # Served from a snapshot that is rebuilt once per data version
+    body, etag = activity_snapshots.get(
+        lambda: _activity_list_adapter.dump_json(query_public_activities(db))
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def query_public_activities(db: Session) -> List[schemas.Activity]:
+    # One statement: activities + group names + seat counts grouped per activity
+    counts = seat_counts_subquery(db)
+    rows = (
+        db.query(
+            models.Activity,
+            models.ActivityGroup.name,
+            func.coalesce(counts.c.registered, 0),
+        )
+        .outerjoin(models.ActivityGroup, models.Activity.group_id == models.ActivityGroup.id)
+        .outerjoin(counts, counts.c.activity_id == models.Activity.id)
+        # Only show activities where group is visible (or no group)
         .filter(
             models.Activity.status == "open",
             (models.ActivityGroup.is_visible == True) | (models.Activity.group_id == None)
@@ -58,9 +88,7 @@ def list_activities(db: Session = Depends(get_db)):
         .all()
     )
     result = []
-    for a in activities:
-        registered = len([r for r in a.registrations if r.status == "registered"])
-        waitlisted = len([r for r in a.registrations if r.status == "waitlisted"])
+    for a, group_name, registered in rows:
         remaining = max(a.max_people - registered, 0)
         result.append(
             schemas.Activity(
@@ -74,7 +102,7 @@ def list_activities(db: Session = Depends(get_db)):
                 end_time=a.end_time,
                 color=a.color,
                 group_id=a.group_id,
-                group_name=a.group.name if a.group else None,
+                group_name=group_name,
                 registered_count=registered,
                 remaining_seats=remaining,
                 type=a.type,
@@ -154,28 +182,7 @@ def register_student(payload: schemas.RegistrationCreate, request: Request, back
             if partner.id not in [m.id for m in members]:
                 members.append(partner)
 
-    # 4. Capacity & Waitlist Check
-    registered_count = (
-        db.query(models.Registration)
-        .filter(
-            models.Registration.activity_id == activity.id,
-            models.Registration.status == "registered"
-        )
-        .count()
-    )
-    
-    is_waitlisted = False
-    if registered_count + len(members) > activity.max_people:
-         is_waitlisted = True
-
-    if is_waitlisted and not normalized_email:
-        return schemas.MessageResponse(
-            success=False,
-            message="กิจกรรมเต็มแล้ว กรุณากรอกอีเมลเพื่อรับการยืนยันการเข้าคิวสำรอง",
-            remaining_seats=None,
-        )
-
-    # 5. Validation Loop for ALL members
+    # 4. Validation Loop for ALL members
     for member in members:
         # Duplicate registration
         existing = (
@@ -244,22 +251,15 @@ def register_student(payload: schemas.RegistrationCreate, request: Request, back
                     remaining_seats=None,
                 )
 
-    # 6. Commit Registrations
+    # 5. Reserve seats (capacity check and insert share one write lock)
     team_name_val = payload.team_name if (activity.type == "team" and payload.team_name) else None
-    
-    current_status = "waitlisted" if is_waitlisted else "registered"
-    
-    for member in members:
-        reg = models.Registration(
-            student_id=member.id,
-            activity_id=activity.id,
-            team_name=team_name_val,
-            contact_email=normalized_email if is_waitlisted else None,
-            status=current_status,
-        )
-        db.add(reg)
 
-    db.commit()
+    try:
+        reservation = reserve_seats(db, activity, members, team_name_val, normalized_email)
+    except SeatReservationError as e:
+        return schemas.MessageResponse(success=False, message=str(e), remaining_seats=None)
+
+    is_waitlisted = reservation.status == "waitlisted"
 
     # Log action
     try:
@@ -270,17 +270,13 @@ def register_student(payload: schemas.RegistrationCreate, request: Request, back
     except Exception as e:
         print(f"Public log failed: {e}")
 
-    background_tasks.add_task(manager.broadcast, "update_activities")
-
-    remaining = activity.max_people - (registered_count + len(members)) if not is_waitlisted else 0
+    background_tasks.add_task(manager.broadcast_seats, *seat_update(db, [activity.id]))
 
     if is_waitlisted:
-        q_count = db.query(models.Registration).filter(
-            models.Registration.activity_id == activity.id,
-            models.Registration.status == "waitlisted"
-        ).count()
+        q_count = reservation.waitlist_position
         if normalized_email and waitlist_mail_ready():
-            background_tasks.add_task(
+            queue_mail(
+                background_tasks,
                 send_waitlist_confirmation_email,
                 normalized_email,
                 student.name,
@@ -297,6 +293,7 @@ def register_student(payload: schemas.RegistrationCreate, request: Request, back
             remaining_seats=0
         )
 
+    remaining = activity.max_people - reservation.registered_count
     return schemas.MessageResponse(
         success=True, message="ลงทะเบียนสำเร็จ!", remaining_seats=max(remaining, 0)
     )
@@ -341,38 +338,22 @@ def cancel_registration(payload: schemas.CancelRequest, request: Request, backgr
     if activity.status == "close":
          return schemas.MessageResponse(success=False, message="กิจกรรมปิดแล้ว ไม่สามารถยกเลิกได้", remaining_seats=None)
     
-    was_registered = (reg.status == "registered")
-
-    # 4. Delete
-    db.delete(reg)
-    db.commit()
-    
-    if was_registered:
-        # Promote next in line if any
-        next_in_line = (
-             db.query(models.Registration)
-             .filter(
-                 models.Registration.activity_id == activity.id,
-                 models.Registration.status == "waitlisted"
-             )
-             .order_by(models.Registration.timestamp.asc())
-             .first()
-        )
-        if next_in_line:
-            next_in_line.status = "registered"
-            db.commit()
-            if next_in_line.contact_email and waitlist_mail_ready():
-                background_tasks.add_task(
-                    send_waitlist_promoted_email,
-                    next_in_line.contact_email,
-                    next_in_line.student.name,
-                    activity.title,
-                    next_in_line.team_name,
-                )
-            try:
-                log_action(db, "SYSTEM", "PROMOTE", f"Promoted student.id={next_in_line.student_id} to registered for '{activity.title}'", request)
-            except:
-                pass
+    # 4. Delete and hand the freed seat to the next in line
+    next_in_line = release_seat(db, reg)
+    if next_in_line:
+        if next_in_line.contact_email and waitlist_mail_ready():
+            queue_mail(
+                background_tasks,
+                send_waitlist_promoted_email,
+                next_in_line.contact_email,
+                next_in_line.student.name,
+                activity.title,
+                next_in_line.team_name,
+            )
+        try:
+            log_action(db, "SYSTEM", "PROMOTE", f"Promoted student.id={next_in_line.student_id} to registered for '{activity.title}'", request)
+        except:
+            pass
 
     # Log
     try:
@@ -380,13 +361,10 @@ def cancel_registration(payload: schemas.CancelRequest, request: Request, backgr
     except:
         pass
         
-    background_tasks.add_task(manager.broadcast, "update_activities")
+    background_tasks.add_task(manager.broadcast_seats, *seat_update(db, [activity.id]))
 
     # Get remaining seats
-    count = db.query(models.Registration).filter(
-        models.Registration.activity_id == activity.id,
-        models.Registration.status == "registered"
-    ).count()
+    count = count_registrations(db, activity.id, "registered")
     remaining = max(activity.max_people - count, 0)
     
     return schemas.MessageResponse(
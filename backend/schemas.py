@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -27,6 +27,15 @@ class Student(StudentBase):
     model_config = {"from_attributes": True}
 
 
+class StudentTable(BaseModel):
+    # DataTables server-side processing reply; its field names
+    draw: int
+    recordsTotal: int
+    recordsFiltered: int
+    data: List[Student]
+    next: Optional[str] = None  # cursor for the page after this one
+
+
 class ActivityGroupBase(BaseModel):
     name: str
     quota: int = 3
@@ -189,6 +198,27 @@ class MessageResponse(BaseModel):
     remaining_seats: Optional[int] = None
 
 
+class ImportJob(BaseModel):
+    id: str
+    filename: str
+    status: str  # queued / running / completed / failed / cancelled
+    cancel_requested: bool = False
+    dry_run: bool = False
+    rows_processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: int = 0
+    missing: int = 0
+    errors: List[str] = []  # first rejected rows, e.g. "แถว 12: ไม่มีรหัสนักเรียน"
+    # First students under "added", "changed" (with "before" in a dry run) and "missing"
+    samples: Dict[str, List[dict]] = {}
+    error: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class DashboardStats(BaseModel):
     total_students: int
     total_registrations: int
@@ -271,6 +301,45 @@ class SystemMetric(BaseModel):
 
     model_config = {"from_attributes": True}
 
+class WebSocketStats(BaseModel):
+    published: int = 0
+    coalesced: int = 0
+    emitted: int = 0
+    connected: int = 0
+    queued_messages: int = 0
+    max_queue_depth: int = 0
+    evictions: int = 0
+    bus: str = "local"
+    relayed: int = 0
+
+class RequestLogStats(BaseModel):
+    buffered: int = 0
+    written: int = 0
+    dropped: int = 0
+    batches: int = 0
+
+class LatencySummary(BaseModel):
+    count: int = 0
+    p50: float = 0.0
+    p90: float = 0.0
+    p99: float = 0.0
+    max: float = 0.0
+
+class RouteLatency(LatencySummary):
+    method: str
+    route: str
+    status_class: str
+
+class RetentionStats(BaseModel):
+    runs: int = 0
+    running: bool = False
+    last_run_at: Optional[datetime] = None
+    last_duration_ms: Optional[float] = None
+    deleted_rows: Dict[str, int] = {}
+    downsampled_rows: Dict[str, int] = {}
+    freed_pages: int = 0
+    last_error: Optional[str] = None
+
 class PlatformStatus(BaseModel):
     api_health: str
     db_health: str
@@ -279,6 +348,11 @@ class PlatformStatus(BaseModel):
     total_requests_24h: int
     avg_response_time_24h: float
     error_rate_24h: float
+    websocket: Optional[WebSocketStats] = None
+    request_log: Optional[RequestLogStats] = None
+    latency: Optional[LatencySummary] = None # this worker, since latency_since
+    latency_since: Optional[datetime] = None
+    retention: Optional[RetentionStats] = None
 
 class EndpointMetric(BaseModel):
     path: str
@@ -297,3 +371,4 @@ class DetailedMetrics(BaseModel):
     error_rate_trend: List[GenericTrendPoint]
     db_size_trend: List[GenericTrendPoint]
     endpoint_breakdown: List[EndpointMetric]
+    route_latency: List[RouteLatency] = [] # this worker, since it started
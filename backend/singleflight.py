@@ -0,0 +1,102 @@
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .activity_cache import data_version
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time; concurrent callers share it.
+
+    With ``ttl`` > 0 the result is also reused for that many seconds after it
+    completes, so a burst of refreshes arriving just after still costs nothing.
+    """
+
+    def __init__(self, ttl: float = 0.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self.executed = 0
+        self.shared = 0
+        self.cache_hits = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.cache_hits += 1
+                return cached[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.ttl > 0:
+                    now = time.monotonic()
+                    # Versioned keys never repeat, so drop expired entries as we go
+                    self._results = {k: v for k, v in self._results.items() if v[0] > now}
+                    self._results[key] = (now + self.ttl, call.result)
+            call.done.set()
+        return call.result
+
+    def clear(self):
+        """Drop cached results and reset the counters."""
+        with self._lock:
+            self._results.clear()
+            self.executed = self.shared = self.cache_hits = 0
+
+
+def single_flight(key: Iterable[str] = (), ttl: float = 0.0, versioned: bool = False):
+    """Decorate a sync route so identical concurrent requests share one result.
+
+    ``key`` names the parameters that distinguish requests (query values, not
+    ``db`` or the current admin). With ``versioned`` the activity data version
+    is part of the key, so a cached result never outlives a change to
+    activities, groups or registrations.
+    """
+    key_params = tuple(key)
+
+    def decorator(func):
+        flight = SingleFlight(ttl)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            call_key = tuple(bound.arguments[name] for name in key_params)
+            if versioned:
+                call_key += (data_version.value,)
+            return flight.do(call_key, lambda: func(*args, **kwargs))
+
+        wrapper.single_flight = flight
+        return wrapper
+
+    return decorator
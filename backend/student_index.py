@@ -0,0 +1,238 @@
+import bisect
+import logging
+import os
+import threading
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .activity_cache import DataVersion
+
+# Serve the public as-you-type search from memory; 0 sends every keystroke to SQLite
+STUDENT_SEARCH_INDEX = os.getenv("STUDENT_SEARCH_INDEX", "1") == "1"
+
+# Stripped from the start of names and queries, longest first so that
+# นางสาว is not read as นาง + สาว
+HONORIFICS = ("เด็กหญิง", "เด็กชาย", "นางสาว", "ด.ญ.", "ด.ช.", "น.ส.", "นาง", "นาย")
+
+MIN_QUERY_LENGTH = 2
+
+# Bumped after every commit that changes a student, in this worker or (via
+# the broadcast bus) in another one
+roster_version = DataVersion()
+
+# (id, number, name, classroom, sequence)
+Record = Tuple[int, str, str, Optional[str], Optional[int]]
+
+_CHANGES_KEY = "student_index_changes"
+_BULK_KEY = "student_index_bulk"
+
+# Execution option for a bulk statement whose caller hands the rows it
+# wrote to track_changes(), so the index is updated in place instead of
+# being reloaded
+TRACKED_OPTION = "student_index_tracked"
+
+
+def normalize(text: str) -> str:
+    """Case-folded NFC text with runs of whitespace collapsed and any leading honorific removed."""
+    text = " ".join(unicodedata.normalize("NFC", text).casefold().split())
+    for honorific in HONORIFICS:
+        if text.startswith(honorific):
+            return text[len(honorific):].lstrip()
+    return text
+
+
+def grams(text: str) -> set:
+    """Every 2- and 3-character substring, so any query of two or more has a posting list."""
+    return {text[i:i + n] for n in (2, 3) for i in range(len(text) - n + 1)}
+
+
+class StudentIndex:
+    """The roster in memory for the public as-you-type search.
+
+    Each student is kept as a record plus its normalized name, and every 2-
+    and 3-gram of the name and number maps to a sorted array of student ids.
+    A query walks the shortest posting list of its grams in id order and
+    checks each candidate, so a top-10 answer touches a handful of entries.
+
+    Commits that add, change or delete students through the ORM update the
+    index in place. Anything it cannot follow (bulk ``UPDATE``/``DELETE``
+    statements, changes in another worker) marks it stale; ``search`` then
+    returns None, so the caller queries the database, while one background
+    thread reloads the roster through the caller's engine.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records: Dict[int, Record] = {}
+        self._keys: Dict[int, Tuple[str, str]] = {}
+        self._postings: Dict[str, array] = {}
+        self._version: Optional[int] = None
+        self._building = False
+        self.builds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._version is not None and self._version == roster_version.value
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def search(self, db: Session, q: str, limit: int = 10) -> Optional[List[dict]]:
+        """Students whose name (without honorific) or number contains ``q``, in id order.
+
+        Returns None when the index is not current, after starting a rebuild
+        from ``db``'s database.
+        """
+        if not self.ready:
+            self.rebuild_in_background(db.get_bind())
+            return None
+        q = normalize(q)
+        if len(q) < MIN_QUERY_LENGTH:
+            return []
+        results = []
+        with self._lock:
+            candidates = [self._postings.get(gram) for gram in grams(q)]
+            if not all(candidates):
+                return []
+            for student_id in min(candidates, key=len):
+                name_key, number = self._keys[student_id]
+                if q in name_key or q in number:
+                    results.append(self._records[student_id])
+                    if len(results) == limit:
+                        break
+        return [
+            {"id": r[0], "number": r[1], "name": r[2], "classroom": r[3], "sequence": r[4]}
+            for r in results
+        ]
+
+    def rebuild_in_background(self, bind: Engine):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self.rebuild, args=(bind,), name="student-index", daemon=True).start()
+
+    def rebuild(self, bind: Engine):
+        """Reload the whole roster from the database behind ``bind``."""
+        try:
+            # Changes committed while loading leave the index stale-tagged
+            version = roster_version.value
+            with Session(bind=bind) as db:
+                rows = db.query(
+                    models.Student.id, models.Student.number, models.Student.name,
+                    models.Student.classroom, models.Student.sequence,
+                ).order_by(models.Student.id).all()
+            records, keys, postings = {}, {}, {}
+            for row in rows:
+                record = tuple(row)
+                records[record[0]] = record
+                keys[record[0]] = key = (normalize(record[2]), record[1].casefold())
+                for gram in grams(key[0]) | grams(key[1]):
+                    postings.setdefault(gram, array("i")).append(record[0])
+            with self._lock:
+                self._records, self._keys, self._postings = records, keys, postings
+                self._version = version
+                self.builds += 1
+        except Exception as e:
+            logging.error(f"Error building the student search index: {e}")
+        finally:
+            self._building = False
+
+    def apply(self, changed: Iterable[Record], deleted: Iterable[int]):
+        """Fold one commit's student changes in and bump ``roster_version``."""
+        with self._lock:
+            current = self.ready
+            if current:
+                for student_id in deleted:
+                    self._remove(student_id)
+                for record in changed:
+                    self._remove(record[0])
+                    self._add(record)
+            version = roster_version.bump()
+            if current:
+                self._version = version
+
+    def _add(self, record: Record):
+        student_id = record[0]
+        self._records[student_id] = record
+        self._keys[student_id] = key = (normalize(record[2]), record[1].casefold())
+        for gram in grams(key[0]) | grams(key[1]):
+            posting = self._postings.setdefault(gram, array("i"))
+            posting.insert(bisect.bisect_left(posting, student_id), student_id)
+
+    def _remove(self, student_id: int):
+        key = self._keys.pop(student_id, None)
+        if key is None:
+            return
+        del self._records[student_id]
+        for gram in grams(key[0]) | grams(key[1]):
+            posting = self._postings[gram]
+            del posting[bisect.bisect_left(posting, student_id)]
+            if not posting:
+                del self._postings[gram]
+
+    def clear(self):
+        with self._lock:
+            self._records, self._keys, self._postings = {}, {}, {}
+            self._version = None
+
+
+student_index = StudentIndex()
+
+
+def _record(student: models.Student) -> Record:
+    return (student.id, student.number, student.name, student.classroom, student.sequence)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    # Values are read now: the objects are expired by the time the commit ends
+    for obj in session.new | session.dirty:
+        if isinstance(obj, models.Student):
+            session.info.setdefault(_CHANGES_KEY, {})[obj.id] = _record(obj)
+    for obj in session.deleted:
+        if isinstance(obj, models.Student):
+            session.info.setdefault(_CHANGES_KEY, {})[obj.id] = None
+
+
+def track_changes(session: Session, records: Iterable[Record]):
+    """Apply ``records`` written by a ``TRACKED_OPTION`` statement when ``session`` commits."""
+    changes = session.info.setdefault(_CHANGES_KEY, {})
+    for record in records:
+        changes[record[0]] = tuple(record)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_statements(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    if orm_execute_state.execution_options.get(TRACKED_OPTION):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.local_table.name == models.Student.__tablename__:
+        orm_execute_state.session.info[_BULK_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if session.info.pop(_BULK_KEY, False):
+        # Rows changed by the statement are unknown; start over
+        roster_version.bump()
+    elif changes:
+        student_index.apply(
+            [record for record in changes.values() if record is not None],
+            [student_id for student_id, record in changes.items() if record is None],
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop(_CHANGES_KEY, None)
+    session.info.pop(_BULK_KEY, None)
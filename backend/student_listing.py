@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, tuple_
+from sqlalchemy.orm import Query, Session
+
+from . import models
+from .student_index import roster_version
+from .student_search import matches
+
+# Sort orders of the admin student list, by the DataTables column name.
+# Each ends with the student id, so a row's keys place it exactly.
+SORTS = {
+    "number": (models.Student.number, models.Student.id),
+    "name": (models.Student.name, models.Student.id),
+    "classroom": (models.STUDENT_CLASSROOM_KEY, models.STUDENT_SEQUENCE_KEY, models.Student.id),
+    "sequence": (models.STUDENT_SEQUENCE_KEY, models.Student.id),
+}
+DEFAULT_SORT = "classroom"
+
+SEARCH_COLUMNS = ("number", "name", "classroom")
+
+MAX_PAGE_SIZE = 500
+
+# Filtered counts kept for the current roster_version; a roster change drops them all
+MAX_CACHED_COUNTS = 256
+
+_counts: Dict[Tuple[Optional[str], str], int] = {}
+_counts_version: Optional[int] = None
+_counts_lock = threading.Lock()
+
+
+def _filter(query: Query, classroom: Optional[str], q: str) -> Query:
+    if classroom is not None:
+        query = query.filter(models.STUDENT_CLASSROOM_KEY == classroom)
+    if q:
+        query = query.filter(matches(q, SEARCH_COLUMNS))
+    return query
+
+
+def encode_cursor(sort: str, descending: bool, keys: tuple) -> str:
+    text = json.dumps([sort, descending, *keys], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool) -> tuple:
+    """The sort keys of the row a page ended on. Raises ``ValueError`` for a cursor from another order."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if not isinstance(values, list) or values[:2] != [sort, descending] or len(values) != len(SORTS[sort]) + 2:
+        raise ValueError(f"Cursor does not continue the {sort} order")
+    return tuple(values[2:])
+
+
+def list_students(
+    db: Session,
+    sort: str = DEFAULT_SORT,
+    descending: bool = False,
+    classroom: Optional[str] = None,
+    q: str = "",
+    after: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 25,
+) -> Tuple[List[models.Student], Optional[str]]:
+    """One page of students and the cursor that continues after it, or None on the last page.
+
+    With ``after`` the page starts past the row that cursor came from: a
+    row-value comparison that seeks the sort's index, so paging onwards
+    costs the same on page 500 as on page 1. Without it the page is read
+    at ``offset``, which walks the index up to it, for jumps to any page.
+    """
+    keys = SORTS[sort]
+    query = _filter(db.query(models.Student, *keys), classroom, q)
+    if after is not None:
+        values = decode_cursor(after, sort, descending)
+        # The leading bound is what lets SQLite seek; the row value alone scans
+        if descending:
+            query = query.filter(and_(keys[0] <= values[0], tuple_(*keys) < tuple_(*values)))
+        else:
+            query = query.filter(and_(keys[0] >= values[0], tuple_(*keys) > tuple_(*values)))
+    query = query.order_by(*(key.desc() if descending else key for key in keys)).limit(limit)
+    if after is None and offset:
+        query = query.offset(offset)
+    rows = query.all()
+    cursor = encode_cursor(sort, descending, tuple(rows[-1][1:])) if len(rows) == limit else None
+    return [row[0] for row in rows], cursor
+
+
+def count_students(db: Session, classroom: Optional[str] = None, q: str = "") -> int:
+    """Students matching the filters, counted once per roster version."""
+    global _counts_version
+    key = (classroom, q)
+    # Read before counting: a change committed meanwhile bumps it past this count
+    version = roster_version.value
+    with _counts_lock:
+        if _counts_version != version:
+            _counts.clear()
+            _counts_version = version
+        if key in _counts:
+            return _counts[key]
+    count = _filter(db.query(func.count(models.Student.id)), classroom, q).scalar()
+    with _counts_lock:
+        if _counts_version == version:
+            if len(_counts) >= MAX_CACHED_COUNTS:
+                _counts.clear()
+            _counts[key] = count
+    return count
@@ -0,0 +1,66 @@
+import logging
+import sqlite3
+from typing import List, Optional, Sequence
+
+from sqlalchemy import column, or_, select, table
+from sqlalchemy.orm import Session
+
+from . import models
+
+# The trigram tokenizer indexes every run of three characters, so a MATCH
+# finds any substring of three or more, including inside Thai words that
+# have no spaces to split on. Shorter queries fall back to LIKE, as do all
+# queries on SQLite builds without the tokenizer (models.STUDENT_SEARCH_FTS).
+MIN_INDEXED_LENGTH = 3
+
+students_fts = table("students_fts", column("rowid"), column("students_fts"))
+
+
+def fts_phrase(q: str, columns: Sequence[str]) -> str:
+    """An FTS5 query for ``q`` as a literal substring of any of ``columns``."""
+    return "{%s} : \"%s\"" % (" ".join(columns), q.replace('"', '""'))
+
+
+def _indexed(q: str) -> bool:
+    return models.STUDENT_SEARCH_FTS and len(q) >= MIN_INDEXED_LENGTH
+
+
+def matches(q: str, columns: Sequence[str]):
+    """A filter on students for ``q`` anywhere in one of ``columns``, through the index when ``q`` is long enough."""
+    if _indexed(q):
+        return models.Student.id.in_(
+            select(students_fts.c.rowid).where(students_fts.c.students_fts.match(fts_phrase(q, columns)))
+        )
+    return or_(*(getattr(models.Student, name).contains(q, autoescape=True) for name in columns))
+
+
+def search_students(
+    db: Session, q: str, columns: Sequence[str] = ("name", "number"), limit: Optional[int] = None
+) -> List[models.Student]:
+    """Students with ``q`` anywhere in one of ``columns``, in id order."""
+    query = db.query(models.Student)
+    if _indexed(q):
+        # FTS5 yields rowid order itself, so LIMIT stops early without a sort
+        query = (
+            query.join(students_fts, students_fts.c.rowid == models.Student.id)
+            .filter(students_fts.c.students_fts.match(fts_phrase(q, columns)))
+            .order_by(students_fts.c.rowid)
+        )
+    else:
+        query = query.filter(matches(q, columns)).order_by(models.Student.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def rebuild_search_index(connection):
+    """Create the index and triggers if missing and re-read every student."""
+    if not models.STUDENT_SEARCH_FTS:
+        logging.warning(
+            f"SQLite {sqlite3.sqlite_version} has no trigram tokenizer (3.34 or newer); "
+            "student search uses LIKE instead of the students_fts index"
+        )
+        return
+    for statement in models.STUDENT_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql("INSERT INTO students_fts (students_fts) VALUES ('rebuild')")
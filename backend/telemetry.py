@@ -0,0 +1,330 @@
+import bisect
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import MetaData, Table, func, inspect, select, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import TelemetryBase
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended.
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Granularities written on every flush; retention later folds old hour
+# buckets into "day" buckets (see retention.py).
+GRANULARITIES = ("minute", "hour")
+
+# Minute buckets only back the 24-hour status view; hour buckets hold the same counts.
+MINUTE_ROLLUP_RETENTION = timedelta(days=2)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+RollupKey = Tuple[str, datetime, str, str]
+
+
+def route_template(request) -> str:
+    """The matched route's path template, so ``/x/1`` and ``/x/2`` share a rollup."""
+    route = request.scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return UNMATCHED_ROUTE
+    path = request.scope["path"]
+    if route.path_regex.match(path):
+        # Routes added with include_router carry the router's prefix
+        return template
+    # Newer FastAPI matches included routes under the router instead, so the
+    # template lacks the prefix: it is whatever precedes the route's match
+    for end in (i for i, char in enumerate(path) if char == "/"):
+        if route.path_regex.match(path[end:]):
+            return path[:end] + template
+    return template
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def histogram_index(response_time_ms: int) -> int:
+    return bisect.bisect_left(LATENCY_BOUNDS_MS, response_time_ms)
+
+
+def percentile(histogram: List[int], q: float, max_ms: float) -> float:
+    """Estimate the ``q`` quantile (0..1) from bucket counts, interpolating
+    linearly inside the bucket it falls in and never exceeding ``max_ms``."""
+    total = sum(histogram)
+    if total == 0:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = LATENCY_BOUNDS_MS[index - 1] if index > 0 else 0
+            upper = LATENCY_BOUNDS_MS[index] if index < len(LATENCY_BOUNDS_MS) else max_ms
+            estimate = lower + (upper - lower) * (rank - seen) / count
+            return round(min(estimate, max_ms), 2)
+        seen += count
+    return float(max_ms)
+
+
+def status_class(status_code: int) -> str:
+    return f"{status_code // 100}xx"
+
+
+class LatencyHistogram:
+    __slots__ = ("count", "max_ms", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.max_ms = 0
+        self.histogram = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+
+    def observe(self, response_time_ms: int):
+        self.count += 1
+        self.max_ms = max(self.max_ms, response_time_ms)
+        self.histogram[histogram_index(response_time_ms)] += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        self.count += other.count
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50": percentile(self.histogram, 0.50, self.max_ms),
+            "p90": percentile(self.histogram, 0.90, self.max_ms),
+            "p99": percentile(self.histogram, 0.99, self.max_ms),
+            "max": float(self.max_ms),
+        }
+
+
+class RouteLatencies:
+    """In-process latency histograms per method, route template and status class.
+
+    Keys are route templates, never literal paths, so memory is bounded by
+    the number of routes rather than by the ids requested. Counts cover this
+    worker since it started.
+    """
+
+    def __init__(self):
+        self.since = datetime.now()
+        self._histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+
+    def observe(self, method: str, route: str, status_code: int, response_time_ms: int):
+        key = (method, route, status_class(status_code))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram()
+        histogram.observe(response_time_ms)
+
+    def routes(self, limit: Optional[int] = None) -> List[dict]:
+        """Per-route summaries, busiest first."""
+        items = sorted(self._histograms.items(), key=lambda item: item[1].count, reverse=True)
+        return [
+            {"method": method, "route": route, "status_class": klass, **histogram.summary()}
+            for (method, route, klass), histogram in items[:limit]
+        ]
+
+    def overall(self) -> dict:
+        total = LatencyHistogram()
+        for histogram in list(self._histograms.values()):
+            total.merge(histogram)
+        return total.summary()
+
+    def reset(self):
+        self.since = datetime.now()
+        self._histograms = {}
+
+
+route_latencies = RouteLatencies()
+
+
+class _Rollup:
+    __slots__ = ("count", "error_count", "latency_sum_ms", "latency_max_ms", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.error_count = 0
+        self.latency_sum_ms = 0
+        self.latency_max_ms = 0
+        self.histogram = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+
+    def add(self, status_code: int, response_time_ms: int):
+        self.count += 1
+        if status_code >= 400:
+            self.error_count += 1
+        self.latency_sum_ms += response_time_ms
+        self.latency_max_ms = max(self.latency_max_ms, response_time_ms)
+        self.histogram[histogram_index(response_time_ms)] += 1
+
+    def merge_row(self, row: models.RequestRollup):
+        self.count += row.count
+        self.error_count += row.error_count
+        self.latency_sum_ms += row.latency_sum_ms
+        self.latency_max_ms = max(self.latency_max_ms, row.latency_max_ms)
+        self.histogram = [a + b for a, b in zip(self.histogram, json.loads(row.histogram))]
+
+
+def fold(rollups: Dict[RollupKey, _Rollup], row: dict, granularities: Iterable[str] = GRANULARITIES):
+    """Add one request row (``timestamp``, ``method``, ``route``, ``status_code``,
+    ``response_time_ms``) to its bucket at each granularity."""
+    for granularity in granularities:
+        key = (granularity, bucket_start(row["timestamp"], granularity), row["method"], row["route"])
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = _Rollup()
+        rollup.add(row["status_code"], row["response_time_ms"])
+
+
+def aggregate(rows: Iterable[dict]) -> Dict[RollupKey, _Rollup]:
+    rollups: Dict[RollupKey, _Rollup] = {}
+    for row in rows:
+        fold(rollups, row)
+    return rollups
+
+
+def apply_rollups(db: Session, rollups: Dict[RollupKey, _Rollup]):
+    """Merge ``rollups`` into ``request_rollups``.
+
+    Read-modify-write: run it inside ``immediate_transaction`` so concurrent
+    workers flushing into the same bucket cannot lose each other's counts.
+    """
+    keys = list(rollups)
+    existing = {}
+    # Four bound parameters per key; stay well under SQLite's variable limit
+    for start in range(0, len(keys), 500):
+        for row in db.query(models.RequestRollup).filter(
+            tuple_(
+                models.RequestRollup.granularity,
+                models.RequestRollup.bucket,
+                models.RequestRollup.method,
+                models.RequestRollup.route,
+            ).in_(keys[start:start + 500])
+        ):
+            existing[(row.granularity, row.bucket, row.method, row.route)] = row
+    for key, rollup in rollups.items():
+        row = existing.get(key)
+        if row is None:
+            granularity, bucket, method, route = key
+            db.add(
+                models.RequestRollup(
+                    granularity=granularity,
+                    bucket=bucket,
+                    method=method,
+                    route=route,
+                    count=rollup.count,
+                    error_count=rollup.error_count,
+                    latency_sum_ms=rollup.latency_sum_ms,
+                    latency_max_ms=rollup.latency_max_ms,
+                    histogram=json.dumps(rollup.histogram),
+                )
+            )
+            continue
+        row.count += rollup.count
+        row.error_count += rollup.error_count
+        row.latency_sum_ms += rollup.latency_sum_ms
+        row.latency_max_ms = max(row.latency_max_ms, rollup.latency_max_ms)
+        row.histogram = json.dumps([a + b for a, b in zip(json.loads(row.histogram), rollup.histogram)])
+
+
+def coarsen(rows: Iterable[models.RequestRollup], granularity: str) -> Dict[RollupKey, _Rollup]:
+    """Fold existing rollup rows into ``granularity`` buckets, ready for ``apply_rollups``."""
+    rollups: Dict[RollupKey, _Rollup] = {}
+    for row in rows:
+        key = (granularity, bucket_start(row.bucket, granularity), row.method, row.route)
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = _Rollup()
+        rollup.merge_row(row)
+    return rollups
+
+
+def fold_request_logs(db: Session, rows: Iterable) -> None:
+    """Add raw ``request_logs`` rows to the rollups (the telemetry backfill migration).
+
+    Historic rows carry no route template, so their path stands in for it.
+    Rows past the minute buckets' retention only get hour buckets.
+    """
+    minute_cutoff = datetime.now() - MINUTE_ROLLUP_RETENTION
+    rollups: Dict[RollupKey, _Rollup] = {}
+    for row in rows:
+        if row.timestamp is None:
+            continue
+        fold(
+            rollups,
+            {
+                "timestamp": row.timestamp,
+                "method": row.method,
+                "route": row.path,
+                "status_code": row.status_code,
+                "response_time_ms": row.response_time_ms or 0,
+            },
+            GRANULARITIES if row.timestamp >= minute_cutoff else ("hour",),
+        )
+    apply_rollups(db, rollups)
+
+
+def totals_since(db: Session, granularity: str, since: datetime) -> Tuple[int, int, int]:
+    """``(count, error_count, latency_sum_ms)`` over buckets starting at or after ``since``."""
+    count, errors, latency_sum = (
+        db.query(
+            func.coalesce(func.sum(models.RequestRollup.count), 0),
+            func.coalesce(func.sum(models.RequestRollup.error_count), 0),
+            func.coalesce(func.sum(models.RequestRollup.latency_sum_ms), 0),
+        )
+        .filter(
+            models.RequestRollup.granularity == granularity,
+            models.RequestRollup.bucket >= bucket_start(since, granularity),
+        )
+        .one()
+    )
+    return count, errors, latency_sum
+
+
+def _same_database(a: Engine, b: Engine) -> bool:
+    if a.url.get_backend_name() != "sqlite" or b.url.get_backend_name() != "sqlite":
+        return a.url == b.url
+    return os.path.abspath(a.url.database or "") == os.path.abspath(b.url.database or "")
+
+
+def move_telemetry_tables(source: Engine, target: Engine, batch_size: int = 10000) -> Dict[str, int]:
+    """Move request logs, rollups and system metrics out of the main database.
+
+    Copies rows in id order, in batches, into ``target`` and then drops the
+    table from ``source``. Rows already copied are skipped, so an interrupted
+    move can simply be run again. Returns rows moved per table.
+    """
+    if _same_database(source, target):
+        return {}
+    TelemetryBase.metadata.create_all(bind=target)
+    legacy_tables = set(inspect(source).get_table_names())
+    moved = {}
+    for table in TelemetryBase.metadata.sorted_tables:
+        if table.name not in legacy_tables:
+            continue
+        legacy = Table(table.name, MetaData(), autoload_with=source)
+        columns = [legacy.c[column.name] for column in table.columns if column.name in legacy.c]
+        last_id = 0
+        moved[table.name] = 0
+        while True:
+            with source.connect() as connection:
+                rows = connection.execute(
+                    select(*columns).where(legacy.c.id > last_id).order_by(legacy.c.id).limit(batch_size)
+                ).mappings().all()
+            if not rows:
+                break
+            with target.begin() as connection:
+                connection.execute(table.insert().prefix_with("OR IGNORE"), [dict(row) for row in rows])
+            last_id = rows[-1]["id"]
+            moved[table.name] += len(rows)
+        with source.begin() as connection:
+            connection.execute(text(f"DROP TABLE {table.name}"))
+    return moved
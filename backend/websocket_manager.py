@@ -1,25 +1,304 @@
 import asyncio
 import json
+import os
 from fastapi import WebSocket
-from typing import List
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import metrics
+from .broadcast_bus import LocalBus, create_bus
+
+# Message protocol (JSON text frames), by topic:
+#   (any)            {"type": "hello", "version": N}                       sent on connect
+#   activities       {"type": "seats", "version": N, "activities": [...]}  seat counts changed
+#   activities       {"type": "activities", "version": N}                  activities changed, refetch
+#   announcements    {"type": "announcements"}                             announcements changed, refetch
+#   activity:<id>    {"type": "registrations", "activity_id": id}          that activity's registrations changed
+#   import:<job id>  {"type": "import", "job": {...}}                       roster import progress (import_jobs.py)
+# "version" numbers the activity stream. A client that sees a gap has missed
+# messages and should refetch /api/activities instead of applying patches.
+#
+# Clients pick topics with ?topics=activities,announcements on connect and may
+# send {"subscribe": [...]} / {"unsubscribe": [...]} afterwards.
+#
+# Broadcasts go through a bus (see broadcast_bus.py) so that, with several
+# workers, every worker's sockets hear about changes made by any of them.
+# "version" is numbered per worker; a client only ever talks to one.
+
+COALESCE_WINDOW_SECONDS = int(os.getenv("WS_COALESCE_WINDOW_MS", "150")) / 1000
+SEND_TIMEOUT_SECONDS = int(os.getenv("WS_SEND_TIMEOUT_MS", "2000")) / 1000
+MAX_QUEUE_DEPTH = int(os.getenv("WS_MAX_QUEUE", "32"))
+
+DEFAULT_TOPICS = {"activities", "announcements"}
+MAX_TOPICS_PER_CLIENT = 16
+
+def is_valid_topic(topic: str) -> bool:
+    if topic in DEFAULT_TOPICS:
+        return True
+    prefix, _, key = topic.partition(":")
+    if prefix == "import":
+        # Job ids are random hex, so only the admin who started the job knows the topic
+        return len(key) == 32 and all(c in "0123456789abcdef" for c in key)
+    return prefix == "activity" and key.isdigit()
+
+
+def parse_topics(raw: Optional[str]) -> Set[str]:
+    """Topics from a comma-separated query value; defaults when none are valid."""
+    topics = {topic.strip() for topic in (raw or "").split(",")}
+    topics = {topic for topic in topics if is_valid_topic(topic)}
+    return topics or set(DEFAULT_TOPICS)
+
+
+# Pending notifications per topic: {topic: {key: (as_of, item)}}
+PendingTopics = Dict[str, Dict[Any, Tuple[int, dict]]]
+
+
+class BroadcastCoalescer:
+    """Merges notifications per topic for ``window`` seconds, then flushes them once.
+
+    A burst of registrations on the same activity becomes a single message
+    carrying the latest counts instead of one broadcast per request.
+    """
+
+    def __init__(self, emit: Callable[[PendingTopics], Awaitable[None]], window: float):
+        self._emit = emit
+        self.window = window
+        self._pending: PendingTopics = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.coalesced = 0
+
+    async def publish(self, topic: str, items: Optional[Dict[Any, Tuple[int, dict]]] = None):
+        self.published += 1
+        pending = self._pending.get(topic)
+        if pending is None:
+            self._pending[topic] = dict(items or {})
+        else:
+            self.coalesced += 1
+            for key, (as_of, item) in (items or {}).items():
+                if key not in pending or pending[key][0] <= as_of:
+                    pending[key] = (as_of, item)
+
+        if self.window <= 0:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if pending:
+            await self._emit(pending)
+
+
+class ClientConnection:
+    """One socket plus its bounded outbound queue, drained by its own writer task."""
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.writer: Optional[asyncio.Task] = None
+        self.topics: Set[str] = set()
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(
+        self,
+        coalesce_window: float = COALESCE_WINDOW_SECONDS,
+        send_timeout: float = SEND_TIMEOUT_SECONDS,
+        max_queue: int = MAX_QUEUE_DEPTH,
+        bus=None,
+    ):
+        # Keyed by socket so disconnect is O(1)
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self._subscribers: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.version = 0
+        self.emitted = 0
+        self.evictions = 0
+        self.send_timeout = send_timeout
+        self.max_queue = max_queue
+        # Seat version (models.SeatVersion) each activity's last published counts reflect
+        self._seat_versions: Dict[int, int] = {}
+        self.coalescer = BroadcastCoalescer(self._emit, coalesce_window)
+        self.bus = bus or LocalBus()
+        self.bus.attach(self._receive)
 
-    async def connect(self, websocket: WebSocket):
+    async def start(self):
+        await self.bus.start()
+
+    async def stop(self):
+        await self.bus.stop()
+
+    async def connect(self, websocket: WebSocket, topics: Optional[Iterable[str]] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, self.max_queue)
+        self.active_connections[websocket] = client
+        self.subscribe(websocket, DEFAULT_TOPICS if topics is None else topics)
+        client.queue.put_nowait(json.dumps({"type": "hello", "version": self.version}))
+        client.writer = asyncio.create_task(self._write(client))
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        self.unsubscribe(websocket, list(client.topics), client)
+        if client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            if not is_valid_topic(topic) or topic in client.topics:
+                continue
+            if len(client.topics) >= MAX_TOPICS_PER_CLIENT:
+                break
+            client.topics.add(topic)
+            self._subscribers.setdefault(topic, {})[websocket] = client
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str], client: Optional[ClientConnection] = None):
+        client = client or self.active_connections.get(websocket)
+        if client is None:
+            return
+        for topic in topics:
+            client.topics.discard(topic)
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.pop(websocket, None)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def handle_client_message(self, websocket: WebSocket, data: str):
+        """Apply a {"subscribe": [...], "unsubscribe": [...]} request; ignore anything else."""
+        try:
+            request = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(request, dict):
+            return
+        for key, apply in (("subscribe", self.subscribe), ("unsubscribe", self.unsubscribe)):
+            topics = request.get(key)
+            if isinstance(topics, list):
+                apply(websocket, [topic for topic in topics if isinstance(topic, str)])
+
+    async def broadcast(self, message: str, topic: Optional[str] = None):
+        """Queue ``message`` for every subscriber of ``topic`` (all clients if None).
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
+        Writers send concurrently. A client whose queue is full has fallen too
+        far behind and is evicted rather than holding up everyone else.
+        """
+        clients = self.active_connections if topic is None else self._subscribers.get(topic, {})
+        if not clients:
+            return
+        self.emitted += 1
+        with metrics.WEBSOCKET_FANOUT.time(topic=topic or "all"):
+            for client in list(clients.values()):
+                try:
+                    client.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self._evict(client)
+
+    async def _write(self, client: ClientConnection):
+        while True:
+            message = await client.queue.get()
             try:
-                await connection.send_text(message)
+                await asyncio.wait_for(client.websocket.send_text(message), self.send_timeout)
+            except asyncio.CancelledError:
+                raise
             except Exception:
-                pass
+                # Timed out or the socket is gone
+                self._evict(client)
+                return
+
+    def _evict(self, client: ClientConnection):
+        if self.active_connections.get(client.websocket) is not client:
+            return
+        self.evictions += 1
+        metrics.WEBSOCKET_EVICTIONS.inc()
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1013: try again later
+            await asyncio.wait_for(websocket.close(code=1013), self.send_timeout)
+        except Exception:
+            pass
+
+    async def broadcast_seats(self, seats: List[dict], as_of: int):
+        """Queue new seat counts; counts older than ones already sent are dropped."""
+        await self.bus.publish("seats", {"seats": seats, "as_of": as_of})
+
+    async def broadcast_activities_changed(self):
+        await self.bus.publish("activities")
+
+    async def broadcast_announcements(self):
+        await self.bus.publish("announcements")
+
+    async def broadcast_import(self, job: dict):
+        await self.bus.publish("import", job)
+
+    async def _receive(self, topic: str, data: Any):
+        """Bus delivery, from this worker or another one."""
+        items = None
+        if topic == "seats":
+            items = {seat["id"]: (data["as_of"], seat) for seat in data["seats"]}
+        elif topic == "import":
+            # Only the latest progress of each job within a window is sent
+            items = {data["id"]: (data["rows_processed"], data)}
+        await self.coalescer.publish(topic, items)
+
+    def stats(self) -> dict:
+        depths = [client.queue.qsize() for client in self.active_connections.values()]
+        return {
+            "published": self.coalescer.published,
+            "coalesced": self.coalescer.coalesced,
+            "emitted": self.emitted,
+            "connected": len(depths),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "evictions": self.evictions,
+            "bus": self.bus.name,
+            "relayed": self.bus.relayed,
+        }
+
+    async def _emit(self, pending: PendingTopics):
+        seats = []
+        for activity_id, (as_of, seat) in pending.get("seats", {}).items():
+            if self._seat_versions.get(activity_id, -1) <= as_of:
+                self._seat_versions[activity_id] = as_of
+                seats.append(seat)
+
+        # A refetch signal supersedes seat patches queued in the same window
+        if "activities" in pending:
+            await self._broadcast_activity_event({"type": "activities"})
+        elif seats:
+            await self._broadcast_activity_event({"type": "seats", "activities": seats})
+
+        # Seat changes are registration changes; tell admins watching that activity
+        for activity_id in pending.get("seats", {}):
+            topic = f"activity:{activity_id}"
+            if topic in self._subscribers:
+                await self.broadcast(
+                    json.dumps({"type": "registrations", "activity_id": activity_id}), topic
+                )
+
+        if "announcements" in pending:
+            await self.broadcast(json.dumps({"type": "announcements"}), "announcements")
+
+        for job_id, (_, job) in pending.get("import", {}).items():
+            topic = f"import:{job_id}"
+            if topic in self._subscribers:
+                await self.broadcast(json.dumps({"type": "import", "job": job}), topic)
+
+    async def _broadcast_activity_event(self, event: dict):
+        self.version += 1
+        event["version"] = self.version
+        await self.broadcast(json.dumps(event), "activities")
 
-manager = ConnectionManager()
+manager = ConnectionManager(bus=create_bus())
+metrics.WEBSOCKET_CONNECTIONS.function = lambda: len(manager.active_connections)
@@ -0,0 +1,191 @@
+"""Roster import time: the old load-whole-workbook, query-per-row loop against import_roster.
+
+Writes a roster workbook, then imports it into a fresh database (every row
+inserted) and again into a database already holding the roster with one
+student in ten moved to another classroom (the yearly re-import). Both
+implementations must leave identical students tables. A dry run of each
+must leave the table as it was. The same roster saved as CSV is then read
+and imported through the stdlib csv path. Run from the repository root:
+
+    python -m benchmarks.roster_import --students 20000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import Base, create_sqlite_engine
+from backend.roster_import import ROSTER_IMPORT_CHUNK, import_roster, read_text_rows, read_workbook_rows
+from benchmarks.student_search import roster
+
+HEADER = ("รหัส", "คำนำหน้า", "ชื่อ", "นามสกุล", "ห้อง", "เลขที่")
+
+
+def split_name(name):
+    for prefix in ("นางสาว", "เด็กชาย", "เด็กหญิง", "นาย"):
+        if name.startswith(prefix):
+            first, last = name[len(prefix):].split(" ", 1)
+            return prefix, first, last
+    raise ValueError(name)
+
+
+def workbook(students) -> bytes:
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet()
+    sheet.append(HEADER)
+    for student in students:
+        sheet.append((student["number"], *split_name(student["name"]), student["classroom"], student["sequence"]))
+    output = io.BytesIO()
+    book.save(output)
+    return output.getvalue()
+
+
+def text_file(students) -> bytes:
+    """The roster as Excel's "CSV UTF-8" saves it."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(HEADER)
+    for student in students:
+        writer.writerow((student["number"], *split_name(student["name"]), student["classroom"], student["sequence"]))
+    return output.getvalue().encode("utf-8-sig")
+
+
+def old_import(db, contents: bytes):
+    """The endpoint before streaming: whole workbook in memory, one SELECT per row, one commit."""
+    sheet = openpyxl.load_workbook(io.BytesIO(contents)).active
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        code, prefix, first_name, last_name, classroom, sequence = (list(row) + [None] * 6)[:6]
+        if not code or not first_name:
+            continue
+        full_name = f"{prefix or ''}{first_name} {last_name or ''}".strip()
+        number = str(code).strip()
+        classroom = str(classroom).strip() if classroom else ""
+        sequence = int(float(str(sequence).strip())) if sequence else None
+        existing = db.query(models.Student).filter(models.Student.number == number).first()
+        if existing:
+            existing.name, existing.classroom, existing.sequence = full_name, classroom, sequence
+        else:
+            db.add(models.Student(number=number, name=full_name, classroom=classroom, sequence=sequence))
+    db.commit()
+
+
+def new_import(db, contents: bytes):
+    return import_roster(db, read_workbook_rows(io.BytesIO(contents)))
+
+
+def csv_import(db, contents: bytes):
+    return import_roster(db, read_text_rows(io.BytesIO(contents)))
+
+
+def dry_run(db, contents: bytes):
+    return import_roster(db, read_workbook_rows(io.BytesIO(contents)), dry_run=True)
+
+
+def run(directory, name, implementation, contents, seed):
+    engine = create_sqlite_engine(f"sqlite:///{os.path.join(directory, name + '.db')}")
+    Base.metadata.create_all(bind=engine)
+    if seed:
+        with engine.begin() as connection:
+            connection.execute(insert(models.Student), seed)
+    started = time.perf_counter()
+    with sessionmaker(bind=engine)() as db:
+        result = implementation(db, contents)
+    elapsed = time.perf_counter() - started
+    with engine.connect() as connection:
+        table = connection.execute(
+            models.Student.__table__.select().with_only_columns(
+                models.Student.number, models.Student.name, models.Student.classroom, models.Student.sequence
+            ).order_by(models.Student.number)
+        ).all()
+    engine.dispose()
+    return elapsed, result, table
+
+
+def read_time(read) -> float:
+    started = time.perf_counter()
+    for _ in read():
+        pass
+    return time.perf_counter() - started
+
+
+def peak_memory(read) -> float:
+    """MiB allocated at most while ``read`` walks every row; traced separately as it slows parsing."""
+    tracemalloc.start()
+    for _ in read():
+        pass
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=20000)
+    args = parser.parse_args()
+
+    students = list(roster(args.students))
+    rng = random.Random(3)
+    moved = [
+        dict(student, classroom=f"ม.{rng.randint(1, 6)}/{rng.randint(1, 12)}") if rng.random() < 0.1 else student
+        for student in students
+    ]
+    contents = workbook(moved)
+    print(f"{args.students} students, workbook {len(contents) / 1024:.0f} KiB, chunk {ROSTER_IMPORT_CHUNK}")
+    whole = peak_memory(lambda: openpyxl.load_workbook(io.BytesIO(contents)).active.iter_rows(min_row=2, values_only=True))
+    streamed = peak_memory(lambda: read_workbook_rows(io.BytesIO(contents)))
+    print(f"reading the rows: whole workbook peak {whole:.1f} MiB, read-only stream peak {streamed:.1f} MiB")
+
+    text = text_file(moved)
+    workbook_read = read_time(lambda: read_workbook_rows(io.BytesIO(contents)))
+    text_read = read_time(lambda: read_text_rows(io.BytesIO(text)))
+    print(
+        f"reading the rows: workbook {workbook_read:.2f} s, CSV ({len(text) / 1024:.0f} KiB) {text_read:.3f} s"
+        f" ({workbook_read / text_read:.0f}x, parsing only)"
+    )
+
+    directory = tempfile.mkdtemp(prefix="dsnpru_bench_")
+    try:
+        for label, seed in (("empty database", None), ("re-import", students)):
+            old_time, _, old_table = run(directory, f"old-{bool(seed)}", old_import, contents, seed)
+            new_time, result, new_table = run(directory, f"new-{bool(seed)}", new_import, contents, seed)
+            if old_table != new_table:
+                raise SystemExit(f"{label}: the two imports left different students tables")
+            print(
+                f"{label:<15} old {old_time:>6.2f} s ({args.students / old_time:>5.0f} rows/s)"
+                f"  new {new_time:>6.2f} s ({args.students / new_time:>5.0f} rows/s)"
+            )
+            print(
+                f"{'':<15} inserted {result.inserted} updated {result.updated} unchanged {result.unchanged}"
+                f" in {result.chunks} chunks, longest write transaction {result.longest_chunk_ms:.1f} ms"
+            )
+            preview_time, preview, preview_table = run(directory, f"dry-{bool(seed)}", dry_run, contents, seed)
+            if preview_table != sorted((s["number"], s["name"], s["classroom"], s["sequence"]) for s in seed or ()):
+                raise SystemExit(f"{label}: the dry run wrote to the students table")
+            print(
+                f"{'':<15} dry run {preview_time:>6.2f} s: added {preview.inserted} changed {preview.updated}"
+                f" missing {preview.missing}, nothing written"
+            )
+            csv_time, _, csv_table = run(directory, f"csv-{bool(seed)}", csv_import, text, seed)
+            if csv_table != new_table:
+                raise SystemExit(f"{label}: the CSV import left a different students table")
+            # End to end the writes are the same for both formats, so the gain is well below parsing's
+            print(
+                f"{'':<15} from CSV {csv_time:>6.2f} s ({args.students / csv_time:>5.0f} rows/s),"
+                f" {new_time / csv_time:.1f}x the workbook import end to end"
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
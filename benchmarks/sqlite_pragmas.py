@@ -0,0 +1,145 @@
+"""Registration throughput with the old engine settings and with the tuned pragmas.
+
+Writer processes reserve seats through ``reserve_seats`` while reader
+processes load the activity list with seat counts, all against one SQLite
+file, as several uvicorn workers would during a registration rush. Run from
+the repository root:
+
+    python -m benchmarks.sqlite_pragmas --writers 4 --readers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import Base, SQLITE_PRAGMAS, create_sqlite_engine
+from backend.reservations import SeatReservationError, reserve_seats, seat_counts_subquery
+
+ACTIVITIES = 20
+STUDENTS_PER_WRITER = 50000
+
+
+def make_engine(config: str, path: str):
+    if config == "before":
+        # What database.py did before: pysqlite defaults, rollback journal
+        return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    return create_sqlite_engine(f"sqlite:///{path}")
+
+
+def seed(config: str, path: str, writers: int):
+    engine = make_engine(config, path)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(models.Activity), [
+            {"title": f"Activity {n}", "max_people": 10 ** 9, "status": "open"} for n in range(ACTIVITIES)
+        ])
+        connection.execute(insert(models.Student), [
+            {"number": str(n), "name": f"Student {n}", "classroom": "ม.1/1"}
+            for n in range(1, writers * STUDENTS_PER_WRITER + 1)
+        ])
+    engine.dispose()
+
+
+def writer(config: str, path: str, index: int, start: float, deadline: float) -> dict:
+    engine = make_engine(config, path)
+    # The old code had no retries
+    reserve = reserve_seats.__wrapped__ if config == "before" else reserve_seats
+    latencies, errors = [], 0
+    student_id = index * STUDENTS_PER_WRITER
+    time.sleep(max(start - time.time(), 0))
+    with sessionmaker(bind=engine)() as db:
+        while time.time() < deadline:
+            student_id += 1
+            started = time.perf_counter()
+            try:
+                activity = db.get(models.Activity, random.randint(1, ACTIVITIES))
+                reserve(db, activity, [db.get(models.Student, student_id)])
+            except (OperationalError, SeatReservationError):
+                db.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            db.expire_all()
+    engine.dispose()
+    return {"writes": latencies, "reads": [], "errors": errors}
+
+
+def reader(config: str, path: str, index: int, start: float, deadline: float) -> dict:
+    engine = make_engine(config, path)
+    latencies, errors = [], 0
+    time.sleep(max(start - time.time(), 0))
+    with sessionmaker(bind=engine)() as db:
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                counts = seat_counts_subquery(db)
+                db.query(models.Activity, counts.c.registered).outerjoin(
+                    counts, counts.c.activity_id == models.Activity.id
+                ).all()
+                db.rollback()
+            except OperationalError:
+                db.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    engine.dispose()
+    return {"writes": [], "reads": latencies, "errors": errors}
+
+
+def run(config: str, path: str, writers: int, readers: int, seconds: float) -> dict:
+    # Give every process time to start before the clock runs
+    start = time.time() + 2
+    deadline = start + seconds
+    jobs = [(writer, n) for n in range(writers)] + [(reader, n) for n in range(readers)]
+    with multiprocessing.Pool(len(jobs)) as pool:
+        outputs = [pool.apply_async(func, (config, path, n, start, deadline)) for func, n in jobs]
+        parts = [output.get() for output in outputs]
+    return {
+        "writes": [value for part in parts for value in part["writes"]],
+        "reads": [value for part in parts for value in part["reads"]],
+        "errors": sum(part["errors"] for part in parts),
+    }
+
+
+def summarize(name: str, results: dict, seconds: float):
+    def p99(values):
+        return sorted(values)[int(len(values) * 0.99)] * 1000 if values else 0.0
+
+    writes, reads = results["writes"], results["reads"]
+    print(
+        f"{name:<7} writes/s {len(writes) / seconds:>7.1f}  "
+        f"write p50 {statistics.median(writes) * 1000 if writes else 0:>6.2f} ms  p99 {p99(writes):>7.2f} ms  "
+        f"reads/s {len(reads) / seconds:>7.1f}  read p99 {p99(reads):>7.2f} ms  "
+        f"errors {results['errors']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="dsnpru_bench_")
+    try:
+        print(f"{args.writers} writers, {args.readers} readers, {args.seconds:g} s each; pragmas: {SQLITE_PRAGMAS}")
+        for config in ("before", "after"):
+            path = os.path.join(directory, f"{config}.db")
+            seed(config, path, args.writers)
+            summarize(config, run(config, path, args.writers, args.readers, args.seconds), args.seconds)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Admin student list: the whole roster in one response against DataTables server-side pages.
+
+Seeds a roster, then times GET /admin/api/students (what the page loaded
+before) and the first page of /admin/api/students/table, through the
+router, and compares their sizes. Then reads pages deep into the roster
+both ways list_students can: by OFFSET, and by seeking past the cursor
+of the page before. The two must return the same students. Run from the
+repository root:
+
+    python -m benchmarks.student_listing --students 20000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.auth import get_current_admin
+from backend.database import Base, create_sqlite_engine, get_db
+from backend.routers import admin
+from backend.student_listing import list_students
+from benchmarks.student_search import roster
+
+PAGE = 25
+COLUMNS = ("id", "number", "name", "classroom", "sequence", "")
+
+
+def median_ms(call, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=20000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="dsnpru_bench_")
+    engine = create_sqlite_engine(f"sqlite:///{os.path.join(directory, 'listing.db')}")
+    try:
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(insert(models.Student), list(roster(args.students)))
+        SessionLocal = sessionmaker(bind=engine)
+
+        def session():
+            with SessionLocal() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/admin")
+        app.dependency_overrides[get_db] = session
+        app.dependency_overrides[get_current_admin] = lambda: models.Admin(id=1, username="admin")
+        client = TestClient(app)
+
+        params = {"draw": 1, "start": 0, "length": PAGE, "order[0][column]": 3, "order[0][dir]": "asc"}
+        params.update({f"columns[{i}][data]": name for i, name in enumerate(COLUMNS)})
+        everything = client.get("/admin/api/students")
+        page = client.get("/admin/api/students/table", params=params)
+        print(f"{args.students} students, {PAGE} per page")
+        print(
+            f"whole roster   {len(everything.content) / 1024:>7.0f} KiB"
+            f"  {median_ms(lambda: client.get('/admin/api/students'), 5):>7.1f} ms"
+        )
+        print(
+            f"first page     {len(page.content) / 1024:>7.1f} KiB"
+            f"  {median_ms(lambda: client.get('/admin/api/students/table', params=params), 50):>7.1f} ms"
+            f"  (total {page.json()['recordsTotal']})"
+        )
+        filtered = {**params, "classroom": "ม.3/4", "search[value]": "สมชาย"}
+        print(
+            f"room + search  {median_ms(lambda: client.get('/admin/api/students/table', params=filtered), 50):>17.1f} ms"
+            f"  (filtered {client.get('/admin/api/students/table', params=filtered).json()['recordsFiltered']})"
+        )
+
+        with SessionLocal() as db:
+            for depth in (1, args.students // PAGE // 2, args.students // PAGE - 1):
+                offset = (depth - 1) * PAGE
+                by_offset, _ = list_students(db, "classroom", offset=offset, limit=PAGE)
+                before, cursor = list_students(db, "classroom", offset=offset - PAGE, limit=PAGE) if depth > 1 else ([], None)
+                by_cursor, _ = list_students(db, "classroom", after=cursor, offset=offset, limit=PAGE)
+                if [s.id for s in by_offset] != [s.id for s in by_cursor]:
+                    raise SystemExit(f"page {depth}: OFFSET and cursor pages differ")
+                offset_ms = median_ms(lambda: list_students(db, "classroom", offset=offset, limit=PAGE), 50)
+                cursor_ms = median_ms(lambda: list_students(db, "classroom", after=cursor, offset=offset, limit=PAGE), 50)
+                print(f"page {depth:>4}      OFFSET {offset_ms:>6.2f} ms  cursor {cursor_ms:>6.2f} ms")
+        client.close()
+    finally:
+        engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
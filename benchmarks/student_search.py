@@ -0,0 +1,135 @@
+"""Student search latency with LIKE '%q%', the students_fts trigram index and the in-memory index.
+
+Seeds a roster of Thai names, then runs the public (name or number, first
+10) and admin (name or classroom, all matches) searches for substrings cut
+from random students, the way a student types them into the form. Every
+query's matches are compared between LIKE and FTS5, so a difference in
+results fails the run. The in-memory index (public search only) ignores
+honorifics, so its matches are not compared. Run from the repository root:
+
+    python -m benchmarks.student_search --students 20000 --queries 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import Base, create_sqlite_engine
+from backend.student_index import StudentIndex
+from backend.student_search import search_students
+
+PREFIXES = ("นาย", "นางสาว", "เด็กชาย", "เด็กหญิง")
+FIRST = (
+    "สมชาย", "สมหญิง", "ก้องภพ", "ณัฐวุฒิ", "ปิยะพงษ์", "กนกวรรณ", "ธนพร", "ศุภชัย", "วรรณา", "อนุชา",
+    "พิมพ์ชนก", "ชยพล", "ภัทรา", "ธีรวัฒน์", "สุภาวดี", "กิตติพัฒน์", "ณิชา", "ปวีณ์กร", "วีรภัทร", "อารีรัตน์",
+)
+LAST = (
+    "ใจดี", "รักเรียน", "มีสุข", "ศรีสวัสดิ์", "บุญมา", "แก้วมณี", "ทองคำ", "วงศ์ใหญ่", "สุขเจริญ", "พันธุ์ดี",
+    "เพชรรัตน์", "จันทร์หอม", "นาคสวัสดิ์", "อินทร์แก้ว", "ชัยมงคล", "ประเสริฐ", "สมบูรณ์", "ภักดี", "รุ่งเรือง", "บุญยืน",
+)
+SYLLABLES = ("กร", "ชัย", "พล", "วัฒน์", "ศักดิ์", "รัตน์", "ธร", "กุล", "พงษ์", "สิทธิ์", "เดช", "นันท์")
+
+
+def roster(count: int):
+    rng = random.Random(1)
+    for n in range(count):
+        first = rng.choice(FIRST) + rng.choice(SYLLABLES)
+        last = rng.choice(LAST) + rng.choice(SYLLABLES) + rng.choice(SYLLABLES)
+        yield {
+            "number": str(60000 + n),
+            "name": f"{rng.choice(PREFIXES)}{first} {last}",
+            "classroom": f"ม.{rng.randint(1, 6)}/{rng.randint(1, 12)}",
+            "sequence": n % 45 + 1,
+        }
+
+
+def queries(students, count: int):
+    rng = random.Random(2)
+    for _ in range(count):
+        student = rng.choice(students)
+        field = rng.choice(("name", "name", "number", "classroom"))
+        value = student[field]
+        length = min(len(value), rng.randint(3, 8))
+        start = rng.randint(0, len(value) - length)
+        yield value[start:start + length]
+
+
+def like_search(db, q, columns, limit=None):
+    """What both endpoints did before: LIKE '%q%' on each column."""
+    query = db.query(models.Student).filter(
+        or_(*(getattr(models.Student, name).contains(q, autoescape=True) for name in columns))
+    ).order_by(models.Student.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def timed(search, db, q, columns, limit):
+    started = time.perf_counter()
+    results = search(db, q, columns, limit)
+    return time.perf_counter() - started, [student.id for student in results]
+
+
+def summarize(name, latencies):
+    ordered = sorted(latencies)
+    p99 = ordered[int(len(ordered) * 0.99)] * 1000
+    print(f"{name:<22} p50 {statistics.median(ordered) * 1000:>7.3f} ms  p99 {p99:>7.3f} ms  total {sum(ordered):>6.2f} s")
+
+
+def in_memory(engine, db, sample):
+    index = StudentIndex()
+    started = time.perf_counter()
+    index.rebuild(engine)
+    print(f"in-memory index built in {(time.perf_counter() - started) * 1000:.0f} ms")
+    latencies = []
+    for q in sample:
+        started = time.perf_counter()
+        index.search(db, q, 10)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="dsnpru_bench_")
+    try:
+        engine = create_sqlite_engine(f"sqlite:///{os.path.join(directory, 'search.db')}")
+        Base.metadata.create_all(bind=engine)
+        students = list(roster(args.students))
+        with engine.begin() as connection:
+            connection.execute(insert(models.Student), students)
+        sample = list(queries(students, args.queries))
+        print(f"{args.students} students, {len(sample)} queries")
+
+        with sessionmaker(bind=engine)() as db:
+            for label, columns, limit in (("public", ("name", "number"), 10), ("admin", ("name", "classroom"), None)):
+                latencies = {"like": [], "fts": []}
+                for q in sample:
+                    like_time, like_ids = timed(like_search, db, q, columns, limit)
+                    fts_time, fts_ids = timed(search_students, db, q, columns, limit)
+                    if like_ids != fts_ids:
+                        raise SystemExit(f"{label} results differ for {q!r}: {like_ids[:5]} vs {fts_ids[:5]}")
+                    latencies["like"].append(like_time)
+                    latencies["fts"].append(fts_time)
+                    db.expunge_all()
+                summarize(f"{label} LIKE", latencies["like"])
+                summarize(f"{label} FTS5 trigram", latencies["fts"])
+            summarize("public in-memory", in_memory(engine, db, sample))
+        engine.dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
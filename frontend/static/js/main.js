@@ -33,6 +33,125 @@ axios.interceptors.response.use((response) => {
     return Promise.reject(error);
 });
 
+// Live updates over /ws/activities (message protocol: backend/websocket_manager.py).
+// handlers.topics picks what the server sends: 'activities', 'announcements'
+// and/or 'activity:<id>'. Activity-stream messages carry a version; a gap means
+// messages were missed, so the page resyncs over HTTP instead of patching.
+function connectLiveUpdates(handlers) {
+    const topics = (handlers.topics || ['activities', 'announcements']).join(',');
+    let lastVersion = null;
+    let connectedBefore = false;
+    const resync = () => {
+        if (handlers.onResync) handlers.onResync();
+    };
+
+    const connect = () => {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const ws = new WebSocket(`${protocol}//${window.location.host}/ws/activities?topics=${encodeURIComponent(topics)}`);
+
+        ws.onmessage = (event) => {
+            let msg;
+            try {
+                msg = JSON.parse(event.data);
+            } catch (e) {
+                return;
+            }
+
+            if (msg.type === 'announcements') {
+                if (handlers.onAnnouncements) handlers.onAnnouncements(msg);
+                return;
+            }
+            if (msg.type === 'registrations') {
+                if (handlers.onRegistrations) handlers.onRegistrations(msg);
+                return;
+            }
+            if (msg.type === 'hello') {
+                // Reconnected: anything sent while we were away is lost
+                if (connectedBefore) resync();
+                connectedBefore = true;
+                lastVersion = msg.version;
+                return;
+            }
+            if (typeof msg.version !== 'number') return;
+
+            const gap = lastVersion !== null && msg.version !== lastVersion + 1;
+            lastVersion = msg.version;
+            if (gap || msg.type !== 'seats' || !handlers.onSeats) {
+                resync();
+                return;
+            }
+            handlers.onSeats(msg.activities);
+        };
+
+        ws.onclose = () => {
+            setTimeout(connect, 3000);
+        };
+    };
+
+    connect();
+}
+
+// Follow a background roster import. Progress arrives on the 'import:<id>'
+// topic; on every (re)connect the status endpoint fills in anything missed.
+// onUpdate gets each new state of the job until it has finished.
+function watchImportJob(jobId, onUpdate) {
+    const token = sessionStorage.getItem('adminToken');
+    let finished = false;
+    let ws = null;
+    const update = (job) => {
+        if (finished) return;
+        finished = ['completed', 'failed', 'cancelled'].includes(job.status);
+        if (finished && ws) ws.close();
+        onUpdate(job);
+    };
+    const poll = async () => {
+        try {
+            const res = await axios.get(`/admin/api/import_jobs/${jobId}`, {
+                headers: { Authorization: 'Bearer ' + token }
+            });
+            update(res.data);
+        } catch (e) {
+            // The socket or the next reconnect will try again
+        }
+    };
+
+    const connect = () => {
+        if (finished) return;
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        ws = new WebSocket(`${protocol}//${window.location.host}/ws/activities?topics=import:${jobId}`);
+        ws.onmessage = (event) => {
+            let msg;
+            try {
+                msg = JSON.parse(event.data);
+            } catch (e) {
+                return;
+            }
+            if (msg.type === 'hello') poll();
+            // Messages leave out errors and samples; the final state comes from the admin API
+            if (msg.type === 'import') {
+                if (['completed', 'failed', 'cancelled'].includes(msg.job.status)) poll();
+                else update(msg.job);
+            }
+        };
+        ws.onclose = () => {
+            if (!finished) setTimeout(connect, 3000);
+        };
+    };
+
+    connect();
+}
+
+// Patch seat counts from a "seats" message into a list of activities in place.
+function applySeatUpdates(activities, seats) {
+    seats.forEach(seat => {
+        const activity = activities.find(a => a.id === seat.id);
+        if (!activity) return;
+        activity.registered_count = seat.registered_count;
+        activity.remaining_seats = seat.remaining_seats;
+        activity.status = seat.status;
+    });
+}
+
 // Register Alpine.js components
 // This will be called when Alpine.js fires the 'alpine:init' event
 function registerAlpineComponents() {
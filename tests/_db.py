@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base, TelemetryBase, create_sqlite_engine, get_db, get_telemetry_db
+from backend import models  # noqa: F401  (registers the tables on both bases)
+
+
+class TemporaryDatabase:
+    """A throwaway SQLite file with the application schema, for in-process tests.
+
+    The telemetry tables live in the same file here; the app keeps them apart.
+    """
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="dsnpru_test_")
+        self.path = os.path.join(self.directory, "test.db")
+        self.engine = create_sqlite_engine(f"sqlite:///{self.path}")
+        Base.metadata.create_all(bind=self.engine)
+        TelemetryBase.metadata.create_all(bind=self.engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    def close(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_db(self):
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def override(self, app):
+        """Point an app's ``get_db`` and ``get_telemetry_db`` dependencies at this database."""
+        app.dependency_overrides[get_db] = self.get_db
+        app.dependency_overrides[get_telemetry_db] = self.get_db
+        return app
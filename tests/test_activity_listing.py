@@ -0,0 +1,98 @@
+import unittest
+
+from sqlalchemy import event
+
+from backend import models
+from backend.routers import public
+from tests._db import TemporaryDatabase
+
+
+class TestPublicActivityListing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.database = TemporaryDatabase()
+        with cls.database.SessionLocal() as db:
+            visible = models.ActivityGroup(name="Visible", quota=3, is_visible=True)
+            hidden = models.ActivityGroup(name="Hidden", quota=3, is_visible=False)
+            db.add_all([visible, hidden])
+            db.flush()
+
+            students = [
+                models.Student(number=f"{70000 + i}", name=f"Student {i}", classroom="ม.5/2")
+                for i in range(250)
+            ]
+            db.add_all(students)
+
+            activities = []
+            for i in range(200):
+                group = (None, visible, hidden)[i % 3]
+                activities.append(
+                    models.Activity(
+                        title=f"Activity {i}",
+                        max_people=10,
+                        status="close" if i % 10 == 9 else "open",
+                        group_id=group.id if group else None,
+                    )
+                )
+            db.add_all(activities)
+            db.flush()
+
+            for i, activity in enumerate(activities):
+                for j in range(i % 15):
+                    db.add(
+                        models.Registration(
+                            student_id=students[(i + j) % len(students)].id,
+                            activity_id=activity.id,
+                            status="registered" if j < 10 else "waitlisted",
+                        )
+                    )
+            db.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.database.close()
+
+    def list_activities_counting_queries(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(self.database.engine, "before_cursor_execute", count)
+        try:
+            with self.database.SessionLocal() as db:
+                result = public.query_public_activities(db)
+        finally:
+            event.remove(self.database.engine, "before_cursor_execute", count)
+        return result, statements
+
+    def test_list_activities_is_a_single_query(self):
+        result, statements = self.list_activities_counting_queries()
+        self.assertEqual(len(statements), 1, statements)
+        self.assertTrue(result)
+
+    def test_list_activities_counts_match_registrations(self):
+        result, _ = self.list_activities_counting_queries()
+
+        with self.database.SessionLocal() as db:
+            expected_ids = set()
+            for activity in db.query(models.Activity).all():
+                if activity.status != "open":
+                    continue
+                if activity.group and not activity.group.is_visible:
+                    continue
+                expected_ids.add(activity.id)
+
+            by_id = {item.id: item for item in result}
+            self.assertEqual(set(by_id), expected_ids)
+            for activity_id in expected_ids:
+                activity = db.get(models.Activity, activity_id)
+                registered = sum(r.status == "registered" for r in activity.registrations)
+                item = by_id[activity_id]
+                self.assertEqual(item.registered_count, registered)
+                self.assertEqual(item.remaining_seats, max(activity.max_people - registered, 0))
+                self.assertEqual(item.group_name, activity.group.name if activity.group else None)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend import models
+from backend.activity_cache import activity_snapshots, data_version
+from backend.routers import public
+from tests._db import TemporaryDatabase
+
+
+class TestActivitySnapshot(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add(models.Student(number="80001", name="Student 1", classroom="ม.4/1"))
+            db.add(models.Activity(title="Robotics", max_people=5, status="open"))
+            db.commit()
+
+        app = FastAPI()
+        app.include_router(public.router, prefix="/api")
+        self.client = TestClient(self.database.override(app))
+        activity_snapshots.clear()
+
+        self.statements = []
+        event.listen(self.database.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(self.database.engine, "before_cursor_execute", self._count)
+        self.client.close()
+        self.database.close()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_repeat_requests_reuse_snapshot_and_honour_etag(self):
+        first = self.client.get("/api/activities")
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["etag"]
+        self.assertEqual(first.json()[0]["title"], "Robotics")
+        queries_after_build = len(self.statements)
+
+        again = self.client.get("/api/activities")
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again.headers["etag"], etag)
+
+        cached = self.client.get("/api/activities", headers={"If-None-Match": etag})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        self.assertEqual(len(self.statements), queries_after_build)
+
+    def test_commit_touching_registrations_bumps_version(self):
+        etag = self.client.get("/api/activities").headers["etag"]
+        version = data_version.value
+
+        with self.database.SessionLocal() as db:
+            db.add(models.Registration(student_id=1, activity_id=1, status="registered"))
+            db.commit()
+        self.assertGreater(data_version.value, version)
+
+        fresh = self.client.get("/api/activities", headers={"If-None-Match": etag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh.headers["etag"], etag)
+        self.assertEqual(fresh.json()[0]["registered_count"], 1)
+
+    def test_unrelated_commit_keeps_snapshot(self):
+        self.client.get("/api/activities")
+        version = data_version.value
+        with self.database.SessionLocal() as db:
+            db.add(models.Announcement(message="hello"))
+            db.commit()
+        self.assertEqual(data_version.value, version)
+
+    def test_concurrent_requests_build_once_per_version(self):
+        data_version.bump()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(lambda _: self.client.get("/api/activities"), range(64)))
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(len({response.headers["etag"] for response in responses}), 1)
+        selects = [s for s in self.statements if s.lstrip().upper().startswith("SELECT")]
+        self.assertEqual(len(selects), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
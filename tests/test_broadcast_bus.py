@@ -0,0 +1,162 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.activity_cache import data_version
+from backend.broadcast_bus import SQLiteBus
+from backend.database import create_sqlite_engine
+from backend.reservations import seat_update
+from backend.websocket_manager import ConnectionManager
+from tests._db import TemporaryDatabase
+
+
+WORKERS = 3
+CLIENTS_PER_WORKER = 4
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+def run_worker(worker_id, bus_path, barrier, results):
+    async def scenario():
+        manager = ConnectionManager(coalesce_window=0, bus=SQLiteBus(bus_path, poll_interval=0.01))
+        await manager.start()
+        sockets = [FakeWebSocket() for _ in range(CLIENTS_PER_WORKER)]
+        for socket in sockets:
+            await manager.connect(socket, {"activities", "announcements"})
+
+        await asyncio.to_thread(barrier.wait)
+        seat = {"id": worker_id, "registered_count": worker_id, "remaining_seats": 0, "status": "open"}
+        await manager.broadcast_seats([seat], as_of=worker_id)
+        if worker_id == 0:
+            await manager.broadcast_announcements()
+            # Stands in for a commit to the activity tables in this worker
+            await asyncio.to_thread(data_version.bump)
+
+        await asyncio.sleep(1)
+        await manager.stop()
+        return [socket.sent for socket in sockets], data_version.value
+
+    results.put((worker_id, *asyncio.run(scenario())))
+
+
+def run_seat_worker(worker_id, bus_path, db_path, barrier, first_read, second_sent, results):
+    """Both workers register a student for activity 1; worker 0's counts are read first but sent last."""
+    async def scenario():
+        engine = create_sqlite_engine(f"sqlite:///{db_path}")
+        SessionLocal = sessionmaker(bind=engine)
+        manager = ConnectionManager(coalesce_window=0, bus=SQLiteBus(bus_path, poll_interval=0.01))
+        await manager.start()
+        socket = FakeWebSocket()
+        await manager.connect(socket, {"activities"})
+        if worker_id == 0:
+            # A worker that has been up longer: its process-local counter is far ahead
+            for _ in range(50):
+                data_version.bump(notify=False)
+
+        await asyncio.to_thread(barrier.wait)
+        if worker_id == 1:
+            await asyncio.to_thread(first_read.wait, 30)
+        with SessionLocal() as db:
+            db.add(models.Registration(student_id=worker_id + 1, activity_id=1, status="registered"))
+            db.commit()
+            seats, as_of = seat_update(db, [1])
+        if worker_id == 0:
+            first_read.set()
+            await asyncio.to_thread(second_sent.wait, 30)
+            await asyncio.sleep(0.3)
+        await manager.broadcast_seats(seats, as_of)
+        if worker_id == 1:
+            second_sent.set()
+
+        await asyncio.sleep(1)
+        await manager.stop()
+        engine.dispose()
+        return [
+            seat["registered_count"]
+            for message in socket.sent if message["type"] == "seats"
+            for seat in message["activities"]
+        ]
+
+    results.put((worker_id, asyncio.run(scenario())))
+
+
+class TestSQLiteBroadcastBus(unittest.TestCase):
+    def test_seat_counts_order_by_commit_across_workers(self):
+        database = TemporaryDatabase()
+        self.addCleanup(database.close)
+        with database.SessionLocal() as db:
+            db.add_all([models.Student(number="1", name="A"), models.Student(number="2", name="B")])
+            db.add(models.Activity(title="Chess", max_people=5, status="open"))
+            db.commit()
+
+        context = multiprocessing.get_context("spawn")
+        bus_path = os.path.join(database.directory, "bus.db")
+        barrier, first_read, second_sent = context.Barrier(2), context.Event(), context.Event()
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=run_seat_worker,
+                args=(worker_id, bus_path, database.path, barrier, first_read, second_sent, results),
+            )
+            for worker_id in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        outcomes = dict(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join(timeout=10)
+
+        # Worker 0's one-registration counts arrive last everywhere and are dropped as stale
+        self.assertEqual(outcomes, {0: [2], 1: [2]})
+
+    def test_every_client_on_every_worker_gets_each_update_once(self):
+        context = multiprocessing.get_context("spawn")
+        with tempfile.TemporaryDirectory() as directory:
+            bus_path = os.path.join(directory, "bus.db")
+            barrier = context.Barrier(WORKERS)
+            results = context.Queue()
+            workers = [
+                context.Process(target=run_worker, args=(worker_id, bus_path, barrier, results))
+                for worker_id in range(WORKERS)
+            ]
+            for worker in workers:
+                worker.start()
+            outcomes = [results.get(timeout=60) for _ in workers]
+            for worker in workers:
+                worker.join(timeout=10)
+
+        self.assertEqual(len(outcomes), WORKERS)
+        for worker_id, clients, version in outcomes:
+            # The data change made in worker 0 reached every worker once
+            self.assertEqual(version, 1, f"worker {worker_id}")
+            for sent in clients:
+                self.assertEqual(sent[0], {"type": "hello", "version": 0})
+                seat_ids = sorted(
+                    seat["id"] for message in sent if message["type"] == "seats" for seat in message["activities"]
+                )
+                self.assertEqual(seat_ids, list(range(WORKERS)))
+                self.assertEqual(sum(message["type"] == "announcements" for message in sent), 1)
+                versions = [message["version"] for message in sent if message["type"] == "seats"]
+                self.assertEqual(versions, list(range(1, WORKERS + 1)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
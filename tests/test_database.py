@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend import metrics
+from backend.database import (
+    SQLITE_PRAGMAS,
+    create_sqlite_engine,
+    immediate_transaction,
+    is_busy_error,
+    retry_on_busy,
+)
+from tests._db import TemporaryDatabase
+
+
+def busy_error():
+    orig = sqlite3.OperationalError("database is locked")
+    orig.sqlite_errorcode = sqlite3.SQLITE_BUSY
+    return OperationalError("BEGIN IMMEDIATE", {}, orig)
+
+
+class TestEnginePragmas(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_every_connection_gets_the_pragmas(self):
+        with self.database.engine.connect() as connection:
+            pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            self.assertEqual(pragma("journal_mode"), "wal")
+            self.assertEqual(pragma("synchronous"), 1)  # NORMAL
+            self.assertEqual(pragma("busy_timeout"), SQLITE_PRAGMAS["busy_timeout"])
+            self.assertEqual(pragma("cache_size"), SQLITE_PRAGMAS["cache_size"])
+            self.assertEqual(pragma("foreign_keys"), 1)
+            self.assertEqual(pragma("temp_store"), 2)  # MEMORY
+
+    def test_overrides_replace_the_defaults(self):
+        engine = create_sqlite_engine(f"sqlite:///{self.database.directory}/other.db", {"busy_timeout": 123})
+        with engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("PRAGMA busy_timeout").scalar(), 123)
+            self.assertEqual(connection.exec_driver_sql("PRAGMA journal_mode").scalar(), "delete")
+        engine.dispose()
+
+
+class TestRetryOnBusy(unittest.TestCase):
+    def test_busy_errors_are_retried_with_backoff(self):
+        calls = []
+        retried = metrics.DB_BUSY_RETRIES.value()
+
+        @retry_on_busy(retries=3, backoff=0.001)
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise busy_error()
+            return "done"
+
+        self.assertEqual(write(), "done")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(metrics.DB_BUSY_RETRIES.value() - retried, 2)
+
+    def test_other_errors_and_exhausted_retries_are_raised(self):
+        calls = []
+
+        @retry_on_busy(retries=2, backoff=0.001)
+        def always_busy():
+            calls.append(1)
+            raise busy_error()
+
+        with self.assertRaises(OperationalError):
+            always_busy()
+        self.assertEqual(len(calls), 3)
+
+        @retry_on_busy(retries=2, backoff=0.001)
+        def broken():
+            calls.append(1)
+            raise OperationalError("SELECT", {}, sqlite3.OperationalError("no such table: x"))
+
+        calls.clear()
+        with self.assertRaises(OperationalError) as raised:
+            broken()
+        self.assertFalse(is_busy_error(raised.exception))
+        self.assertEqual(len(calls), 1)
+
+    def test_write_succeeds_once_a_long_writer_commits(self):
+        database = TemporaryDatabase()
+        self.addCleanup(database.close)
+        # A short busy_timeout so the first attempts give up quickly
+        engine = create_sqlite_engine(f"sqlite:///{database.path}", {**SQLITE_PRAGMAS, "busy_timeout": 20})
+        self.addCleanup(engine.dispose)
+        SessionLocal = sessionmaker(bind=engine)
+
+        holder = sqlite3.connect(database.path, isolation_level=None, check_same_thread=False)
+        holder.execute("BEGIN IMMEDIATE")
+        threading.Timer(0.2, holder.execute, ("COMMIT",)).start()
+        attempts = []
+
+        @retry_on_busy(retries=20, backoff=0.02, max_backoff=0.05)
+        def write():
+            attempts.append(1)
+            with SessionLocal() as db, immediate_transaction(db):
+                db.execute(text("INSERT INTO students (number, name) VALUES ('1', 'A')"))
+
+        write()
+        holder.close()
+        self.assertGreater(len(attempts), 1)
+        with SessionLocal() as db:
+            self.assertEqual(db.execute(text("SELECT count(*) FROM students")).scalar(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend import models
+from backend.auth import get_current_admin
+from backend.import_jobs import ImportWorker
+from backend.roster_import import TEXT_EXTENSIONS, WORKBOOK_EXTENSIONS
+from backend.routers import admin
+from backend.websocket_manager import ConnectionManager
+from tests._db import TemporaryDatabase
+from tests.test_live_updates import FakeWebSocket
+from tests.test_roster_import import delimited, workbook
+
+ROWS = [(str(70000 + n), "นาย", f"นักเรียน{n}", "ทดสอบ", "ม.2/1", n) for n in range(5)] + [
+    (None, "นาย", "ไม่มี", "รหัส", "ม.2/1", 6),
+]
+
+
+class TestImportJobs(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        self.published = []
+        self.worker = ImportWorker(
+            session_factory=self.database.SessionLocal,
+            spool_dir=os.path.join(self.database.directory, "spool"),
+            chunk_size=2,
+            publish=self.published.append,
+        )
+        patcher = mock.patch.object(admin, "import_worker", self.worker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/admin")
+        app.dependency_overrides[get_current_admin] = lambda: models.Admin(id=1, username="admin")
+        self.client = TestClient(self.database.override(app))
+
+    def tearDown(self):
+        self.client.close()
+        self.database.close()
+
+    def _upload(self, filename="roster.xlsx", contents=None, **params):
+        response = self.client.post(
+            "/admin/api/import_students",
+            params=params,
+            files={"file": (filename, contents or workbook(ROWS), "application/octet-stream")},
+        )
+        self.assertEqual(response.status_code, 202, response.text)
+        return response.json()
+
+    def _job(self, job_id):
+        return self.client.get(f"/admin/api/import_jobs/{job_id}").json()
+
+    def _student_count(self):
+        with self.database.SessionLocal() as db:
+            return db.query(models.Student).count()
+
+    def test_upload_is_queued_then_imported_in_the_background(self):
+        job = self._upload()
+        self.assertEqual(job["status"], "queued")
+        self.assertTrue(os.path.exists(self.worker.spool_path(job["id"])))
+        self.assertEqual(self._student_count(), 0)
+
+        self.assertEqual(self.worker.run_next(), job["id"])
+        self.assertIsNone(self.worker.run_next())
+
+        job = self._job(job["id"])
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual((job["rows_processed"], job["inserted"], job["rejected"]), (6, 5, 1))
+        self.assertEqual(job["errors"], ["แถว 7: ไม่มีรหัสนักเรียน"])
+        self.assertIsNotNone(job["finished_at"])
+        self.assertEqual(self._student_count(), 5)
+        self.assertFalse(os.path.exists(self.worker.spool_path(job["id"])))
+        # One message per chunk, then the final state
+        self.assertEqual([(s["status"], s["rows_processed"]) for s in self.published], [
+            ("running", 2), ("running", 4), ("running", 6), ("completed", 6),
+        ])
+        # Rows from the file stay behind the admin endpoint
+        self.assertFalse([s for s in self.published if {"errors", "samples", "error"} & set(s)])
+        with self.database.SessionLocal() as db:
+            self.assertEqual(db.query(models.AdminLog).filter_by(action="IMPORT_STUDENTS").count(), 1)
+        self.assertEqual(self.client.get("/admin/api/import_jobs/missing").status_code, 404)
+
+    def test_csv_uploads_are_imported_by_the_same_worker(self):
+        job = self._upload("ROSTER.CSV", delimited(ROWS, encoding="tis-620"))
+        self.worker.run_next()
+        job = self._job(job["id"])
+        self.assertEqual((job["status"], job["inserted"], job["rejected"]), ("completed", 5, 1))
+        self.assertEqual(self._student_count(), 5)
+
+        response = self.client.post(
+            "/admin/api/import_students", files={"file": ("roster.pdf", b"%PDF", "application/pdf")}
+        )
+        self.assertEqual(response.status_code, 400)
+        # The message lists every extension the endpoint accepts
+        for extension in WORKBOOK_EXTENSIONS + TEXT_EXTENSIONS:
+            self.assertIn(extension, response.json()["detail"])
+        self.assertEqual(self._upload("roster.txt", delimited(ROWS))["status"], "queued")
+
+    def test_cancel_queued_and_running_jobs(self):
+        queued = self._upload()
+        cancelled = self.client.post(f"/admin/api/import_jobs/{queued['id']}/cancel").json()
+        self.assertEqual(cancelled["status"], "cancelled")
+        self.assertIsNone(self.worker.run_next())
+        self.assertFalse(os.path.exists(self.worker.spool_path(queued["id"])))
+
+        running = self._upload()
+
+        def cancel_after_first_chunk(state):
+            self.published.append(state)
+            if len(self.published) == 2:
+                self.client.post(f"/admin/api/import_jobs/{running['id']}/cancel")
+
+        self.worker._publish = cancel_after_first_chunk
+        self.worker.run_next()
+
+        job = self._job(running["id"])
+        self.assertEqual(job["status"], "cancelled")
+        self.assertTrue(job["cancel_requested"])
+        self.assertEqual((job["rows_processed"], job["inserted"]), (2, 2))
+        self.assertEqual(self._student_count(), 2)
+
+    def test_dry_run_is_kept_until_applied(self):
+        job = self._upload(dry_run="true")
+        self.assertTrue(job["dry_run"])
+        self.worker.run_next()
+
+        preview = self._job(job["id"])
+        self.assertEqual((preview["status"], preview["inserted"], preview["rejected"]), ("completed", 5, 1))
+        self.assertEqual([s["number"] for s in preview["samples"]["added"]], [row[0] for row in ROWS[:5]])
+        self.assertEqual(self._student_count(), 0)
+        self.assertTrue(os.path.exists(self.worker.spool_path(job["id"])))
+
+        applied = self.client.post(f"/admin/api/import_jobs/{job['id']}/apply").json()
+        self.assertEqual((applied["status"], applied["dry_run"], applied["inserted"]), ("queued", False, 0))
+        self.worker.run_next()
+
+        job = self._job(job["id"])
+        self.assertEqual((job["status"], job["inserted"]), ("completed", 5))
+        self.assertEqual(self._student_count(), 5)
+        self.assertFalse(os.path.exists(self.worker.spool_path(job["id"])))
+        self.assertEqual(self.client.post(f"/admin/api/import_jobs/{job['id']}/apply").status_code, 409)
+
+        # A preview that is never applied is cancelled to free its file
+        unwanted = self._upload(dry_run="true")
+        self.worker.run_next()
+        self.assertEqual(self.client.post(f"/admin/api/import_jobs/{unwanted['id']}/cancel").json()["status"], "cancelled")
+        self.assertFalse(os.path.exists(self.worker.spool_path(unwanted["id"])))
+
+    def test_interrupted_jobs_resume_where_they_stopped(self):
+        job = self._upload()
+
+        # Shutting down: the job goes back to the queue after its current chunk
+        def stop_after_first_chunk(state):
+            self.published.append(state)
+            self.worker._stopping.set()
+
+        self.worker._publish = stop_after_first_chunk
+        self.worker.run_next()
+        self.assertEqual((self._job(job["id"])["status"], self._job(job["id"])["rows_processed"]), ("queued", 2))
+
+        # Crashed: the job is left running, and is claimed again once its progress is stale
+        self.worker._publish = self.published.append
+        self.worker._stopping.clear()
+        with self.database.SessionLocal() as db:
+            db.query(models.ImportJob).filter_by(id=job["id"]).update({"status": "running", "updated_at": datetime.now()})
+            db.commit()
+        self.assertIsNone(self.worker.run_next())
+        with self.database.SessionLocal() as db:
+            db.query(models.ImportJob).filter_by(id=job["id"]).update({"updated_at": datetime.now() - timedelta(minutes=5)})
+            db.commit()
+        self.assertEqual(self.worker.run_next(), job["id"])
+
+        job = self._job(job["id"])
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual((job["rows_processed"], job["inserted"], job["unchanged"], job["rejected"]), (6, 5, 0, 1))
+        self.assertEqual(self._student_count(), 5)
+
+    def test_polling_without_claimable_jobs_takes_no_write_lock(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(self.database.engine, "before_cursor_execute", record)
+        self.addCleanup(event.remove, self.database.engine, "before_cursor_execute", record)
+        self.assertIsNone(self.worker.run_next())
+        # A job another worker is still importing is not claimable either
+        with self.database.SessionLocal() as db:
+            db.add(models.ImportJob(id="elsewhere", filename="roster.xlsx", status="running", updated_at=datetime.now()))
+            db.commit()
+        del statements[:]
+        self.assertIsNone(self.worker.run_next())
+        self.assertNotIn("BEGIN IMMEDIATE", statements)
+
+        job = self._upload()
+        del statements[:]
+        self.assertEqual(self.worker.run_next(), job["id"])
+        self.assertIn("BEGIN IMMEDIATE", statements)
+
+    def test_progress_reaches_subscribers_of_the_job_topic(self):
+        job_id = "0123456789abcdef0123456789abcdef"
+
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0)
+            watching, other = FakeWebSocket(), FakeWebSocket()
+            await manager.connect(watching, [f"import:{job_id}"])
+            await manager.connect(other, ["activities"])
+            await manager.broadcast_import({"id": job_id, "status": "running", "rows_processed": 1000})
+            await asyncio.sleep(0.01)
+            return watching.sent, other.sent
+
+        watching, other = asyncio.run(scenario())
+        self.assertEqual(watching[1:], [{"type": "import", "job": {"id": job_id, "status": "running", "rows_processed": 1000}}])
+        self.assertEqual(other[1:], [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
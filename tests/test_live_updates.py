@@ -0,0 +1,246 @@
+import asyncio
+import json
+import unittest
+
+from fastapi import BackgroundTasks
+
+from backend import models, schemas
+from backend.reservations import seat_update
+from backend.routers import public
+from backend.websocket_manager import ConnectionManager, parse_topics
+from tests._db import TemporaryDatabase
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0):
+        self.sent = []
+        self.closed = False
+        self.delay = delay
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(message))
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+class TestLiveUpdateProtocol(unittest.TestCase):
+    def test_seat_messages_are_versioned_and_stale_counts_dropped(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0)
+            socket = FakeWebSocket()
+            await manager.connect(socket)
+            await manager.broadcast_seats([{"id": 1, "registered_count": 2, "remaining_seats": 8, "status": "open"}], as_of=5)
+            # Counts computed before the ones already sent must not overwrite them
+            await manager.broadcast_seats([{"id": 1, "registered_count": 1, "remaining_seats": 9, "status": "open"}], as_of=4)
+            await manager.broadcast_activities_changed()
+            await manager.broadcast_announcements()
+            await asyncio.sleep(0.01)
+            return socket.sent
+
+        sent = asyncio.run(scenario())
+        self.assertEqual(sent[0], {"type": "hello", "version": 0})
+        self.assertEqual(sent[1]["type"], "seats")
+        self.assertEqual(sent[1]["version"], 1)
+        self.assertEqual(sent[1]["activities"][0]["registered_count"], 2)
+        self.assertEqual(sent[2], {"type": "activities", "version": 2})
+        self.assertEqual(sent[3], {"type": "announcements"})
+        self.assertEqual(len(sent), 4)
+
+
+class TestBroadcastCoalescing(unittest.TestCase):
+    def test_burst_within_window_becomes_one_message(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0.05)
+            socket = FakeWebSocket()
+            await manager.connect(socket)
+            for i in range(1, 501):
+                activity_id = i % 2 + 1
+                seat = {"id": activity_id, "registered_count": i, "remaining_seats": 0, "status": "open"}
+                await manager.broadcast_seats([seat], as_of=i)
+            await manager.broadcast_announcements()
+            await manager.broadcast_announcements()
+            await asyncio.sleep(0.2)
+            return manager, socket.sent
+
+        manager, sent = asyncio.run(scenario())
+        self.assertEqual([message["type"] for message in sent], ["hello", "seats", "announcements"])
+        latest = {seat["id"]: seat["registered_count"] for seat in sent[1]["activities"]}
+        self.assertEqual(latest, {1: 500, 2: 499})
+        stats = manager.stats()
+        self.assertEqual((stats["published"], stats["coalesced"], stats["emitted"]), (502, 500, 2))
+
+    def test_refetch_signal_supersedes_pending_seat_patches(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0.05)
+            socket = FakeWebSocket()
+            await manager.connect(socket)
+            await manager.broadcast_seats([{"id": 1, "registered_count": 1, "remaining_seats": 0, "status": "open"}], as_of=1)
+            await manager.broadcast_activities_changed()
+            await asyncio.sleep(0.2)
+            return socket.sent
+
+        sent = asyncio.run(scenario())
+        self.assertEqual(sent[1:], [{"type": "activities", "version": 1}])
+
+
+class TestConcurrentFanOut(unittest.TestCase):
+    def test_stalled_client_is_evicted_without_delaying_others(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0, send_timeout=0.1)
+            stalled = FakeWebSocket(delay=60)
+            healthy = [FakeWebSocket() for _ in range(50)]
+            for socket in [stalled, *healthy]:
+                await manager.connect(socket)
+            await asyncio.sleep(0.01)
+            await manager.broadcast_activities_changed()
+            await asyncio.sleep(0.01)
+            delivered_early = all(len(socket.sent) == 2 for socket in healthy)
+            await asyncio.sleep(0.2)
+            return manager, stalled, delivered_early
+
+        manager, stalled, delivered_early = asyncio.run(scenario())
+        self.assertTrue(delivered_early)
+        self.assertTrue(stalled.closed)
+        self.assertNotIn(stalled, manager.active_connections)
+        stats = manager.stats()
+        self.assertEqual(stats["connected"], 50)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_client_that_falls_behind_queue_limit_is_evicted(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0, send_timeout=5, max_queue=4)
+            slow = FakeWebSocket(delay=1)
+            await manager.connect(slow)
+            for _ in range(10):
+                await manager.broadcast_announcements()
+            await asyncio.sleep(0.01)
+            return manager, slow
+
+        manager, slow = asyncio.run(scenario())
+        self.assertTrue(slow.closed)
+        self.assertEqual(manager.stats()["connected"], 0)
+        self.assertEqual(manager.stats()["evictions"], 1)
+
+    def test_disconnect_removes_client_and_stops_writer(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0)
+            socket = FakeWebSocket()
+            await manager.connect(socket)
+            writer = manager.active_connections[socket].writer
+            manager.disconnect(socket)
+            manager.disconnect(socket)
+            await asyncio.sleep(0)
+            return manager, writer
+
+        manager, writer = asyncio.run(scenario())
+        self.assertEqual(manager.active_connections, {})
+        self.assertTrue(writer.cancelled())
+
+
+class TestTopicSubscriptions(unittest.TestCase):
+    def test_clients_only_receive_their_topics(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0)
+            public_page = FakeWebSocket()
+            banner = FakeWebSocket()
+            detail = FakeWebSocket()
+            await manager.connect(public_page, {"activities"})
+            await manager.connect(banner, {"announcements"})
+            await manager.connect(detail, {"activity:2"})
+            await manager.broadcast_seats([{"id": 1, "registered_count": 1, "remaining_seats": 9, "status": "open"}], as_of=1)
+            await manager.broadcast_seats([{"id": 2, "registered_count": 1, "remaining_seats": 9, "status": "open"}], as_of=2)
+            await manager.broadcast_announcements()
+            await asyncio.sleep(0.01)
+            return public_page.sent, banner.sent, detail.sent
+
+        public_sent, banner_sent, detail_sent = asyncio.run(scenario())
+        self.assertEqual([message["type"] for message in public_sent], ["hello", "seats", "seats"])
+        self.assertEqual([message["type"] for message in banner_sent], ["hello", "announcements"])
+        self.assertEqual(detail_sent[1:], [{"type": "registrations", "activity_id": 2}])
+
+    def test_subscribe_and_unsubscribe_messages(self):
+        async def scenario():
+            manager = ConnectionManager(coalesce_window=0)
+            socket = FakeWebSocket()
+            await manager.connect(socket, {"activities"})
+            manager.handle_client_message(socket, json.dumps({"subscribe": ["announcements", "bogus", 3]}))
+            manager.handle_client_message(socket, json.dumps({"unsubscribe": ["activities"]}))
+            manager.handle_client_message(socket, "not json")
+            topics = set(manager.active_connections[socket].topics)
+            await manager.broadcast_activities_changed()
+            await manager.broadcast_announcements()
+            await asyncio.sleep(0.01)
+            manager.disconnect(socket)
+            return manager, topics, socket.sent
+
+        manager, topics, sent = asyncio.run(scenario())
+        self.assertEqual(topics, {"announcements"})
+        self.assertEqual(sent[1:], [{"type": "announcements"}])
+        self.assertEqual(manager._subscribers, {})
+
+    def test_parse_topics(self):
+        self.assertEqual(parse_topics(None), {"activities", "announcements"})
+        self.assertEqual(parse_topics("bogus,activity:x"), {"activities", "announcements"})
+        self.assertEqual(parse_topics(" activity:7 ,announcements"), {"activity:7", "announcements"})
+        self.assertEqual(parse_topics("import:0123456789abcdef0123456789abcdef,import:7"), {"import:0123456789abcdef0123456789abcdef"})
+
+
+class TestRegistrationSeatUpdate(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add(models.Student(number="90001", name="Student 1", classroom="ม.1/1"))
+            db.add(models.Activity(title="Chess", max_people=3, status="open"))
+            db.commit()
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_register_schedules_one_seat_patch(self):
+        background_tasks = BackgroundTasks()
+        with self.database.SessionLocal() as db:
+            payload = schemas.RegistrationCreate(name="", classroom="ม.1/1", number="90001", activity_id=1)
+            response = public.register_student(payload, None, background_tasks, db)
+        self.assertTrue(response.success)
+
+        broadcasts = [task for task in background_tasks.tasks if task.func.__name__ == "broadcast_seats"]
+        self.assertEqual(len(broadcasts), 1)
+        seats, as_of = broadcasts[0].args
+        self.assertEqual(seats, [{"id": 1, "registered_count": 1, "remaining_seats": 2, "status": "open"}])
+        self.assertIsInstance(as_of, int)
+
+    def test_seat_update_reports_unregistered_activity_as_empty(self):
+        with self.database.SessionLocal() as db:
+            seats, _ = seat_update(db, [1])
+        self.assertEqual(seats, [{"id": 1, "registered_count": 0, "remaining_seats": 3, "status": "open"}])
+
+
+    def test_seat_version_advances_with_each_commit_that_changes_seats(self):
+        with self.database.SessionLocal() as db:
+            _, before = seat_update(db, [1])
+            db.add(models.Registration(student_id=1, activity_id=1, status="registered"))
+            db.add(models.Registration(student_id=1, activity_id=1, status="waitlisted"))
+            db.rollback()
+            self.assertEqual(seat_update(db, [1])[1], before)
+
+            db.add(models.Registration(student_id=1, activity_id=1, status="registered"))
+            db.commit()
+            seats, registered = seat_update(db, [1])
+            self.assertEqual((seats[0]["registered_count"], registered), (1, before + 1))
+            db.query(models.Registration).delete()
+            db.commit()
+            seats, released = seat_update(db, [1])
+            self.assertEqual((seats[0]["registered_count"], released), (0, before + 2))
+            # Changes elsewhere leave it alone
+            db.add(models.Student(number="90002", name="Student 2"))
+            db.commit()
+            self.assertEqual(seat_update(db, [1])[1], released)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
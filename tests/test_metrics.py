@@ -0,0 +1,108 @@
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import metrics, models
+from backend.auth import create_access_token
+from backend.reservations import release_seat, reserve_seats
+from backend.routers import metrics as metrics_router
+from tests._db import TemporaryDatabase
+
+
+class TestExposition(unittest.TestCase):
+    def test_counter_gauge_and_histogram_text_format(self):
+        registry = metrics.Registry()
+        requests = registry.register(metrics.Counter("requests_total", "Requests.", ("route",)))
+        connections = registry.register(metrics.Gauge("connections", "Open.", function=lambda: 3))
+        latency = registry.register(metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1)))
+
+        requests.inc(route='/a"b')
+        requests.inc(2, route='/a"b')
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        self.assertEqual(registry.render(), "\n".join([
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{route="/a\\"b"} 3',
+            "# HELP connections Open.",
+            "# TYPE connections gauge",
+            "connections 3",
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 2',
+            'latency_seconds_bucket{le="+Inf"} 3',
+            "latency_seconds_sum 5.55",
+            "latency_seconds_count 3",
+        ]) + "\n")
+
+    def test_wrong_labels_are_rejected(self):
+        counter = metrics.Counter("things_total", "Things.", ("kind",))
+        with self.assertRaises(ValueError):
+            counter.inc(other="x")
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add(models.Admin(username="admin", password_hash="x", is_superuser=True))
+            db.commit()
+        app = FastAPI()
+        app.include_router(metrics_router.router)
+        self.client = TestClient(self.database.override(app))
+
+    def tearDown(self):
+        self.client.close()
+        self.database.close()
+
+    def test_requires_scrape_token_or_admin_jwt(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+
+        with mock.patch.object(metrics_router, "METRICS_TOKEN", "scrape-secret"):
+            self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+            scraped = self.client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        self.assertEqual(scraped.status_code, 200)
+        self.assertTrue(scraped.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("# TYPE http_requests_total counter", scraped.text)
+
+        token = create_access_token({"sub": "admin"})
+        as_admin = self.client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(as_admin.status_code, 200)
+
+
+class TestRegistrationCounters(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add(models.Activity(title="Chess", max_people=1, status="open"))
+            for number in ("60001", "60002"):
+                db.add(models.Student(number=number, name=number, classroom="ม.2/1"))
+            db.commit()
+
+    def tearDown(self):
+        self.database.close()
+
+    def test_registrations_waitlists_and_promotions_are_counted(self):
+        registered = metrics.REGISTRATIONS.value(status="registered")
+        waitlisted = metrics.REGISTRATIONS.value(status="waitlisted")
+        promotions = metrics.WAITLIST_PROMOTIONS.value()
+
+        with self.database.SessionLocal() as db:
+            activity = db.get(models.Activity, 1)
+            first, second = db.query(models.Student).order_by(models.Student.id).all()
+            reserve_seats(db, activity, [first])
+            reserve_seats(db, activity, [second], contact_email="student@example.com")
+            release_seat(db, db.query(models.Registration).filter_by(student_id=first.id).one())
+
+        self.assertEqual(metrics.REGISTRATIONS.value(status="registered") - registered, 1)
+        self.assertEqual(metrics.REGISTRATIONS.value(status="waitlisted") - waitlisted, 1)
+        self.assertEqual(metrics.WAITLIST_PROMOTIONS.value() - promotions, 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,194 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, event, inspect, text
+
+from backend.database import Base, create_sqlite_engine
+from backend.migrations import (
+    MAIN_MIGRATIONS,
+    Backfill,
+    Migration,
+    SchemaMigrator,
+    create_indexes,
+    migration_claims,
+)
+
+# The schema as the last release before versioning left it, minus the
+# columns its migration scripts added
+LEGACY_SCHEMA = """
+CREATE TABLE students (id INTEGER PRIMARY KEY, number VARCHAR NOT NULL UNIQUE, name VARCHAR NOT NULL, classroom VARCHAR);
+CREATE TABLE activities (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR, max_people INTEGER NOT NULL, status VARCHAR, group_id INTEGER);
+CREATE TABLE registrations (id INTEGER PRIMARY KEY, student_id INTEGER NOT NULL, activity_id INTEGER NOT NULL, timestamp DATETIME);
+INSERT INTO students (number, name) VALUES ('65001', 'A');
+INSERT INTO activities (title, max_people, status) VALUES ('Chess', 5, 'open');
+INSERT INTO registrations (student_id, activity_id) VALUES (1, 1);
+"""
+
+# A stand-in for a denormalized column filled by a backfill
+items_metadata = MetaData()
+items = Table(
+    "items", items_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("name_length", Integer),
+)
+
+
+class MigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="dsnpru_test_")
+        self.path = os.path.join(self.directory, "test.db")
+        self.engine = create_sqlite_engine(f"sqlite:///{self.path}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _main_migrator(self):
+        # The telemetry move is skipped: it targets the app's telemetry database
+        migrations = [
+            Migration(m.version, m.description, run=lambda engine: None) if m.run else m for m in MAIN_MIGRATIONS
+        ]
+        return SchemaMigrator("main", self.engine, Base.metadata, migrations)
+
+
+class TestSchemaMigrator(MigrationTestCase):
+    def test_new_database_is_created_at_the_latest_version(self):
+        migrator = self._main_migrator()
+        self.assertEqual(migrator.upgrade(), [])
+        self.assertEqual(migrator.version(), migrator.latest)
+        self.assertTrue(set(Base.metadata.tables) <= set(inspect(self.engine).get_table_names()))
+
+    def test_current_database_skips_introspection(self):
+        migrator = self._main_migrator()
+        migrator.upgrade()
+        statements = []
+        event.listen(self.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+        self.assertEqual(migrator.upgrade(), [])
+        self.assertEqual(len(statements), 2)
+        self.assertFalse([statement for statement in statements if "PRAGMA" in statement or "sqlite_master" in statement])
+
+    def test_unversioned_database_runs_every_migration(self):
+        with sqlite3.connect(self.path) as connection:
+            connection.executescript(LEGACY_SCHEMA)
+        migrator = self._main_migrator()
+
+        self.assertEqual(migrator.upgrade(), [1, 2, 3, 4, 5, 6, 7, 8])
+
+        inspector = inspect(self.engine)
+        self.assertTrue({"sequence"} <= {c["name"] for c in inspector.get_columns("students")})
+        self.assertTrue({"type", "max_team_size", "color"} <= {c["name"] for c in inspector.get_columns("activities")})
+        self.assertTrue({"status", "team_name", "contact_email"} <= {c["name"] for c in inspector.get_columns("registrations")})
+        self.assertIn("ix_registrations_activity_status_timestamp", {i["name"] for i in inspector.get_indexes("registrations")})
+        self.assertIn("announcements", inspector.get_table_names())
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT status FROM registrations")).scalar(), "registered")
+            # Existing students are in the search index
+            self.assertEqual(connection.execute(text("SELECT rowid FROM students_fts WHERE students_fts MATCH '6500'")).scalar(), 1)
+            # Indexes on expressions, which reflection does not list
+            indexes = connection.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'students'")).scalars().all()
+            self.assertTrue({"ix_students_classroom_sequence", "ix_students_sequence"} <= set(indexes))
+        self.assertEqual(migrator.upgrade(), [])
+
+    def test_index_migrations_create_only_their_own_indexes(self):
+        with sqlite3.connect(self.path) as connection:
+            connection.executescript(LEGACY_SCHEMA)
+        migrations = self._main_migrator().migrations
+        SchemaMigrator("main", self.engine, Base.metadata, migrations[:2]).upgrade()
+
+        def indexes():
+            with self.engine.connect() as connection:
+                return set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+
+        self.assertIn("ix_registrations_activity_status_timestamp", indexes())
+        self.assertFalse({"ix_students_classroom_sequence", "ix_students_sequence"} & indexes())
+        SchemaMigrator("main", self.engine, Base.metadata, migrations[:7]).upgrade()
+        self.assertTrue({"ix_students_classroom_sequence", "ix_students_sequence"} <= indexes())
+
+        with self.assertRaises(ValueError):
+            create_indexes(Base.metadata, "ix_no_such_index")
+
+    def test_interrupted_backfill_resumes_after_the_last_batch(self):
+        with self.engine.begin() as connection:
+            items_metadata.create_all(bind=connection)
+            connection.execute(items.insert(), [{"name": "x" * n} for n in range(1, 8)])
+        seen, failed = [], []
+
+        def fill_lengths(db, rows):
+            seen.extend(row.id for row in rows)
+            if len(seen) > 3 and not failed:
+                failed.append(True)
+                raise RuntimeError("interrupted")
+            for row in rows:
+                db.execute(items.update().where(items.c.id == row.id).values(name_length=len(row.name)))
+
+        migrations = [
+            Migration(1, "index", upgrade=create_indexes(items_metadata)),
+            Migration(2, "name lengths", backfill=Backfill(items, ["name"], fill_lengths)),
+        ]
+        # items already exists, so the migrator starts it at version 0
+        migrator = SchemaMigrator("items", self.engine, items_metadata, migrations, batch_size=3, pause=0)
+
+        with self.assertRaises(RuntimeError):
+            migrator.upgrade()
+        self.assertEqual(migrator.version(), 1)
+        self.assertEqual(migrator.upgrade(), [2])
+
+        # The failed batch (4-6) is retried; the committed one (1-3) is not
+        self.assertEqual(seen, [1, 2, 3, 4, 5, 6, 4, 5, 6, 7])
+        with self.engine.connect() as connection:
+            lengths = connection.execute(items.select().order_by(items.c.id)).all()
+        self.assertEqual([row.name_length for row in lengths], list(range(1, 8)))
+
+
+    def test_run_migrations_go_to_one_worker_at_a_time(self):
+        runs = []
+        started = threading.Event()
+
+        def move(engine):
+            runs.append(threading.current_thread().name)
+            started.set()
+            time.sleep(0.3)
+
+        migrations = [Migration(1, "move", run=move)]
+        with self.engine.begin() as connection:
+            items_metadata.create_all(bind=connection)
+        first = SchemaMigrator("items", self.engine, items_metadata, migrations, claim_timeout=0.3)
+        second = SchemaMigrator("items", self.engine, items_metadata, migrations, claim_timeout=0.3)
+        worker = threading.Thread(target=first.upgrade, name="first")
+        worker.start()
+        started.wait(5)
+        # Waits for the first worker, refreshing its claim past claim_timeout, to record it
+        second.upgrade()
+        worker.join()
+
+        self.assertEqual(runs, ["first"])
+        self.assertEqual(second.version(), 1)
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.execute(migration_claims.select()).all(), [])
+
+    def test_claim_of_a_stopped_worker_is_taken_over(self):
+        runs = []
+        with self.engine.begin() as connection:
+            items_metadata.create_all(bind=connection)
+            migration_claims.create(connection)
+            connection.execute(migration_claims.insert().values(
+                name="items", version=1, owner="gone", claimed_at=datetime.now() - timedelta(minutes=5),
+            ))
+        migrator = SchemaMigrator("items", self.engine, items_metadata, [Migration(1, "move", run=runs.append)])
+
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(migrator.upgrade(), [1])
+        self.assertEqual(runs, [self.engine])
+        self.assertEqual(migrator.version(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
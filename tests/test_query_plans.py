@@ -0,0 +1,159 @@
+import re
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend import models
+from backend.auth import get_current_admin, get_current_superuser
+from backend.database import Base
+from backend.routers import admin, public
+from tests._db import TemporaryDatabase
+
+# "SCAN <table>" with no index is a full table scan; "SCAN <table> USING
+# [COVERING] INDEX" walks an index and "SEARCH" seeks into one.
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def allowed_scans():
+    """(table, text in the statement) pairs that may scan a table even though
+    they filter it: student search scans students with LIKE on SQLite builds
+    without the trigram tokenizer (models.STUDENT_SEARCH_FTS)."""
+    return set() if models.STUDENT_SEARCH_FTS else {("students", " LIKE ")}
+
+
+def full_scans(connection, statement, parameters):
+    """Tables a statement reads in full, per ``EXPLAIN QUERY PLAN``."""
+    plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    tables = set(Base.metadata.tables)
+    scanned = []
+    for row in plan:
+        match = FULL_SCAN.match(row.detail)
+        if match:
+            # Aliased tables show up as e.g. "registrations_1"
+            name = re.sub(r"_\d+$", "", match.group(1))
+            if name in tables:
+                scanned.append(name)
+    return scanned
+
+
+class TestHotQueriesUseIndexes(unittest.TestCase):
+    """Runs the public and admin endpoints, then checks the plan of every
+    filtered statement they issued for a full table scan."""
+
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            group = models.ActivityGroup(name="Sports", quota=2, is_visible=True)
+            db.add(group)
+            db.flush()
+            grouped = models.Activity(title="Football", max_people=1, status="open", group_id=group.id)
+            ungrouped = models.Activity(title="Chess", max_people=5, status="open")
+            db.add_all([grouped, ungrouped])
+            for n in range(1, 6):
+                db.add(models.Student(number=f"6500{n}", name=f"Student {n}", classroom="ม.4/1"))
+            db.add(models.Announcement(message="Hello", is_active=True))
+            db.commit()
+
+        # The SQLite path; tests/test_student_index.py covers the in-memory one
+        patcher = mock.patch.object(public, "STUDENT_SEARCH_INDEX", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app = FastAPI()
+        app.include_router(public.router, prefix="/api")
+        app.include_router(admin.router, prefix="/admin")
+        superuser = models.Admin(id=1, username="admin", is_superuser=True)
+        app.dependency_overrides[get_current_admin] = lambda: superuser
+        app.dependency_overrides[get_current_superuser] = lambda: superuser
+        self.client = TestClient(self.database.override(app))
+        for endpoint in (admin.dashboard_stats, admin.analytics_data):
+            endpoint.single_flight.clear()
+
+        self.statements = []
+        event.listen(self.database.engine, "before_cursor_execute", self._record)
+
+    def tearDown(self):
+        event.remove(self.database.engine, "before_cursor_execute", self._record)
+        self.client.close()
+        self.database.close()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            self.statements.append((statement, parameters))
+
+    def _call(self, method, url, **kwargs):
+        response = self.client.request(method, url, **kwargs)
+        self.assertLess(response.status_code, 400, f"{method} {url}: {response.text}")
+        body = response.json() if response.content else {}
+        self.assertNotEqual(body.get("success") if isinstance(body, dict) else None, False, f"{method} {url}: {body}")
+
+    def _exercise_endpoints(self):
+        call = self._call
+
+        def register(number, activity_id, **extra):
+            payload = {"number": number, "name": "", "classroom": "", "activity_id": activity_id, **extra}
+            call("POST", "/api/register", json=payload)
+
+        call("GET", "/api/activities")
+        call("GET", "/api/announcements/active")
+        call("GET", "/api/search_students", params={"q": "Student"})
+        call("GET", "/api/system_info")
+        register("65001", 1)
+        register("65002", 1, email="waitlist@example.com")
+        register("65001", 2)
+        register("65003", 2)
+        call("GET", "/api/my_registrations", params={"number": "65001"})
+        # Frees the seat in the grouped activity, promoting 65002
+        call("POST", "/api/cancel_registration", json={"number": "65001", "activity_id": 1})
+        call("POST", "/api/cancel_registration", json={"number": "65001", "activity_id": 2})
+
+        call("GET", "/admin/api/dashboard")
+        call("GET", "/admin/api/analytics")
+        call("GET", "/admin/registrations/2")
+        call("GET", "/admin/search_students", params={"q": "ม.4"})
+        call("GET", "/admin/api/students")
+        table = {"length": 2, "order[0][column]": 0, "columns[0][data]": "classroom"}
+        page = self.client.get("/admin/api/students/table", params=table).json()
+        call("GET", "/admin/api/students/table", params={**table, "start": 2, "after": page["next"]})
+        call("GET", "/admin/api/students/table", params={**table, "classroom": "ม.4/1", "search[value]": "Student"})
+        call("GET", "/admin/api/classrooms")
+        call("GET", "/admin/api/activity_groups")
+        call("GET", "/admin/api/activities")
+        call("GET", "/admin/api/logs")
+        call("POST", "/admin/activities/1/toggle")
+        call("DELETE", "/admin/registrations/2")
+        call("DELETE", "/admin/api/students/3")
+        call("DELETE", "/admin/activities/2")
+        call("DELETE", "/admin/api/activity_groups/1")
+
+    def test_filtered_statements_never_scan_a_whole_table(self):
+        self._exercise_endpoints()
+        self._assert_no_full_scans()
+
+    def test_like_search_fallback_is_the_only_scan(self):
+        with mock.patch.object(models, "STUDENT_SEARCH_FTS", False):
+            self._exercise_endpoints()
+            self._assert_no_full_scans()
+        self.assertTrue(any(" LIKE " in statement for statement, _ in self.statements))
+
+    def _assert_no_full_scans(self):
+        self.assertGreater(len(self.statements), 50)
+        allowed_here = allowed_scans()
+        failures = []
+        with self.database.engine.connect() as connection:
+            for statement, parameters in dict.fromkeys(
+                (statement, tuple(parameters or ())) for statement, parameters in self.statements
+            ):
+                # Reading a whole table is fine when nothing filters it
+                if " WHERE " not in statement.upper().replace("\n", " "):
+                    continue
+                for table in full_scans(connection, statement, parameters):
+                    if not any(table == allowed and marker in statement for allowed, marker in allowed_here):
+                        failures.append(f"{table}: {' '.join(statement.split())}")
+        self.assertEqual(failures, [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from sqlalchemy import event
+
+from backend import models
+from backend.request_log import RequestLogWriter
+from tests._db import TemporaryDatabase
+
+
+class TestRequestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        self.inserts = 0
+        event.listen(self.database.engine, "before_cursor_execute", self._count_inserts)
+
+    def tearDown(self):
+        event.remove(self.database.engine, "before_cursor_execute", self._count_inserts)
+        self.database.close()
+
+    def _count_inserts(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO request_logs"):
+            self.inserts += 1
+
+    def _logged_rows(self):
+        with self.database.SessionLocal() as db:
+            return db.query(models.RequestLog).count()
+
+    def test_rows_are_written_in_batches(self):
+        async def scenario():
+            writer = RequestLogWriter(self.database.SessionLocal, capacity=1000, batch_size=100, flush_interval=60)
+            await writer.start()
+            for i in range(250):
+                writer.record("GET", "/api/activities", 200, i)
+            await asyncio.sleep(0.2)
+            written_before_stop = writer.written
+            await writer.stop()
+            return writer, written_before_stop
+
+        writer, written_before_stop = asyncio.run(scenario())
+        # Two full batches go out on the size trigger; the remainder on shutdown
+        self.assertEqual(written_before_stop, 200)
+        self.assertEqual(self._logged_rows(), 250)
+        self.assertEqual(self.inserts, 3)
+        self.assertEqual(writer.stats(), {"buffered": 0, "written": 250, "dropped": 0, "batches": 3})
+
+    def test_partial_batch_is_written_after_flush_interval(self):
+        async def scenario():
+            writer = RequestLogWriter(self.database.SessionLocal, batch_size=100, flush_interval=0.05)
+            await writer.start()
+            writer.record("POST", "/api/register", 201, 12)
+            await asyncio.sleep(0.3)
+            written = writer.written
+            await writer.stop()
+            return written
+
+        self.assertEqual(asyncio.run(scenario()), 1)
+        self.assertEqual(self._logged_rows(), 1)
+
+    def test_full_buffer_drops_and_counts_new_rows(self):
+        writer = RequestLogWriter(self.database.SessionLocal, capacity=10, batch_size=100, flush_interval=60)
+        for i in range(15):
+            writer.record("GET", "/api/activities", 200, i)
+
+        self.assertEqual(writer.stats()["buffered"], 10)
+        self.assertEqual(writer.stats()["dropped"], 5)
+
+        asyncio.run(writer.stop())
+        self.assertEqual(self._logged_rows(), 10)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
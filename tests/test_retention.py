@@ -0,0 +1,134 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+
+from backend import models
+from backend.retention import RetentionJob
+from tests._db import TemporaryDatabase
+
+NOW = datetime(2026, 6, 15, 12, 30)
+
+
+def rollup(granularity, bucket, count, route="/api/activities"):
+    histogram = [0] * 11
+    histogram[0] = count
+    return models.RequestRollup(
+        granularity=granularity, bucket=bucket, method="GET", route=route, count=count,
+        error_count=1, latency_sum_ms=count * 3, latency_max_ms=4, histogram=json.dumps(histogram),
+    )
+
+
+class TestRetentionJob(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        self.job = RetentionJob(self.database.SessionLocal, raw_days=7, hourly_days=90, daily_days=365, batch_size=2, pause=0)
+
+    def tearDown(self):
+        self.database.close()
+
+    def _count(self, model, *criteria):
+        with self.database.SessionLocal() as db:
+            return db.query(model).filter(*criteria).count()
+
+    def test_old_rows_are_deleted_or_downsampled(self):
+        old = NOW - timedelta(days=10)
+        ancient_hour = datetime(2026, 3, 1, 9)
+        with self.database.SessionLocal() as db:
+            for timestamp in [old] * 5 + [NOW] * 2:
+                db.add(models.RequestLog(timestamp=timestamp, method="GET", path="/", status_code=200, response_time_ms=1))
+            db.add(rollup("minute", NOW - timedelta(days=3), 1))
+            db.add(rollup("minute", NOW.replace(second=0), 1))
+            db.add(rollup("hour", ancient_hour, 3))
+            db.add(rollup("hour", ancient_hour + timedelta(hours=1), 4))
+            db.add(rollup("hour", NOW.replace(minute=0), 5))
+            db.add(rollup("day", datetime(2025, 1, 1), 6))
+            for value in (100, 200, 300):
+                db.add(models.SystemMetric(timestamp=old, metric_type="db_size", value=value))
+            db.add(models.SystemMetric(timestamp=old, metric_type="db_health", status="healthy"))
+            db.add(models.SystemMetric(timestamp=NOW, metric_type="db_size", value=400))
+            db.commit()
+
+        self.job.run_once(NOW)
+
+        self.assertEqual(self._count(models.RequestLog), 2)
+        with self.database.SessionLocal() as db:
+            remaining = db.query(models.RequestRollup).order_by(models.RequestRollup.bucket).all()
+            self.assertEqual(
+                [(row.granularity, row.bucket, row.count) for row in remaining],
+                [("day", datetime(2026, 3, 1), 7), ("hour", NOW.replace(minute=0), 5), ("minute", NOW.replace(second=0), 1)],
+            )
+            self.assertEqual(json.loads(remaining[0].histogram)[0], 7)
+
+            self.assertEqual(db.query(models.SystemMetric).count(), 1)
+            health, sizes = db.query(models.SystemMetricRollup).order_by(models.SystemMetricRollup.metric_type).all()
+        self.assertEqual((sizes.granularity, sizes.bucket), ("hour", old.replace(minute=0)))
+        self.assertEqual((sizes.count, sizes.value_sum, sizes.value_min, sizes.value_max), (3, 600, 100, 300))
+        self.assertEqual((health.count, health.value_count, json.loads(health.status_counts)), (1, 0, {"healthy": 1}))
+
+        stats = self.job.stats()
+        self.assertEqual(stats["runs"], 1)
+        self.assertIsNone(stats["last_error"])
+        self.assertEqual(stats["deleted_rows"], {"request_logs": 5, "request_rollups": 2, "system_metric_rollups": 0})
+        self.assertEqual(stats["downsampled_rows"], {"request_rollups": 2, "system_metrics": 4, "system_metric_rollups": 0})
+
+    def test_hourly_metric_rollups_merge_into_existing_day(self):
+        day = datetime(2026, 2, 1)
+        with self.database.SessionLocal() as db:
+            for hour, value in ((1, 10), (2, 30)):
+                db.add(models.SystemMetricRollup(
+                    granularity="hour", bucket=day.replace(hour=hour), metric_type="db_size",
+                    count=2, value_count=2, value_sum=value * 2, value_min=value, value_max=value, status_counts="{}",
+                ))
+            db.add(models.SystemMetricRollup(
+                granularity="day", bucket=day, metric_type="db_size",
+                count=1, value_count=1, value_sum=5, value_min=5, value_max=5, status_counts="{}",
+            ))
+            db.commit()
+
+        self.job.run_once(NOW)
+
+        with self.database.SessionLocal() as db:
+            (merged,) = db.query(models.SystemMetricRollup).all()
+        self.assertEqual((merged.granularity, merged.count, merged.value_sum), ("day", 5, 85))
+        self.assertEqual((merged.value_min, merged.value_max), (5, 30))
+
+    def test_deleted_pages_are_returned_to_the_os(self):
+        with self.database.SessionLocal() as db:
+            db.add_all(
+                models.RequestLog(timestamp=NOW - timedelta(days=30), method="GET", path="/x" * 200, status_code=200, response_time_ms=1)
+                for _ in range(2000)
+            )
+            db.commit()
+        self.job.batch_size = 500
+
+        # This file predates incremental auto-vacuum: converting it needs the maintenance flag
+        with self.assertLogs(level="WARNING"):
+            self.job.run_once(NOW)
+        self.assertEqual(self._count(models.RequestLog), 0)
+        self.assertEqual(self.job.stats()["freed_pages"], 0)
+        with self.database.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("PRAGMA auto_vacuum").scalar(), 0)
+
+        self.job.full_vacuum = True
+        self.job.run_once(NOW)
+        with self.database.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("PRAGMA auto_vacuum").scalar(), 2)
+
+        # From then on deleted pages are freed incrementally
+        self.job.full_vacuum = False
+        with self.database.SessionLocal() as db:
+            db.add_all(
+                models.RequestLog(timestamp=NOW - timedelta(days=30), method="GET", path="/x" * 200, status_code=200, response_time_ms=1)
+                for _ in range(2000)
+            )
+            db.commit()
+        self.job.run_once(NOW)
+        self.assertEqual(self._count(models.RequestLog), 0)
+        self.assertGreater(self.job.stats()["freed_pages"], 0)
+        with self.database.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("PRAGMA auto_vacuum").scalar(), 2)
+            self.assertEqual(connection.exec_driver_sql("PRAGMA freelist_count").scalar(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
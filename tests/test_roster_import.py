@@ -0,0 +1,201 @@
+import csv
+import io
+import unittest
+
+import openpyxl
+from sqlalchemy import event
+from backend import models
+from backend.roster_import import (
+    ImportCancelled,
+    ImportResult,
+    import_roster,
+    read_roster_rows,
+    read_workbook_rows,
+)
+from backend.student_index import student_index
+from backend.student_search import search_students
+from tests._db import TemporaryDatabase
+
+HEADER = ("รหัส", "คำนำหน้า", "ชื่อ", "นามสกุล", "ห้อง", "เลขที่")
+
+
+def workbook(rows) -> bytes:
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    output = io.BytesIO()
+    book.save(output)
+    return output.getvalue()
+
+
+def delimited(rows, delimiter=",", encoding="utf-8-sig") -> bytes:
+    lines = [HEADER] + [tuple("" if value is None else str(value) for value in row) for row in rows]
+    output = io.StringIO()
+    csv.writer(output, delimiter=delimiter).writerows(lines)
+    return output.getvalue().encode(encoding)
+
+
+class TestRosterImport(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add(models.Student(number="65001", name="นายสมชาย ใจดี", classroom="ม.4/1", sequence=1))
+            db.add(models.Student(number="65002", name="นางสาวสมหญิง รักเรียน", classroom="ม.4/1", sequence=2))
+            db.commit()
+
+    def tearDown(self):
+        self.database.close()
+
+    def _students(self):
+        with self.database.SessionLocal() as db:
+            return {
+                s.number: (s.name, s.classroom, s.sequence)
+                for s in db.query(models.Student).order_by(models.Student.id)
+            }
+
+    def test_reports_each_outcome(self):
+        rows = [
+            ("65001", "นาย", "สมชาย", "ใจดี", "ม.4/1", 1),  # unchanged
+            ("65002", "นางสาว", "สมหญิง", "รักเรียน", "ม.5/1", "2"),  # moved up a grade
+            (65003.0, "เด็กชาย", "ก้อง", "มีสุข", "ม.1/2", 3.0),  # number typed as a number
+            (None, "นาย", "ไม่มี", "รหัส", "ม.1/1", 4),
+            ("65004", "นาย", None, "ไม่มีชื่อ", "ม.1/1", 5),
+            (None, None, None, None, None, None),
+            ("65003", "เด็กชาย", "ซ้ำ", "ซ้ำ", "ม.1/2", 6),
+            ("65005", None, "Anna", None, None, "x"),
+        ]
+        with self.database.SessionLocal() as db:
+            result = import_roster(db, read_workbook_rows(io.BytesIO(workbook(rows))))
+
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.rejected), (2, 1, 1, 3))
+        self.assertEqual(result.errors, ["แถว 5: ไม่มีรหัสนักเรียน", "แถว 6: ไม่มีชื่อของรหัส 65004", "แถว 8: รหัส 65003 ซ้ำในไฟล์"])
+        self.assertEqual(self._students(), {
+            "65001": ("นายสมชาย ใจดี", "ม.4/1", 1),
+            "65002": ("นางสาวสมหญิง รักเรียน", "ม.5/1", 2),
+            "65003": ("เด็กชายก้อง มีสุข", "ม.1/2", 3),
+            "65005": ("Anna", "", None),
+        })
+        with self.database.SessionLocal() as db:
+            self.assertEqual([s.number for s in search_students(db, "ก้อง")], ["65003"])
+            self.assertEqual([s.number for s in search_students(db, "ม.5", ("classroom",))], ["65002"])
+
+    def test_writes_are_committed_in_chunks(self):
+        rows = [(str(70000 + n), "นาย", f"นักเรียน{n}", "ทดสอบ", "ม.2/1", n) for n in range(7)]
+        rows.append(("65001", "นาย", "สมชาย", "ใจดีมาก", "ม.4/1", 1))
+        with self.database.SessionLocal() as db:
+            result = import_roster(db, read_workbook_rows(io.BytesIO(workbook(rows))), chunk_size=3)
+
+        self.assertEqual((result.inserted, result.updated, result.chunks), (7, 1, 3))
+        students = self._students()
+        self.assertEqual(len(students), 9)
+        self.assertEqual(students["65001"][0], "นายสมชาย ใจดีมาก")
+
+    def test_dry_run_reports_the_diff_without_writing(self):
+        with self.database.SessionLocal() as db:
+            db.add(models.Student(number="65003", name="เด็กชายก้อง มีสุข", classroom="ม.1/2", sequence=3))
+            db.commit()
+        before = self._students()
+        rows = [
+            ("65001", "นาย", "สมชาย", "ใจดี", "ม.4/1", 1),
+            ("65002", "นางสาว", "สมหญิง", "รักเรียน", "ม.5/1", 2),
+            ("65009", "นาย", "ใหม่", "มาก", "ม.1/1", 9),
+        ]
+        with self.database.SessionLocal() as db:
+            result = import_roster(db, read_workbook_rows(io.BytesIO(workbook(rows))), dry_run=True)
+
+        self.assertEqual(self._students(), before)
+        self.assertEqual((result.inserted, result.updated, result.unchanged, result.missing), (1, 1, 1, 1))
+        self.assertEqual(result.chunks, 0)
+        self.assertEqual(result.samples, {
+            "added": [{"number": "65009", "name": "นายใหม่ มาก", "classroom": "ม.1/1", "sequence": 9}],
+            "changed": [{
+                "number": "65002", "name": "นางสาวสมหญิง รักเรียน", "classroom": "ม.5/1", "sequence": 2,
+                "before": {"name": "นางสาวสมหญิง รักเรียน", "classroom": "ม.4/1", "sequence": 2},
+            }],
+            "missing": [{"number": "65003", "name": "เด็กชายก้อง มีสุข", "classroom": "ม.1/2", "sequence": 3}],
+        })
+
+    def test_only_changed_students_are_written(self):
+        student_index.clear()
+        self.addCleanup(student_index.clear)
+        student_index.rebuild(self.database.engine)
+        builds = student_index.builds
+        written = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO students"):
+                written.extend(parameters if executemany else [parameters])
+
+        event.listen(self.database.engine, "before_cursor_execute", record)
+        self.addCleanup(event.remove, self.database.engine, "before_cursor_execute", record)
+        rows = [
+            ("65001", "นาย", "สมชาย", "ใจดี", "ม.4/1", 1),
+            ("65002", "นางสาว", "สมหญิง", "รักเรียน", "ม.4/1", 7),
+        ]
+        with self.database.SessionLocal() as db:
+            result = import_roster(db, read_workbook_rows(io.BytesIO(workbook(rows))))
+
+        self.assertEqual((result.updated, result.unchanged), (1, 1))
+        self.assertEqual([params[0] for params in written], ["65002"])
+        # Applied to the in-memory search index in place, not by a reload
+        self.assertTrue(student_index.ready)
+        self.assertEqual(student_index.builds, builds)
+        with self.database.SessionLocal() as db:
+            (student,) = student_index.search(db, "สมหญิง")
+        self.assertEqual(student["sequence"], 7)
+
+    def test_checkpoints_commit_progress_and_resume(self):
+        rows = [(str(70000 + n), "นาย", f"นักเรียน{n}", "ทดสอบ", "ม.2/1", n) for n in range(5)]
+        rows.append(("70001", "นาย", "ซ้ำ", "ซ้ำ", "ม.2/1", 9))
+        saved = []
+
+        def stop_after_first_chunk(db, result):
+            if saved:
+                raise ImportCancelled()
+            saved.append((result.rows_read, result.inserted))
+
+        with self.database.SessionLocal() as db:
+            with self.assertRaises(ImportCancelled):
+                import_roster(db, read_workbook_rows(io.BytesIO(workbook(rows))), 2, checkpoint=stop_after_first_chunk)
+        self.assertEqual(saved, [(2, 2)])
+        self.assertEqual(len(self._students()), 4)  # the second chunk was rolled back
+
+        resumed = ImportResult()
+        resumed.rows_read, resumed.inserted = saved[0]
+        with self.database.SessionLocal() as db:
+            result = import_roster(db, read_workbook_rows(io.BytesIO(workbook(rows))), 2, resumed)
+        self.assertEqual((result.rows_read, result.inserted, result.unchanged, result.rejected), (6, 5, 0, 1))
+        self.assertEqual(result.errors, ["แถว 7: รหัส 70001 ซ้ำในไฟล์"])
+        self.assertEqual(len(self._students()), 7)
+
+    def test_text_files_are_read_like_the_workbook(self):
+        rows = [
+            ("065001", "นาย", "สมชาย", "ใจดี, มาก", "ม.4/1", 1),  # leading zero, comma in a quoted field
+            ("65002", "นางสาว", "สมหญิง", "รักเรียน", "ม.5/1", ""),
+            ("", "นาย", "ไม่มี", "รหัส", "ม.1/1", 4),
+        ]
+        # Every cell comes back as text
+        expected = [tuple(str(value) for value in row) for row in rows]
+        for filename, contents in (
+            ("roster.csv", delimited(rows)),  # Excel's "CSV UTF-8" has a BOM
+            ("roster.csv", delimited(rows, encoding="utf-8")),
+            ("roster.csv", delimited(rows, encoding="tis-620")),
+            ("roster.txt", delimited(rows, "\t", "tis-620")),  # a tab-separated header is recognised
+            ("roster.tsv", delimited(rows, "\t")),
+        ):
+            with self.subTest(filename=filename, contents=contents[:8]):
+                file = io.BytesIO(contents)
+                self.assertEqual(list(read_roster_rows(file, filename)), expected)
+                self.assertFalse(file.closed)
+
+        with self.database.SessionLocal() as db:
+            result = import_roster(db, read_roster_rows(io.BytesIO(delimited(rows, encoding="tis-620")), "roster.csv"))
+        self.assertEqual((result.inserted, result.updated, result.rejected), (1, 1, 1))
+        self.assertEqual(self._students()["065001"], ("นายสมชาย ใจดี, มาก", "ม.4/1", 1))
+        self.assertEqual(self._students()["65002"], ("นางสาวสมหญิง รักเรียน", "ม.5/1", None))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
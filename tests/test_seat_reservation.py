@@ -0,0 +1,133 @@
+import re
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import BackgroundTasks
+
+from backend import models, schemas
+from backend.routers import public
+from tests._db import TemporaryDatabase
+
+
+RUSH_SIZE = 2000
+MAX_PEOPLE = 30
+WORKERS = 32
+
+
+class TestSeatReservationRush(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add_all(
+                models.Student(number=f"{60000 + i}", name=f"Student {i}", classroom="ม.6/1", sequence=i)
+                for i in range(RUSH_SIZE)
+            )
+            activity = models.Activity(title="Popular", max_people=MAX_PEOPLE, status="open")
+            team_activity = models.Activity(
+                title="Team Popular", max_people=MAX_PEOPLE, status="open", type="team", max_team_size=4
+            )
+            db.add_all([activity, team_activity])
+            db.commit()
+            self.activity_id = activity.id
+            self.team_activity_id = team_activity.id
+
+    def tearDown(self):
+        self.database.close()
+
+    def register(self, activity_id, number, partner_numbers=None):
+        with self.database.SessionLocal() as db:
+            payload = schemas.RegistrationCreate(
+                name="",
+                classroom="ม.6/1",
+                number=number,
+                activity_id=activity_id,
+                email=f"{number}@example.com",
+                team_name=f"Team {number}" if partner_numbers else None,
+                partner_numbers=partner_numbers or [],
+            )
+            return number, public.register_student(payload, None, BackgroundTasks(), db)
+
+    def registrations(self, activity_id):
+        with self.database.SessionLocal() as db:
+            return [
+                (reg.id, reg.status, reg.timestamp, reg.student.number, reg.team_name)
+                for reg in db.query(models.Registration)
+                .filter(models.Registration.activity_id == activity_id)
+                .order_by(models.Registration.id)
+                .all()
+            ]
+
+    def test_rush_fills_exactly_max_people_and_queues_the_rest_in_order(self):
+        numbers = [f"{60000 + i}" for i in range(RUSH_SIZE)]
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            results = list(pool.map(lambda n: self.register(self.activity_id, n), numbers))
+
+        self.assertTrue(all(response.success for _, response in results))
+
+        rows = self.registrations(self.activity_id)
+        registered = [row for row in rows if row[1] == "registered"]
+        waitlisted = [row for row in rows if row[1] == "waitlisted"]
+        self.assertEqual(len(registered), MAX_PEOPLE)
+        self.assertEqual(len(waitlisted), RUSH_SIZE - MAX_PEOPLE)
+
+        # Seats go to the first commits; the waitlist follows commit order.
+        self.assertLess(max(row[0] for row in registered), min(row[0] for row in waitlisted))
+        self.assertEqual(sorted(waitlisted, key=lambda row: row[2]), waitlisted)
+
+        # Every student was told the queue position they actually hold.
+        queue_order = {row[3]: position for position, row in enumerate(waitlisted, start=1)}
+        for number, response in results:
+            match = re.search(r"คิวที่ (\d+)", response.message)
+            if number in queue_order:
+                self.assertIsNotNone(match, response.message)
+                self.assertEqual(int(match.group(1)), queue_order[number])
+            else:
+                self.assertIsNone(match)
+
+    def test_team_rush_reserves_whole_teams_only(self):
+        team_size = 4
+        teams = [
+            [f"{60000 + i + j}" for j in range(team_size)]
+            for i in range(0, RUSH_SIZE, team_size)
+        ]
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            results = list(
+                pool.map(lambda team: self.register(self.team_activity_id, team[0], team[1:]), teams)
+            )
+
+        self.assertTrue(all(response.success for _, response in results))
+
+        rows = self.registrations(self.team_activity_id)
+        registered = [row for row in rows if row[1] == "registered"]
+        self.assertEqual(len(registered), (MAX_PEOPLE // team_size) * team_size)
+        self.assertEqual(len(rows), RUSH_SIZE)
+
+        status_by_team = {}
+        for _, status, _, _, team_name in rows:
+            status_by_team.setdefault(team_name, set()).add(status)
+        self.assertTrue(all(len(statuses) == 1 for statuses in status_by_team.values()))
+
+    def test_cancel_promotes_oldest_waitlisted_into_freed_seat(self):
+        numbers = [f"{60000 + i}" for i in range(MAX_PEOPLE + 3)]
+        for number in numbers:
+            self.register(self.activity_id, number)
+
+        with self.database.SessionLocal() as db:
+            response = public.cancel_registration(
+                schemas.CancelRequest(number=numbers[0], activity_id=self.activity_id),
+                None,
+                BackgroundTasks(),
+                db,
+            )
+        self.assertTrue(response.success)
+        self.assertEqual(response.remaining_seats, 0)
+
+        statuses = {row[3]: row[1] for row in self.registrations(self.activity_id)}
+        self.assertNotIn(numbers[0], statuses)
+        self.assertEqual(statuses[numbers[MAX_PEOPLE]], "registered")
+        self.assertEqual(statuses[numbers[MAX_PEOPLE + 1]], "waitlisted")
+        self.assertEqual(sum(status == "registered" for status in statuses.values()), MAX_PEOPLE)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
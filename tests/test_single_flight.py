@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend import models
+from backend.auth import get_current_admin
+from backend.routers import admin
+from backend.singleflight import SingleFlight
+from tests._db import TemporaryDatabase
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {"answer": 42}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(flight.do, "key", compute) for _ in range(8)]
+            while flight.shared < 7:
+                time.sleep(0.001)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        # Nothing is kept once the flight lands when there is no TTL
+        self.assertEqual(flight.do("key", lambda: "fresh"), "fresh")
+
+    def test_errors_reach_every_waiter_and_are_not_cached(self):
+        flight = SingleFlight(ttl=60)
+        release = threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(flight.do, "key", fail) for _ in range(4)]
+            while flight.shared < 3:
+                time.sleep(0.001)
+            release.set()
+            for future in futures:
+                with self.assertRaises(RuntimeError):
+                    future.result()
+
+        self.assertEqual(flight.do("key", lambda: "recovered"), "recovered")
+
+
+class TestAdminReadEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add(models.Student(number="70001", name="Student 1", classroom="ม.5/1"))
+            db.add(models.Activity(title="Debate", max_people=5, status="open"))
+            db.commit()
+
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/admin")
+        app.dependency_overrides[get_current_admin] = lambda: models.Admin(id=1, username="admin", is_superuser=True)
+        self.client = TestClient(self.database.override(app))
+        for route in (admin.dashboard_stats, admin.analytics_data, admin.get_platform_metrics):
+            route.single_flight.clear()
+
+        self.statements = 0
+        event.listen(self.database.engine, "before_cursor_execute", self._slow_count)
+
+    def tearDown(self):
+        event.remove(self.database.engine, "before_cursor_execute", self._slow_count)
+        self.client.close()
+        self.database.close()
+
+    def _slow_count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        # Keep the first computation in flight long enough for the others to pile up
+        time.sleep(0.01)
+
+    def test_concurrent_dashboard_requests_run_queries_once(self):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(lambda _: self.client.get("/admin/api/dashboard"), range(16)))
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertTrue(all(response.json() == responses[0].json() for response in responses))
+        flight = admin.dashboard_stats.single_flight
+        self.assertEqual(flight.executed, 1)
+        self.assertEqual(flight.shared + flight.cache_hits, 15)
+
+    def test_data_change_invalidates_cached_dashboard(self):
+        first = self.client.get("/admin/api/dashboard").json()
+        with self.database.SessionLocal() as db:
+            db.add(models.Registration(student_id=1, activity_id=1, status="registered"))
+            db.commit()
+        second = self.client.get("/admin/api/dashboard").json()
+
+        self.assertEqual(first["total_registrations"], 0)
+        self.assertEqual(second["total_registrations"], 1)
+
+    def test_metrics_are_keyed_by_days(self):
+        self.client.get("/admin/api/platform/metrics?days=7")
+        self.client.get("/admin/api/platform/metrics?days=7")
+        self.client.get("/admin/api/platform/metrics?days=30")
+
+        flight = admin.get_platform_metrics.single_flight
+        self.assertEqual((flight.executed, flight.cache_hits), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
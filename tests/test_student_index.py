@@ -0,0 +1,108 @@
+import time
+import unittest
+
+from backend import models
+from backend.student_index import StudentIndex, normalize, roster_version, student_index
+from tests._db import TemporaryDatabase
+
+ROSTER = [
+    ("65001", "นายสมชาย ใจดี", "ม.4/1"),
+    ("65002", "นางสาวสมหญิง รักเรียน", "ม.4/2"),
+    ("65003", "ด.ญ.ฟ้าใส มั่นคง", "ม.1/1"),
+    ("65104", "เด็กชายก้อง  Kong", "ม.1/2"),
+]
+
+
+class TestNormalize(unittest.TestCase):
+    def test_honorifics_case_and_spacing(self):
+        self.assertEqual(normalize("นางสาวสมหญิง รักเรียน"), "สมหญิง รักเรียน")
+        self.assertEqual(normalize("นางสมใจ"), "สมใจ")
+        self.assertEqual(normalize("ด.ช. ก้อง"), "ก้อง")
+        self.assertEqual(normalize("  เด็กหญิงAnna   SMITH "), "anna smith")
+        self.assertEqual(normalize("สมชาย"), "สมชาย")
+
+
+class TestStudentIndex(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add_all(models.Student(number=n, name=name, classroom=room) for n, name, room in ROSTER)
+            db.commit()
+        # The module index is the one the session hooks update
+        self.index = student_index
+        self.index.clear()
+        self.addCleanup(self.index.clear)
+        self.index.rebuild(self.database.engine)
+
+    def tearDown(self):
+        self.database.close()
+
+    def _wait_until_ready(self, index):
+        for _ in range(100):
+            if index.ready:
+                return
+            time.sleep(0.02)
+        self.fail("index was not rebuilt")
+
+    def _numbers(self, q, limit=10):
+        with self.database.SessionLocal() as db:
+            results = self.index.search(db, q, limit)
+        return None if results is None else [student["number"] for student in results]
+
+    def test_names_and_numbers_without_honorifics(self):
+        self.assertEqual(self._numbers("สม"), ["65001", "65002"])
+        self.assertEqual(self._numbers("นายสมชาย"), ["65001"])
+        self.assertEqual(self._numbers("ฟ้าใส"), ["65003"])
+        self.assertEqual(self._numbers("นาย"), [])  # every boy would match
+        self.assertEqual(self._numbers("ก้อง kong"), ["65104"])
+        self.assertEqual(self._numbers("KON"), ["65104"])
+        self.assertEqual(self._numbers("5104"), ["65104"])
+        self.assertEqual(self._numbers("650", limit=2), ["65001", "65002"])
+        self.assertEqual(self._numbers("ม.4"), [])  # classroom is not searched
+        with self.database.SessionLocal() as db:
+            (student,) = self.index.search(db, "ใจดี")
+        self.assertEqual(student, {"id": 1, "number": "65001", "name": "นายสมชาย ใจดี", "classroom": "ม.4/1", "sequence": None})
+
+    def test_commits_update_the_index_in_place(self):
+        builds = self.index.builds
+        with self.database.SessionLocal() as db:
+            db.query(models.Student).filter_by(number="65001").one().name = "นายสมปอง ใจดี"
+            db.delete(db.query(models.Student).filter_by(number="65002").one())
+            db.add(models.Student(number="67005", name="นายสมชาย ใหม่", classroom="ม.1/1"))
+            db.commit()
+        with self.database.SessionLocal() as db:
+            db.add(models.Student(number="67006", name="นายสมชาย ไม่บันทึก"))
+            db.flush()
+            db.rollback()
+
+        self.assertEqual(self._numbers("สมชาย"), ["67005"])
+        self.assertEqual(self._numbers("สมปอง"), ["65001"])
+        self.assertEqual(self._numbers("รักเรียน"), [])
+        self.assertEqual(self.index.builds, builds)
+        self.assertTrue(self.index.ready)
+
+    def test_changes_it_cannot_follow_fall_back_to_the_database(self):
+        with self.database.SessionLocal() as db:
+            db.query(models.Student).filter_by(number="65001").update({"name": "นายสมปอง ใจดี"})
+            db.commit()
+        self.assertFalse(self.index.ready)
+
+        self.index.rebuild(self.database.engine)
+        self.assertEqual(self._numbers("สมปอง"), ["65001"])
+
+        # Relayed from another worker by the broadcast bus
+        roster_version.bump(notify=False)
+        self.assertIsNone(self._numbers("สมปอง"))
+        self._wait_until_ready(self.index)
+        self.assertEqual(self._numbers("สมปอง"), ["65001"])
+
+    def test_search_starts_a_rebuild_when_not_loaded(self):
+        index = StudentIndex()
+        with self.database.SessionLocal() as db:
+            self.assertIsNone(index.search(db, "สมชาย"))
+        self._wait_until_ready(index)
+        self.assertEqual(len(index), len(ROSTER))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
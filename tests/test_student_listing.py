@@ -0,0 +1,132 @@
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend import models
+from backend.auth import get_current_admin
+from backend.routers import admin
+from backend.student_listing import SORTS, count_students, list_students
+from tests._db import TemporaryDatabase
+
+# Columns of the students page, in table order
+COLUMNS = ("id", "number", "name", "classroom", "sequence", "")
+
+
+def sort_key(student, sort):
+    """The order the listing promises, NULLs first, as plain Python."""
+    classroom, sequence = student.classroom or "", student.sequence or 0
+    return {
+        "number": (student.number, student.id),
+        "name": (student.name, student.id),
+        "classroom": (classroom, sequence, student.id),
+        "sequence": (sequence, student.id),
+    }[sort]
+
+
+class TestStudentListing(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            for n in range(40):
+                db.add(models.Student(
+                    number=f"65{n:03d}",
+                    name=f"นักเรียน {chr(ord('ก') + n % 7)}{n}",
+                    # Some without a classroom or number in class, and repeats of both
+                    classroom=None if n % 11 == 0 else f"ม.{n % 3 + 4}/{n % 2 + 1}",
+                    sequence=None if n % 9 == 0 else n % 5,
+                ))
+            db.commit()
+            self.students = db.query(models.Student).all()
+            db.expunge_all()
+
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/admin")
+        app.dependency_overrides[get_current_admin] = lambda: models.Admin(id=1, username="admin")
+        self.client = TestClient(self.database.override(app))
+
+    def tearDown(self):
+        self.client.close()
+        self.database.close()
+
+    def _walk(self, sort, descending=False, classroom=None, q="", limit=6):
+        """Every page from the first, following each page's cursor."""
+        numbers, cursor = [], None
+        with self.database.SessionLocal() as db:
+            while True:
+                page, cursor = list_students(db, sort, descending, classroom, q, cursor, limit=limit)
+                numbers.extend(student.number for student in page)
+                if cursor is None:
+                    return numbers
+
+    def test_cursor_pages_follow_every_order(self):
+        for sort in SORTS:
+            for descending in (False, True):
+                with self.subTest(sort=sort, descending=descending):
+                    expected = sorted(self.students, key=lambda s: sort_key(s, sort), reverse=descending)
+                    self.assertEqual(self._walk(sort, descending), [s.number for s in expected])
+
+    def test_filters_and_counts(self):
+        in_class = sorted((s for s in self.students if s.classroom == "ม.4/1"), key=lambda s: sort_key(s, "classroom"))
+        self.assertEqual(self._walk("classroom", classroom="ม.4/1", limit=2), [s.number for s in in_class])
+        self.assertEqual(self._walk("number", classroom=""), [s.number for s in self.students if s.classroom is None])
+        self.assertEqual(self._walk("number", q="ก1"), ["65014"])  # too short for the index
+        self.assertEqual(self._walk("number", q="นักเรียน ข1"), ["65001", "65015"])
+        self.assertEqual(self._walk("number", q="ม.5/2", limit=100), [s.number for s in self.students if s.classroom == "ม.5/2"])
+
+        with self.database.SessionLocal() as db:
+            self.assertEqual(count_students(db), 40)
+            self.assertEqual(count_students(db, "ม.4/1"), len(in_class))
+            self.assertEqual(count_students(db, None, "นักเรียน ข1"), 2)
+            # Counted again once the roster changes
+            db.add(models.Student(number="66000", name="นักเรียน ข100", classroom="ม.4/1"))
+            db.commit()
+            self.assertEqual(count_students(db), 41)
+            self.assertEqual(count_students(db, None, "นักเรียน ข1"), 3)
+
+    def test_seeking_past_a_cursor_uses_the_index(self):
+        plans = []
+
+        def explain(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("SELECT students.id") and "LIMIT" in statement:
+                plans.append(" | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)))
+
+        event.listen(self.database.engine, "before_cursor_execute", explain)
+        self.addCleanup(event.remove, self.database.engine, "before_cursor_execute", explain)
+        for sort in SORTS:
+            for descending in (False, True):
+                self._walk(sort, descending, limit=30)
+
+        self.assertEqual(len(plans), 16)
+        for plan in plans:
+            self.assertRegex(plan, r"^(SCAN|SEARCH) students USING (COVERING )?INDEX")
+            self.assertNotIn("TEMP B-TREE", plan)
+        self.assertEqual(sum("SEARCH" in plan for plan in plans), 8)  # each second page seeks
+
+    def test_datatables_endpoint(self):
+        params = {"draw": 3, "start": 0, "length": 10, "order[0][column]": 1, "order[0][dir]": "desc", "search[value]": ""}
+        params.update({f"columns[{i}][data]": name for i, name in enumerate(COLUMNS)})
+        first = self.client.get("/admin/api/students/table", params=params).json()
+        self.assertEqual((first["draw"], first["recordsTotal"], first["recordsFiltered"]), (3, 40, 40))
+        self.assertEqual([s["number"] for s in first["data"]], [f"65{n:03d}" for n in range(39, 29, -1)])
+
+        # Moving on from the cursor, or jumping to the same page by offset
+        following = self.client.get("/admin/api/students/table", params={**params, "start": 10, "after": first["next"]}).json()
+        jumped = self.client.get("/admin/api/students/table", params={**params, "start": 10}).json()
+        self.assertEqual(following["data"], jumped["data"])
+        self.assertEqual(following["data"][0]["number"], "65029")
+
+        filtered = self.client.get("/admin/api/students/table", params={**params, "classroom": "ม.6/2", "search[value]": " 017 "}).json()
+        self.assertEqual((filtered["recordsTotal"], filtered["recordsFiltered"]), (40, 1))
+        self.assertEqual([s["number"] for s in filtered["data"]], ["65017"])
+        self.assertIsNone(filtered["next"])
+
+        # A cursor only continues the order it came from
+        params["order[0][column]"] = 2
+        self.assertEqual(self.client.get("/admin/api/students/table", params={**params, "after": first["next"]}).status_code, 400)
+        self.assertEqual(self.client.get("/admin/api/students/table", params={**params, "after": "!!"}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import models
+from backend.auth import get_current_admin
+from backend.routers import admin, public
+from backend.student_search import rebuild_search_index, search_students
+from tests._db import TemporaryDatabase
+
+ROSTER = [
+    ("65001", "นายสมชาย ใจดี", "ม.4/1"),
+    ("65002", "นางสาวสมหญิง รักเรียน", "ม.4/2"),
+    ("65103", "เด็กชายก้อง \"Kong\" มีสุข", "ม.5/1"),
+    ("66004", "Anna 100% Smith", "ม.6/1"),
+]
+
+
+class TestStudentSearch(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        with self.database.SessionLocal() as db:
+            db.add_all(models.Student(number=n, name=name, classroom=room) for n, name, room in ROSTER)
+            db.commit()
+
+    def tearDown(self):
+        self.database.close()
+
+    def _numbers(self, q, columns=("name", "number"), limit=None):
+        with self.database.SessionLocal() as db:
+            return [student.number for student in search_students(db, q, columns, limit)]
+
+    def test_substrings_match_inside_thai_words(self):
+        self.assertEqual(self._numbers("มชา"), ["65001"])  # middle of สมชาย
+        self.assertEqual(self._numbers("สม"), ["65001", "65002"])  # too short for the index
+        self.assertEqual(self._numbers("รักเรียน"), ["65002"])
+        self.assertEqual(self._numbers("ใจดี รัก"), [])
+        self.assertEqual(self._numbers("ม.4", ("name", "classroom")), ["65001", "65002"])
+
+    def test_numbers_case_and_special_characters(self):
+        self.assertEqual(self._numbers("5001"), ["65001"])
+        self.assertEqual(self._numbers("651"), ["65103"])
+        self.assertEqual(self._numbers("kong"), ["65103"])
+        self.assertEqual(self._numbers('"Kong"'), ["65103"])
+        self.assertEqual(self._numbers("0% S"), ["66004"])
+        self.assertEqual(self._numbers("0%"), ["66004"])
+        self.assertEqual(self._numbers("AND"), [])
+        self.assertEqual(self._numbers("650", limit=1), ["65001"])
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        with self.database.SessionLocal() as db:
+            student = db.query(models.Student).filter_by(number="65001").one()
+            student.name = "นายสมปอง ใจดี"
+            db.add(models.Student(number="67005", name="นายสมชาย ใหม่", classroom="ม.1/1"))
+            db.query(models.Student).filter_by(number="65002").delete()
+            db.commit()
+
+        self.assertEqual(self._numbers("สมชาย"), ["67005"])
+        self.assertEqual(self._numbers("สมปอง"), ["65001"])
+        self.assertEqual(self._numbers("รักเรียน"), [])
+
+    def test_like_search_without_the_trigram_tokenizer(self):
+        with mock.patch.object(models, "STUDENT_SEARCH_FTS", False):
+            self.assertEqual(self._numbers("มชา"), ["65001"])
+            self.assertEqual(self._numbers("kong"), ["65103"])
+            self.assertEqual(self._numbers("0% S"), ["66004"])
+            self.assertEqual(self._numbers("ใจดี รัก"), [])
+            self.assertEqual(self._numbers("650", limit=1), ["65001"])
+            # Nothing left for the index to do on such a build
+            with self.database.engine.begin() as connection, self.assertLogs(level="WARNING"):
+                rebuild_search_index(connection)
+
+    def test_endpoints_use_the_index(self):
+        # The SQLite path; tests/test_student_index.py covers the in-memory one
+        patcher = mock.patch.object(public, "STUDENT_SEARCH_INDEX", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app = FastAPI()
+        app.include_router(public.router, prefix="/api")
+        app.include_router(admin.router, prefix="/admin")
+        app.dependency_overrides[get_current_admin] = lambda: models.Admin(id=1, username="admin")
+        with TestClient(self.database.override(app)) as client:
+            public_results = client.get("/api/search_students", params={"q": "มชา"}).json()
+            admin_results = client.get("/admin/search_students", params={"q": "ม.4/"}).json()
+            self.assertEqual(client.get("/api/search_students", params={"q": "ม"}).json(), [])
+        self.assertEqual([s["number"] for s in public_results], ["65001"])
+        self.assertEqual([s["number"] for s in admin_results], ["65001", "65002"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
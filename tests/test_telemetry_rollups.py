@@ -0,0 +1,274 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect
+
+from backend import models, telemetry
+from backend.database import Base, TelemetryBase
+from backend.auth import get_current_admin
+from backend.migrations import TELEMETRY_MIGRATIONS, SchemaMigrator
+from backend.request_log import RequestLogWriter
+from backend.routers import admin
+from tests._db import TemporaryDatabase
+
+
+def request_row(timestamp, route="/api/activities", status_code=200, response_time_ms=20, method="GET"):
+    return {
+        "timestamp": timestamp,
+        "method": method,
+        "path": route,
+        "route": route,
+        "status_code": status_code,
+        "response_time_ms": response_time_ms,
+    }
+
+
+class TestRequestRollups(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+
+    def tearDown(self):
+        self.database.close()
+
+    def _rollups(self, granularity):
+        with self.database.SessionLocal() as db:
+            return (
+                db.query(models.RequestRollup)
+                .filter(models.RequestRollup.granularity == granularity)
+                .order_by(models.RequestRollup.bucket, models.RequestRollup.route)
+                .all()
+            )
+
+    def test_flushes_merge_into_minute_and_hour_buckets(self):
+        minute = datetime.now().replace(second=10, microsecond=0)
+        writer = RequestLogWriter(self.database.SessionLocal)
+        writer._write([
+            request_row(minute, response_time_ms=3),
+            request_row(minute, status_code=500, response_time_ms=700),
+            request_row(minute, route="/api/activities/{activity_id}", response_time_ms=40),
+        ])
+        writer._write([request_row(minute + timedelta(seconds=30), response_time_ms=12)])
+
+        minute_rows = self._rollups("minute")
+        self.assertEqual([(row.route, row.count) for row in minute_rows], [
+            ("/api/activities", 3),
+            ("/api/activities/{activity_id}", 1),
+        ])
+        activities = minute_rows[0]
+        self.assertEqual(activities.bucket, minute.replace(second=0))
+        self.assertEqual((activities.error_count, activities.latency_sum_ms, activities.latency_max_ms), (1, 715, 700))
+        histogram = json.loads(activities.histogram)
+        self.assertEqual(sum(histogram), 3)
+        self.assertEqual(histogram[telemetry.histogram_index(3)], 1)
+        self.assertEqual(histogram[telemetry.histogram_index(700)], 1)
+
+        hour_rows = self._rollups("hour")
+        self.assertEqual(sum(row.count for row in hour_rows), 4)
+        self.assertEqual(hour_rows[0].bucket, minute.replace(minute=0, second=0))
+
+    def _telemetry_migrator(self):
+        return SchemaMigrator(
+            "telemetry", self.database.engine, TelemetryBase.metadata, TELEMETRY_MIGRATIONS, batch_size=2, pause=0
+        )
+
+    def test_backfill_folds_existing_raw_rows_once(self):
+        now = datetime.now()
+        with self.database.SessionLocal() as db:
+            db.add(models.RequestLog(timestamp=now, method="GET", path="/api/activities", status_code=200, response_time_ms=10))
+            db.add_all(
+                models.RequestLog(timestamp=now - timedelta(days=10), method="GET", path="/api/activities", status_code=404, response_time_ms=5)
+                for _ in range(4)
+            )
+            db.commit()
+        # The tables predate versioning, so the backfill runs, two rows a batch
+        migrator = self._telemetry_migrator()
+        self.assertEqual(migrator.upgrade(), [1, 2])
+        self.assertEqual(migrator.upgrade(), [])
+
+        # Old rows only get hour buckets; minute buckets are kept for two days
+        self.assertEqual(sum(row.count for row in self._rollups("minute")), 1)
+        self.assertEqual(sum(row.count for row in self._rollups("hour")), 5)
+
+    def test_backfill_skips_logs_already_in_rollups(self):
+        with self.database.SessionLocal() as db:
+            db.add(models.RequestLog(timestamp=datetime.now(), method="GET", path="/api/activities", status_code=200, response_time_ms=10))
+            telemetry.apply_rollups(db, telemetry.aggregate([request_row(datetime.now())]))
+            db.commit()
+        self.assertEqual(self._telemetry_migrator().upgrade(), [1, 2])
+        self.assertEqual(sum(row.count for row in self._rollups("hour")), 1)
+
+
+class TestRouteTemplate(unittest.TestCase):
+    def test_path_parameters_and_router_prefix(self):
+        router = APIRouter()
+
+        @router.get("/items/{item_id}")
+        def read_item(item_id: int):
+            return {}
+
+        @router.get("/files/{name:path}")
+        def read_file(name: str):
+            return {}
+
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        seen = []
+
+        @app.middleware("http")
+        async def capture(request: Request, call_next):
+            response = await call_next(request)
+            seen.append(telemetry.route_template(request))
+            return response
+
+        with TestClient(app) as client:
+            client.get("/api/items/1")
+            client.get("/api/items/2")
+            client.get("/api/files/a/b/c.txt")
+            client.get("/missing")
+
+        self.assertEqual(seen, [
+            "/api/items/{item_id}", "/api/items/{item_id}", "/api/files/{name:path}", telemetry.UNMATCHED_ROUTE,
+        ])
+
+
+class TestRouteLatencies(unittest.TestCase):
+    def test_percentiles_and_bounded_keys(self):
+        latencies = telemetry.RouteLatencies()
+        for activity_id in range(1000):
+            latencies.observe("GET", "/admin/registrations/{activity_id}", 200, 20)
+        for _ in range(20):
+            latencies.observe("GET", "/admin/registrations/{activity_id}", 200, 900)
+        latencies.observe("GET", "/admin/registrations/{activity_id}", 404, 4)
+
+        routes = latencies.routes()
+        self.assertEqual([(r["status_class"], r["count"]) for r in routes], [("2xx", 1020), ("4xx", 1)])
+        ok = routes[0]
+        # 20 ms sits in the (10, 25] bucket; the slow tail shows up only at p99
+        self.assertTrue(10 < ok["p50"] <= 25)
+        self.assertTrue(10 < ok["p90"] <= 25)
+        self.assertTrue(500 < ok["p99"] <= 900)
+        self.assertEqual(ok["max"], 900.0)
+        self.assertEqual(latencies.overall()["count"], 1021)
+
+    def test_percentile_never_exceeds_max(self):
+        histogram = [0] * (len(telemetry.LATENCY_BOUNDS_MS) + 1)
+        histogram[-1] = 3
+        self.assertTrue(5000 < telemetry.percentile(histogram, 0.99, 6000) <= 6000)
+        self.assertEqual(telemetry.percentile(histogram, 1.0, 6000), 6000)
+        self.assertEqual(telemetry.percentile([0] * len(histogram), 0.5, 0), 0.0)
+
+
+class TestPlatformEndpointsUseRollups(unittest.TestCase):
+    def setUp(self):
+        self.database = TemporaryDatabase()
+        now = datetime.now()
+        writer = RequestLogWriter(self.database.SessionLocal)
+        writer._write([
+            request_row(now - timedelta(minutes=5), response_time_ms=10),
+            request_row(now - timedelta(minutes=5), response_time_ms=30),
+            request_row(now - timedelta(minutes=1), route="/api/register", method="POST", status_code=400, response_time_ms=50),
+            request_row(now - timedelta(days=3), response_time_ms=100),
+        ])
+        with self.database.SessionLocal() as db:
+            db.add(models.SystemMetric(timestamp=now, metric_type="db_size", value=300))
+            db.add(models.SystemMetricRollup(
+                granularity="hour", bucket=telemetry.bucket_start(now - timedelta(days=5), "hour"), metric_type="db_size",
+                count=2, value_count=2, value_sum=200, value_min=90, value_max=110, status_counts="{}",
+            ))
+            db.commit()
+
+        app = FastAPI()
+        app.include_router(admin.router, prefix="/admin")
+        app.dependency_overrides[get_current_admin] = lambda: models.Admin(id=1, username="admin", is_superuser=True)
+        self.client = TestClient(self.database.override(app))
+        admin.get_platform_metrics.single_flight.clear()
+        telemetry.route_latencies.reset()
+        telemetry.route_latencies.observe("GET", "/api/activities", 200, 40)
+
+        self.statements = []
+        event.listen(self.database.engine, "before_cursor_execute", self._record)
+
+    def tearDown(self):
+        event.remove(self.database.engine, "before_cursor_execute", self._record)
+        self.client.close()
+        self.database.close()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def test_status_reports_last_24_hours(self):
+        status = self.client.get("/admin/api/platform/status").json()
+
+        self.assertEqual(status["total_requests_24h"], 3)
+        self.assertEqual(status["avg_response_time_24h"], 30.0)
+        self.assertEqual(status["error_rate_24h"], 33.33)
+        self.assertEqual(status["latency"]["count"], 1)
+        self.assertEqual(status["latency"]["max"], 40.0)
+        self.assertFalse(any("FROM request_logs" in statement for statement in self.statements))
+
+    def test_metrics_trends_and_breakdown(self):
+        metrics = self.client.get("/admin/api/platform/metrics?days=7").json()
+
+        self.assertEqual(sum(point["value"] for point in metrics["request_trend"]), 4)
+        self.assertEqual(len(metrics["request_trend"]), len(metrics["response_time_trend"]))
+        breakdown = {(e["method"], e["path"]): e for e in metrics["endpoint_breakdown"]}
+        self.assertEqual(breakdown[("GET", "/api/activities")]["count"], 3)
+        self.assertEqual(breakdown[("GET", "/api/activities")]["avg_response_time"], 46.67)
+        self.assertEqual(breakdown[("POST", "/api/register")]["error_rate"], 100.0)
+        self.assertEqual(
+            [(r["method"], r["route"], r["status_class"]) for r in metrics["route_latency"]],
+            [("GET", "/api/activities", "2xx")],
+        )
+        # Older sizes come from the rollups retention leaves behind
+        self.assertEqual([point["value"] for point in metrics["db_size_trend"]], [100.0, 300.0])
+        self.assertFalse(any("FROM request_logs" in statement for statement in self.statements))
+
+
+class TestMoveTelemetryTables(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="dsnpru_test_")
+        self.main = create_engine(f"sqlite:///{os.path.join(self.directory, 'main.db')}")
+        self.telemetry = create_engine(f"sqlite:///{os.path.join(self.directory, 'telemetry.db')}")
+
+    def tearDown(self):
+        self.main.dispose()
+        self.telemetry.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_rows_move_to_the_telemetry_database(self):
+        # A pre-split database: telemetry tables next to the application ones
+        Base.metadata.create_all(bind=self.main)
+        models.RequestLog.__table__.create(bind=self.main)
+        models.SystemMetric.__table__.create(bind=self.main)
+        with self.main.begin() as connection:
+            connection.execute(models.RequestLog.__table__.insert(), [
+                {"timestamp": datetime.now(), "method": "GET", "path": f"/api/{n}", "status_code": 200, "response_time_ms": n}
+                for n in range(25)
+            ])
+            connection.execute(models.SystemMetric.__table__.insert(), [{"metric_type": "db_health", "status": "healthy"}])
+
+        moved = telemetry.move_telemetry_tables(self.main, self.telemetry, batch_size=10)
+
+        self.assertEqual(moved, {"request_logs": 25, "system_metrics": 1})
+        remaining = set(inspect(self.main).get_table_names())
+        self.assertNotIn("request_logs", remaining)
+        self.assertIn("students", remaining)
+        with self.telemetry.connect() as connection:
+            paths = connection.execute(models.RequestLog.__table__.select().order_by(models.RequestLog.id)).all()
+        self.assertEqual([row.path for row in paths], [f"/api/{n}" for n in range(25)])
+        self.assertEqual(telemetry.move_telemetry_tables(self.main, self.telemetry), {})
+
+    def test_same_database_is_left_alone(self):
+        models.RequestLog.__table__.create(bind=self.main)
+        self.assertEqual(telemetry.move_telemetry_tables(self.main, self.main), {})
+        self.assertIn("request_logs", inspect(self.main).get_table_names())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)